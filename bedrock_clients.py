@@ -0,0 +1,148 @@
+"""
+Shared AWS client registry
+One thread-safe client per (service, region), configured with a larger
+connection pool, adaptive retries and TCP keep-alive, so that requests reuse
+warm TLS connections instead of building a new client per call
+"""
+
+import os
+import threading
+
+import boto3
+from botocore.config import Config
+
+DEFAULT_REGION = "us-east-1"
+
+# Connection pool and retry tunables
+MAX_POOL_CONNECTIONS = int(os.environ.get("BEDROCK_MAX_POOL_CONNECTIONS", "50"))
+RETRY_MODE = os.environ.get("BEDROCK_RETRY_MODE", "adaptive")
+MAX_ATTEMPTS = int(os.environ.get("BEDROCK_MAX_ATTEMPTS", "5"))
+
+# Serve Bedrock from the offline stand-in in fake_bedrock (BEDROCK_FAKE=1)
+USE_FAKE_BEDROCK = os.environ.get("BEDROCK_FAKE") == "1"
+FAKE_SERVICES = ('bedrock', 'bedrock-runtime')
+
+_clients = {}
+_lock = threading.Lock()
+_session = None
+_fake = None
+_stats = {
+    'clients_created': 0,
+    'client_reuses': 0,
+}
+
+
+def client_config(max_pool_connections=MAX_POOL_CONNECTIONS, retry_mode=RETRY_MODE,
+                  max_attempts=MAX_ATTEMPTS):
+    """
+    Builds the botocore configuration shared by every registry client
+
+    Args:
+        max_pool_connections: Size of the HTTP connection pool
+        retry_mode: botocore retry mode ('adaptive', 'standard' or 'legacy')
+        max_attempts: Total attempts per request, including the first one
+
+    Returns:
+        A botocore Config
+    """
+    return Config(
+        max_pool_connections=max_pool_connections,
+        retries={'mode': retry_mode, 'total_max_attempts': max_attempts},
+        tcp_keepalive=True
+    )
+
+
+def get_client(service, region_name=DEFAULT_REGION):
+    """
+    Returns the shared client for a service and region, creating it once
+
+    Args:
+        service: AWS service name ('bedrock-runtime', 'bedrock', ...)
+        region_name: AWS region
+
+    Returns:
+        A boto3 client (safe to share between threads)
+    """
+    global _session
+    key = (service, region_name)
+    with _lock:
+        client = _clients.get(key)
+        if client is not None:
+            _stats['client_reuses'] += 1
+            return client
+        if USE_FAKE_BEDROCK and service in FAKE_SERVICES:
+            client = _fake_bedrock()
+        else:
+            # boto3's default session is not thread-safe; use a dedicated one
+            if _session is None:
+                _session = boto3.session.Session()
+            client = _session.client(service, region_name=region_name, config=client_config())
+        _clients[key] = client
+        _stats['clients_created'] += 1
+        return client
+
+
+def _fake_bedrock():
+    """Returns the shared offline stand-in (called with _lock held)"""
+    global _fake
+    if _fake is None:
+        from fake_bedrock import FakeBedrock
+        _fake = FakeBedrock.from_env()
+    return _fake
+
+
+def register_client(service, client, region_name=DEFAULT_REGION):
+    """
+    Installs a client for a service and region (e.g. a stub in tests)
+
+    Args:
+        service: AWS service name
+        client: The client to hand out from now on
+        region_name: AWS region
+    """
+    with _lock:
+        _clients[(service, region_name)] = client
+
+
+def clear_clients():
+    """Drops every cached client"""
+    with _lock:
+        _clients.clear()
+
+
+def _pool_counters(client):
+    """Returns (connections opened, requests sent) from a client's urllib3 pools"""
+    connections = requests = 0
+    try:
+        manager = client._endpoint.http_session._manager
+        for key in list(manager.pools.keys()):
+            pool = manager.pools.get(key)
+            if pool is not None:
+                connections += pool.num_connections
+                requests += pool.num_requests
+    except AttributeError:
+        # Not a botocore client (or botocore internals changed)
+        pass
+    return connections, requests
+
+
+def client_stats():
+    """
+    Returns client-creation and connection-reuse counters
+
+    Returns:
+        Dict with clients created, registry reuses, HTTP connections opened,
+        requests sent and requests served on an already open connection
+    """
+    with _lock:
+        stats = dict(_stats)
+        clients = list(_clients.values())
+    connections = requests = 0
+    for client in clients:
+        opened, sent = _pool_counters(client)
+        connections += opened
+        requests += sent
+    stats['connections_opened'] = connections
+    stats['requests_sent'] = requests
+    stats['connection_reuses'] = max(requests - connections, 0)
+    return stats
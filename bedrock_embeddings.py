@@ -0,0 +1,63 @@
+"""
+Chroma embedding function backed by Amazon Bedrock
+"""
+
+from deadlines import EMBEDDING_DEADLINE_SECONDS
+from embedding_engine import DEFAULT_CHUNK_SIZE, DEFAULT_MAX_WORKERS, EmbeddingEngine
+from instrumentation import get_instrumentation
+from vector_store import VECTOR_BACKEND
+
+if VECTOR_BACKEND == "numpy":
+    # The NumPy index only calls the function; skip the slow chromadb import
+    EmbeddingFunction = object
+    Documents = Embeddings = list
+else:
+    from chromadb import Documents, EmbeddingFunction, Embeddings
+
+
+class BedrockEmbeddingFunction(EmbeddingFunction):
+    """
+    Custom embedding function for Amazon Bedrock
+    Compatible with ChromaDB
+    """
+
+    def __init__(self, client, model_id, max_workers=DEFAULT_MAX_WORKERS,
+                 chunk_size=DEFAULT_CHUNK_SIZE, cache=None,
+                 deadline_seconds=EMBEDDING_DEADLINE_SECONDS):
+        """
+        Args:
+            client: A bedrock-runtime client
+            model_id: Embedding model to invoke
+            max_workers: Maximum number of concurrent embedding requests
+            chunk_size: Number of texts submitted to the worker pool at a time
+            cache: Optional EmbeddingCache consulted before calling Bedrock
+            deadline_seconds: Time allowed per call (0 or None waits for every request)
+        """
+        self.model_id = model_id
+        self.engine = EmbeddingEngine(
+            client,
+            model_id,
+            max_workers=max_workers,
+            chunk_size=chunk_size,
+            deadline_seconds=deadline_seconds or None
+        )
+        self.cache = cache
+
+    def __call__(self, input: Documents) -> Embeddings:
+        """
+        Gets embeddings for a list of texts
+
+        Args:
+            input: List of texts to convert to embeddings
+
+        Returns:
+            List of embeddings (each one is a list of floats)
+        """
+        try:
+            with get_instrumentation().span('embedding', model=self.model_id, texts=len(input)):
+                if self.cache is not None:
+                    return self.cache.get_or_embed(self.model_id, input, self.engine.embed)
+                return self.engine.embed(input)
+        except Exception as e:
+            print(f"[ERROR] Error getting embedding: {e}")
+            raise
@@ -0,0 +1,248 @@
+"""
+Token streaming for Amazon Bedrock
+Wraps `invoke_model_with_response_stream` and yields text chunks for every
+provider family used in this project, recording time-to-first-token.
+Streams are opened through the model's rate limiter like every other
+Bedrock call (see rate_limiter) and keep to the request deadline: opening
+a stream is raced against the fallback model until the first token
+arrives (see deadlines.py), and a stream still running at the deadline is
+closed.
+"""
+
+import json
+import threading
+import time
+from itertools import chain
+
+from deadlines import FIRST_TOKEN_DEADLINE_SECONDS, DeadlineExceeded, deadline_after, get_invoker
+from provider_codecs import get_codec
+from rate_limiter import estimate_tokens, get_limiter
+
+
+def extract_stream_text(model_id, chunk):
+    """
+    Extracts the text carried by one decoded stream chunk
+
+    Args:
+        model_id: The Bedrock model id
+        chunk: The decoded JSON payload of a stream event
+
+    Returns:
+        The text in the chunk ('' if it carries none)
+    """
+    codec = get_codec(model_id)
+    return codec.parse_stream_chunk(chunk) if codec is not None else ''
+
+
+def _close(response):
+    close = getattr(response['body'], 'close', None)
+    if close is not None:
+        close()
+
+
+def open_stream(client, model_id, body, deadline=None):
+    """
+    Opens a response stream through the model's rate limiter
+
+    The limiter slot is held until the first event arrives: a throttled
+    stream fails either when it is opened or with its first event, and both
+    are retried by the limiter and cut its concurrency limit.
+
+    Args:
+        client: A bedrock-runtime client
+        model_id: The Bedrock model id
+        body: The JSON request body
+        deadline: Monotonic deadline for queueing behind the rate limiter
+
+    Returns:
+        Tuple (response, iterator over the remaining events, first event or None)
+    """
+    def send():
+        response = client.invoke_model_with_response_stream(
+            modelId=model_id,
+            body=body,
+            contentType='application/json',
+            accept='application/json'
+        )
+        events = iter(response['body'])
+        try:
+            return response, events, next(events, None)
+        except Exception:
+            _close(response)
+            raise
+
+    return get_limiter(model_id).call(send, tokens=estimate_tokens(body), deadline=deadline)
+
+
+def read_stream(model_id, response, events, first, usage=None, reserved=None, deadline=None):
+    """
+    Yields the text chunks of a stream opened with open_stream
+
+    Args:
+        model_id: The model that produced the stream
+        response: The stream response
+        events: Iterator over the remaining events
+        first: The first event (None for an empty stream)
+        usage: Optional dict receiving 'input_tokens' and 'output_tokens'
+            from the invocation metrics of the last chunk
+        reserved: Tokens reserved with the limiter, corrected once the
+            real usage is known
+        deadline: Monotonic deadline checked as every event arrives
+
+    Yields:
+        Text chunks as they arrive
+
+    Raises:
+        DeadlineExceeded: If the stream is still running at the deadline
+    """
+    codec = get_codec(model_id)
+    metrics = {}
+    try:
+        for event in chain([first] if first is not None else [], events):
+            if deadline is not None and time.monotonic() >= deadline:
+                raise DeadlineExceeded(f"{model_id} was still streaming at the deadline")
+            yield from _event_text(codec, event, metrics)
+    finally:
+        _close(response)
+    if usage is not None:
+        usage.update(metrics)
+    if reserved is not None and metrics.get('input_tokens') is not None:
+        get_limiter(model_id).record_usage(reserved, metrics['input_tokens'] + (metrics['output_tokens'] or 0))
+
+
+def _event_text(codec, event, metrics):
+    chunk = event.get('chunk')
+    if not chunk:
+        return
+    decoded = json.loads(chunk['bytes'])
+    if 'amazon-bedrock-invocationMetrics' in decoded:
+        invocation = decoded['amazon-bedrock-invocationMetrics']
+        metrics['input_tokens'] = invocation.get('inputTokenCount')
+        metrics['output_tokens'] = invocation.get('outputTokenCount')
+    text = codec.parse_stream_chunk(decoded)
+    if text:
+        yield text
+
+
+class _StreamRace:
+    """
+    Streams opened for one request by the invoker (primary, hedge, fallback)
+
+    The invoker drops the results of the calls that lose; the race closes
+    their streams instead, including streams that open after the winner.
+    """
+
+    def __init__(self, client, deadline):
+        self.client = client
+        self.deadline = deadline
+        self._opened = []
+        self._finished = False
+        self._lock = threading.Lock()
+
+    def opener(self, model_id, body):
+        """Returns a zero-argument callable opening one stream of the race"""
+        def open_():
+            opened = (model_id, body) + open_stream(self.client, model_id, body, self.deadline)
+            with self._lock:
+                if not self._finished:
+                    self._opened.append(opened)
+                    return opened
+            _close(opened[2])
+            return opened
+
+        return open_
+
+    def finish(self, winner=None):
+        """Closes every stream but the winner's"""
+        with self._lock:
+            self._finished = True
+            losers = [opened for opened in self._opened if opened is not winner]
+        for opened in losers:
+            _close(opened[2])
+
+
+def stream_text(client, model_id, body, usage=None, deadline=None, fallback=None, outcome=None):
+    """
+    Invokes a model with response streaming and yields text chunks
+
+    The stream must start within BEDROCK_FIRST_TOKEN_DEADLINE_SECONDS (and
+    before `deadline`); the fallback model is raced against the primary as
+    that deadline nears, and the first stream to deliver an event is read.
+
+    Args:
+        client: A bedrock-runtime client
+        model_id: The Bedrock model id
+        body: The JSON request body
+        usage: Optional dict receiving 'input_tokens' and 'output_tokens'
+            from the invocation metrics of the last chunk
+        deadline: Monotonic deadline of the whole response (None for no limit)
+        fallback: Optional (model_id, body) of a faster model (see
+            deadlines.fallback_body)
+        outcome: Optional dict receiving the 'role' of the stream that was
+            read (see HedgedInvoker.call)
+
+    Yields:
+        Text chunks as they arrive
+
+    Raises:
+        DeadlineExceeded: If the stream did not start or finish in time
+    """
+    if get_codec(model_id) is None:
+        return
+    if deadline is not None and time.monotonic() >= deadline:
+        raise DeadlineExceeded(f"The deadline passed before {model_id} was invoked")
+    first_token_deadline = deadline_after(FIRST_TOKEN_DEADLINE_SECONDS)
+    if first_token_deadline is None or (deadline is not None and deadline < first_token_deadline):
+        first_token_deadline = deadline
+
+    race = _StreamRace(client, first_token_deadline)
+    winner = None
+    try:
+        winner = get_invoker().call(
+            f"{model_id}/stream",
+            race.opener(model_id, body),
+            deadline=first_token_deadline,
+            fallback=(f"{fallback[0]}/stream", race.opener(*fallback)) if fallback is not None else None,
+            outcome=outcome
+        )
+    finally:
+        race.finish(winner)
+    stream_model, stream_body, response, events, first = winner
+    yield from read_stream(stream_model, response, events, first, usage, estimate_tokens(stream_body), deadline)
+
+
+class StreamTimer:
+    """
+    Wraps a chunk iterator and records its latency profile
+
+    After iteration `time_to_first_token` holds the seconds until the first
+    chunk arrived and `total_time` the seconds until the stream ended.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.time_to_first_token = None
+        self.total_time = None
+        self.chunk_count = 0
+        self.text = ''
+
+    def __iter__(self):
+        started = time.perf_counter()
+        parts = []
+        try:
+            for chunk in self.chunks:
+                if self.time_to_first_token is None:
+                    self.time_to_first_token = time.perf_counter() - started
+                self.chunk_count += 1
+                parts.append(chunk)
+                yield chunk
+        finally:
+            self.total_time = time.perf_counter() - started
+            self.text = ''.join(parts)
+
+    def summary(self):
+        """Returns a one-line latency summary"""
+        if self.time_to_first_token is None:
+            return f"no tokens received ({self.total_time or 0:.2f}s)"
+        return (f"time to first token {self.time_to_first_token:.2f}s, "
+                f"total {self.total_time:.2f}s")
@@ -0,0 +1,513 @@
+"""
+End-to-end benchmark for the RAG pipeline
+Drives ingest (add_documents) and query (rag_generate, generate_without_rag,
+chat_with_bedrock) workloads against the offline Bedrock stand-in and
+reports per-stage p50/p95/p99 latency, throughput and peak RSS. The search
+workload times the vector query alone for each retrieval backend and shard
+count, with the search latency of every shard.
+
+Usage:
+    python benchmark.py --corpus-sizes 100,1000 --concurrency 1,8 --output bench.json
+    python benchmark.py --backends chroma,numpy
+    python benchmark.py --backends numpy --quantization int8
+    python benchmark.py --backends numpy --shards 1,2,4 --corpus-sizes 100000
+    python benchmark.py --codecs
+    python benchmark.py --compare old.json new.json
+"""
+
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import timeit
+from concurrent.futures import ThreadPoolExecutor
+
+from bedrock_clients import register_client
+from fake_bedrock import FakeBedrock, LatencyModel
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+PERCENTILES = (50, 95, 99)
+# Workloads that touch the vector index (compared across shard counts)
+SHARDED_WORKLOADS = ('ingest', 'search', 'rag_generate')
+CHAT_MODEL = "anthropic.claude-3-haiku-20240307-v1:0"
+
+# Words used to build the synthetic corpus and queries
+_TOPICS = (
+    "bedrock embeddings retrieval generation vector chroma claude titan "
+    "foundation model context prompt latency throughput cache index shard "
+    "token stream query document knowledge semantic search similarity"
+).split()
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a list of numbers (None if empty)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(values):
+    """Returns count, mean and the configured percentiles of a list of seconds"""
+    summary = {'count': len(values), 'mean': sum(values) / len(values) if values else None}
+    for p in PERCENTILES:
+        summary[f"p{p}"] = percentile(values, p)
+    return summary
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MiB (None if unavailable)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+def git_commit():
+    """Current git commit of the working tree (None outside a repository)"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def make_corpus(size, seed=0):
+    """Builds `size` deterministic synthetic documents"""
+    rng = random.Random(seed)
+    return [
+        f"Document {i}: " + " ".join(rng.choice(_TOPICS) for _ in range(rng.randint(12, 40))) + "."
+        for i in range(size)
+    ]
+
+
+def make_queries(count, seed=1):
+    """Builds `count` deterministic synthetic queries"""
+    rng = random.Random(seed)
+    return [
+        f"How does {rng.choice(_TOPICS)} relate to {rng.choice(_TOPICS)} and {rng.choice(_TOPICS)}? ({i})"
+        for i in range(count)
+    ]
+
+
+def run_concurrently(func, items, concurrency):
+    """Calls `func` on every item with `concurrency` threads; returns (results, wall seconds)"""
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(func, items))
+    return results, time.perf_counter() - started
+
+
+def bench_ingest(system, corpus, batch_size):
+    """Times add_documents over the corpus in batches"""
+    latencies = []
+    started = time.perf_counter()
+    for start in range(0, len(corpus), batch_size):
+        batch = corpus[start:start + batch_size]
+        batch_started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            system.add_documents(batch)
+        latencies.append(time.perf_counter() - batch_started)
+    elapsed = time.perf_counter() - started
+    return {
+        'workload': 'ingest',
+        'documents': len(corpus),
+        'batch_size': batch_size,
+        'seconds': elapsed,
+        'docs_per_second': len(corpus) / elapsed if elapsed > 0 else None,
+        'stages': {'add_documents': summarize(latencies)},
+    }
+
+
+def bench_search(collection, query_embeddings, top_k):
+    """Times collection.query alone, one query at a time"""
+    latencies = []
+    started = time.perf_counter()
+    for embedding in query_embeddings:
+        query_started = time.perf_counter()
+        collection.query(query_embeddings=[embedding], n_results=top_k)
+        latencies.append(time.perf_counter() - query_started)
+    elapsed = time.perf_counter() - started
+    stages = {'query': summarize(latencies)}
+    stats = getattr(collection, 'stats', None)
+    if stats is not None:
+        # Sharded collections report the search latency of every shard
+        for shard in stats()['per_shard']:
+            stages[f"shard{shard['shard']}"] = {
+                'count': None, 'mean': None,
+                **{f"p{p}": shard.get(f"p{p}_seconds") for p in PERCENTILES},
+            }
+    return {
+        'workload': 'search',
+        'queries': len(query_embeddings),
+        'seconds': elapsed,
+        'queries_per_second': len(query_embeddings) / elapsed if elapsed > 0 else None,
+        'stages': stages,
+    }
+
+
+def bench_quantized(collection, query_embeddings, top_k, quantization):
+    """Times search over a quantized copy of a numpy collection and measures its recall"""
+    from numpy_index import NumpyCollection, normalize_rows
+    from quantization import evaluate
+
+    stored = collection.get(include=['embeddings'])
+    quantized = NumpyCollection(f"{collection.name}_{quantization}", quantization=quantization)
+    quantized.add(ids=stored['ids'], embeddings=stored['embeddings'])
+    quantized.query(query_embeddings=query_embeddings[:1], n_results=top_k)
+
+    result = bench_search(quantized, query_embeddings, top_k)
+    result['workload'] = f"search_{quantization}"
+    result['quality'] = evaluate(
+        normalize_rows(stored['embeddings']),
+        normalize_rows(query_embeddings),
+        k=top_k,
+        rerank_factor=quantized.rerank_factor
+    )
+    result['quality']['resident_bytes_per_vector'] = quantized.memory_usage()['bytes_per_vector']
+    return result
+
+
+def bench_rag_generate(system, queries, concurrency, top_k):
+    """Times rag_generate with a per-stage breakdown"""
+    def one(query):
+        timings = {}
+        started = time.perf_counter()
+        system.rag_generate(query, top_k=top_k, timings=timings)
+        timings['total'] = time.perf_counter() - started
+        return timings
+
+    results, wall = run_concurrently(one, queries, concurrency)
+    stages = {}
+    for name in ('embed', 'search', 'prompt', 'generate', 'total'):
+        stages[name] = summarize([timings[name] for timings in results if name in timings])
+    return {
+        'workload': 'rag_generate',
+        'queries': len(queries),
+        'concurrency': concurrency,
+        'seconds': wall,
+        'queries_per_second': len(queries) / wall if wall > 0 else None,
+        'stages': stages,
+    }
+
+
+def bench_simple(name, func, queries, concurrency):
+    """Times a single-stage workload"""
+    def one(query):
+        started = time.perf_counter()
+        func(query)
+        return time.perf_counter() - started
+
+    latencies, wall = run_concurrently(one, queries, concurrency)
+    return {
+        'workload': name,
+        'queries': len(queries),
+        'concurrency': concurrency,
+        'seconds': wall,
+        'queries_per_second': len(queries) / wall if wall > 0 else None,
+        'stages': {'total': summarize(latencies)},
+    }
+
+
+def run(args, fake):
+    """
+    Runs every workload and returns the results document
+
+    Every cache in front of Bedrock is off, so each timed request reaches
+    `fake`; the calls it received are recorded per workload.
+    """
+    # Imported after the fake client is registered
+    import main as chat
+    from rag_system import RAGSystem
+    from response_cache import ResponseCache
+
+    # Holds no entries, so repeated chat prompts are not served from memory
+    chat.response_cache = ResponseCache(max_entries=0)
+    results = []
+    queries = make_queries(args.queries)
+    for backend, shards in itertools.product(args.backends, args.shards):
+        for size in args.corpus_sizes:
+            name = f"bench_{backend}_{size}" + (f"_{shards}shards" if shards > 1 else "")
+            system = RAGSystem(
+                embedding_cache_path=None,
+                load_samples=False,
+                collection_name=name,
+                vector_backend=backend,
+                semantic_cache=False,
+                shards=shards,
+                response_cache=False
+            )
+            with contextlib.redirect_stdout(io.StringIO()):
+                try:
+                    system.chroma_client.delete_collection(name=name)
+                except Exception:
+                    pass
+                system.collection
+
+            def record(result):
+                result['corpus_size'] = size
+                result['backend'] = backend
+                result['shards'] = shards
+                results.append(result)
+
+            label = f"{backend} corpus={size}" + (f" shards={shards}" if shards > 1 else "")
+            print(f"[BENCH] {label}: ingest")
+            record(bench_ingest(system, make_corpus(size), args.batch_size))
+
+            print(f"[BENCH] {label}: search")
+            query_embeddings = system.embedding_function(queries)
+            record(bench_search(system.collection, query_embeddings, args.top_k))
+            if backend == "numpy" and args.quantization:
+                record(bench_quantized(system.collection, query_embeddings, args.top_k, args.quantization))
+
+            for concurrency in args.concurrency:
+                print(f"[BENCH] {label} concurrency={concurrency}: queries")
+                for workload in (
+                    lambda: bench_rag_generate(system, queries, concurrency, args.top_k),
+                    lambda: bench_simple('generate_without_rag', system.generate_without_rag,
+                                         queries, concurrency),
+                    lambda: bench_simple('chat_with_bedrock',
+                                         lambda query: chat.chat_with_bedrock(CHAT_MODEL, query),
+                                         queries, concurrency),
+                ):
+                    calls = fake.stats()['calls']
+                    result = workload()
+                    result['bedrock_calls'] = fake.stats()['calls'] - calls
+                    record(result)
+
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'args': {key: value for key, value in vars(args).items() if key != 'compare'},
+        },
+        'peak_rss_mb': peak_rss_mb(),
+        'results': results,
+    }
+
+
+CODEC_MODELS = (
+    "anthropic.claude-3-haiku-20240307-v1:0",
+    "anthropic.claude-v2:1",
+    "amazon.titan-text-express-v1",
+    "meta.llama3-8b-instruct-v1:0",
+    "mistral.mistral-7b-instruct-v0:2",
+)
+
+
+def bench_codecs(iterations=100000):
+    """Micro-benchmarks codec dispatch, body building and response/stream parsing (ns per call)"""
+    from fake_bedrock import FakeBedrock
+    from provider_codecs import DEFAULT_SAMPLING, get_codec, resolve_codec
+
+    fake = FakeBedrock(sleep=lambda seconds: None)
+    results = []
+    for model_id in CODEC_MODELS:
+        codec = get_codec(model_id)
+        body = codec.build_body("What is Amazon Bedrock?", DEFAULT_SAMPLING)
+        response_body = json.loads(fake.invoke_model(modelId=model_id, body=body)['body'].read())
+        stream = fake.invoke_model_with_response_stream(modelId=model_id, body=body)['body']
+        # First chunk that carries text
+        chunk = next(
+            payload for payload in (json.loads(event['chunk']['bytes']) for event in stream)
+            if codec.parse_stream_chunk(payload)
+        )
+        operations = {
+            'get_codec': lambda: get_codec(model_id),
+            'resolve_uncached': lambda: resolve_codec(model_id),
+            'build_body': lambda: codec.build_body("What is Amazon Bedrock?", DEFAULT_SAMPLING),
+            'parse_response': lambda: codec.parse_response(response_body),
+            'parse_stream_chunk': lambda: codec.parse_stream_chunk(chunk),
+        }
+        timings = {
+            name: timeit.timeit(operation, number=iterations) / iterations * 1e9
+            for name, operation in operations.items()
+        }
+        results.append({'model': model_id, 'codec': codec.name, 'ns_per_call': timings})
+    return results
+
+
+def print_codec_report(results):
+    """Prints the codec micro-benchmarks as a table"""
+    names = list(results[0]['ns_per_call'])
+    print("\n" + "=" * 145)
+    print(f"{'model':<42}" + "".join(f"{name:>20}" for name in names) + "   (ns per call)")
+    print("=" * 145)
+    for result in results:
+        print(f"{result['model']:<42}" + "".join(f"{result['ns_per_call'][name]:20.0f}" for name in names))
+    print("=" * 145)
+
+
+def _fmt(seconds):
+    return "-" if seconds is None else f"{seconds * 1000:9.2f}"
+
+
+def print_report(report):
+    """Prints the results as a table (latencies in milliseconds)"""
+    print("\n" + "=" * 115)
+    print(f"{'workload':<22}{'backend':>8}{'shards':>7}{'corpus':>8}{'conc':>6}{'stage':>15}"
+          f"{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}{'ops/s':>12}")
+    print("=" * 115)
+    for result in report['results']:
+        rate = result.get('queries_per_second') or result.get('docs_per_second')
+        for i, (stage, summary) in enumerate(result['stages'].items()):
+            print(f"{result['workload'] if i == 0 else '':<22}"
+                  f"{result.get('backend', 'chroma') if i == 0 else '':>8}"
+                  f"{result.get('shards', 1) if i == 0 else '':>7}"
+                  f"{result['corpus_size'] if i == 0 else '':>8}"
+                  f"{result.get('concurrency', '') if i == 0 else '':>6}"
+                  f"{stage:>15}{_fmt(summary['p50'])}  {_fmt(summary['p95'])}  {_fmt(summary['p99'])}"
+                  f"{(f'{rate:12.1f}' if rate and i == 0 else ''):>12}")
+    print("=" * 115)
+    for result in report['results']:
+        quality = result.get('quality')
+        if quality:
+            print(f"{result['workload']} corpus={result['corpus_size']}: "
+                  f"{quality['float32_bytes_per_vector']} -> {quality['int8_bytes_per_vector']} bytes/vector, "
+                  f"recall@{quality['k']} {quality['recall_at_k']:.3f} "
+                  f"({quality['recall_at_k_reranked']:.3f} after float32 rerank)")
+    print_shard_scaling(report['results'])
+    if report.get('peak_rss_mb') is not None:
+        print(f"Peak RSS: {report['peak_rss_mb']:.1f} MiB")
+
+
+def print_shard_scaling(results):
+    """Prints the throughput of every sharded workload relative to one shard"""
+    def unsharded_key(result):
+        workload, backend, _, corpus_size, concurrency = _result_key(result)
+        return workload, backend, corpus_size, concurrency
+
+    baseline = {unsharded_key(result): result for result in results if result.get('shards', 1) == 1}
+    for result in results:
+        single = baseline.get(unsharded_key(result))
+        if result.get('shards', 1) == 1 or single is None or result['workload'] not in SHARDED_WORKLOADS:
+            continue
+        rate = result.get('queries_per_second') or result.get('docs_per_second')
+        single_rate = single.get('queries_per_second') or single.get('docs_per_second')
+        if rate and single_rate:
+            concurrency = f" concurrency={result['concurrency']}" if result.get('concurrency') else ""
+            print(f"[SHARDS] {result['workload']} {result.get('backend', 'chroma')} "
+                  f"corpus={result['corpus_size']}{concurrency}: {result['shards']} shards "
+                  f"{rate:.1f}/s vs {single_rate:.1f}/s with 1 ({rate / single_rate:.2f}x)")
+
+
+def _result_key(result):
+    return (result['workload'], result.get('backend', 'chroma'), result.get('shards', 1),
+            result['corpus_size'], result.get('concurrency'))
+
+
+def compare_reports(old, new):
+    """Prints the p50/p95 change of every stage between two result files"""
+    old_results = {_result_key(result): result for result in old['results']}
+    print(f"\nComparing {old['meta'].get('commit')} -> {new['meta'].get('commit')}")
+    print(f"{'workload':<22}{'backend':>8}{'shards':>7}{'corpus':>8}{'conc':>6}{'stage':>15}"
+          f"{'p50 change':>14}{'p95 change':>14}")
+    for result in new['results']:
+        previous = old_results.get(_result_key(result))
+        if previous is None:
+            continue
+        for stage, summary in result['stages'].items():
+            before = previous['stages'].get(stage)
+            if not before:
+                continue
+            changes = []
+            for p in ('p50', 'p95'):
+                if before[p] and summary[p] is not None:
+                    changes.append(f"{(summary[p] - before[p]) / before[p] * 100:+13.1f}%")
+                else:
+                    changes.append(f"{'-':>14}")
+            print(f"{result['workload']:<22}{result.get('backend', 'chroma'):>8}"
+                  f"{result.get('shards', 1):>7}{result['corpus_size']:>8}"
+                  f"{result.get('concurrency') or '':>6}{stage:>15}{changes[0]}{changes[1]}")
+
+
+def _int_list(value):
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the RAG pipeline against a stubbed Bedrock")
+    parser.add_argument("--corpus-sizes", type=_int_list, default=[100, 1000],
+                        help="Comma-separated corpus sizes (default: 100,1000)")
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 8],
+                        help="Comma-separated query concurrency levels (default: 1,8)")
+    parser.add_argument("--backends", type=lambda value: [item.strip() for item in value.split(",") if item.strip()],
+                        default=["chroma"], help="Comma-separated retrieval backends (chroma, numpy)")
+    parser.add_argument("--shards", type=_int_list, default=[1],
+                        help="Comma-separated shard counts (default: 1)")
+    parser.add_argument("--quantization", choices=["int8"],
+                        help="Also benchmark a quantized copy of each numpy index and report recall@k")
+    parser.add_argument("--queries", type=int, default=50, help="Queries per workload (default: 50)")
+    parser.add_argument("--top-k", type=int, default=2, help="Documents retrieved per query")
+    parser.add_argument("--batch-size", type=int, default=256, help="Documents per add_documents call")
+    parser.add_argument("--latency", default="lognormal:0.05,0.3",
+                        help="Stub time-to-first-byte distribution (see fake_bedrock.LatencyModel)")
+    parser.add_argument("--tokens-per-second", type=float, default=2000.0,
+                        help="Stub output token rate")
+    parser.add_argument("--throttle-rate", type=float, default=0.0,
+                        help="Probability that a stub call is throttled")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--codecs", action="store_true",
+                        help="Run the provider codec micro-benchmarks instead")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"),
+                        help="Compare two result files instead of running")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.compare:
+        with open(args.compare[0]) as old_file, open(args.compare[1]) as new_file:
+            compare_reports(json.load(old_file), json.load(new_file))
+        return
+    if args.codecs:
+        results = bench_codecs()
+        print_codec_report(results)
+        if args.output:
+            with open(args.output, "w") as output:
+                json.dump({'meta': {'commit': git_commit()}, 'codecs': results}, output, indent=2)
+            print(f"[OK] Results written to {args.output}")
+        return
+
+    fake = FakeBedrock(
+        latency=LatencyModel.parse(args.latency, args.seed),
+        tokens_per_second=args.tokens_per_second,
+        throttle_rate=args.throttle_rate,
+        seed=args.seed
+    )
+    register_client('bedrock-runtime', fake)
+    register_client('bedrock', fake)
+
+    report = run(args, fake)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+        print(f"[OK] Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
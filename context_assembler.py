@@ -0,0 +1,176 @@
+"""
+Token-budgeted RAG context assembly
+Packs the best retrieved chunks into the prompt up to a token budget,
+dropping near-duplicate chunks with one cosine-similarity matrix over their
+embeddings. The instruction text always comes first and never changes, so
+every RAG prompt shares the same prefix for provider-side prompt caching.
+"""
+
+import os
+import threading
+
+from instrumentation import get_instrumentation
+from rate_limiter import estimate_tokens
+
+# Token budget of the whole RAG prompt (instruction, context and question)
+DEFAULT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "2000"))
+# Chunks at least this similar to a better-ranked chunk are dropped
+DEFAULT_DUPLICATE_THRESHOLD = float(os.environ.get("CONTEXT_DUPLICATE_THRESHOLD", "0.95"))
+
+# Characters per estimated token, used to truncate an oversized chunk
+CHARS_PER_TOKEN = 4
+
+# Stable prompt prefix shared by every RAG prompt
+PROMPT_PREFIX = "Given the following context, please answer the question.\n\nContext: "
+
+
+def build_rag_prompt(query, documents):
+    """
+    Builds the RAG prompt from the query and the retrieved documents
+
+    Args:
+        query: The user's query
+        documents: List of retrieved documents
+
+    Returns:
+        The prompt with the documents as context
+    """
+    context = "\n".join(documents)
+
+    return f"""{PROMPT_PREFIX}{context}
+
+Question: {query}
+
+Based on the provided context, my answer is:"""
+
+
+class ContextAssembler:
+    """Selects the retrieved chunks that go into a RAG prompt"""
+
+    def __init__(self, token_budget=DEFAULT_TOKEN_BUDGET,
+                 duplicate_threshold=DEFAULT_DUPLICATE_THRESHOLD, estimate=estimate_tokens):
+        """
+        Args:
+            token_budget: Maximum estimated tokens of the whole prompt (None for no limit)
+            duplicate_threshold: Cosine similarity above which a chunk is a duplicate
+            estimate: Function estimating the tokens of a text
+        """
+        self.token_budget = token_budget
+        self.duplicate_threshold = duplicate_threshold
+        self.estimate = estimate
+        self._lock = threading.Lock()
+        self._stats = {
+            'queries': 0,
+            'prompt_tokens': 0,
+            'prompt_tokens_saved': 0,
+            'duplicates_dropped': 0,
+            'over_budget_dropped': 0,
+        }
+
+    def _duplicates(self, documents, embeddings):
+        """Returns the positions of chunks that repeat a better-ranked chunk"""
+        duplicates = set()
+        if embeddings is not None and len(embeddings) > 1:
+            import numpy as np
+            from numpy_index import normalize_rows
+            vectors = normalize_rows(embeddings)
+            similar = (vectors @ vectors.T) >= self.duplicate_threshold
+            kept = np.ones(len(documents), dtype=bool)
+            for i in range(1, len(documents)):
+                if (similar[i, :i] & kept[:i]).any():
+                    kept[i] = False
+                    duplicates.add(i)
+        seen = {}
+        for i, document in enumerate(documents):
+            if i not in duplicates and seen.setdefault(document, i) != i:
+                duplicates.add(i)
+        return duplicates
+
+    def assemble(self, query, documents, distances=None, embeddings=None):
+        """
+        Builds the RAG prompt for a query from its retrieved chunks
+
+        Chunks are taken best first (lowest distance, or retrieval order)
+        while they fit the budget; near-duplicates of a chunk already taken
+        are skipped. If not even the best chunk fits, it is truncated.
+
+        Args:
+            query: The user's query
+            documents: Retrieved chunks
+            distances: Their distances to the query (optional)
+            embeddings: Their embeddings, for near-duplicate detection (optional)
+
+        Returns:
+            Dict with the prompt, the documents used, the estimated prompt
+            tokens, the tokens saved over using every chunk, and the numbers
+            of chunks dropped as duplicates and for the budget
+        """
+        documents = list(documents)
+        order = list(range(len(documents)))
+        if distances is not None:
+            order.sort(key=lambda i: distances[i])
+        ranked = [documents[i] for i in order]
+        ranked_embeddings = None
+        if embeddings is not None and len(embeddings) == len(documents):
+            ranked_embeddings = [embeddings[i] for i in order]
+
+        duplicates = self._duplicates(ranked, ranked_embeddings)
+        base_tokens = self.estimate(build_rag_prompt(query, []))
+        remaining = None if self.token_budget is None else self.token_budget - base_tokens
+        selected = []
+        over_budget = 0
+        for i, document in enumerate(ranked):
+            if i in duplicates:
+                continue
+            # Chunks after the first also cost their newline separator
+            cost = self.estimate(document) + (1 if selected else 0)
+            if remaining is None or cost <= remaining:
+                selected.append(document)
+                if remaining is not None:
+                    remaining -= cost
+            else:
+                over_budget += 1
+
+        if not selected and over_budget and remaining and remaining > 0:
+            # Keep the start of the best chunk rather than sending no context
+            best = next(document for i, document in enumerate(ranked) if i not in duplicates)
+            words = best[:remaining * CHARS_PER_TOKEN].rsplit(None, 1)
+            truncated = words[0] if words else ''
+            if truncated:
+                selected.append(truncated)
+                over_budget -= 1
+
+        prompt = build_rag_prompt(query, selected)
+        prompt_tokens = self.estimate(prompt)
+        saved = max(0, self.estimate(build_rag_prompt(query, documents)) - prompt_tokens)
+        with self._lock:
+            self._stats['queries'] += 1
+            self._stats['prompt_tokens'] += prompt_tokens
+            self._stats['prompt_tokens_saved'] += saved
+            self._stats['duplicates_dropped'] += len(duplicates)
+            self._stats['over_budget_dropped'] += over_budget
+        if saved:
+            get_instrumentation().increment('prompt_tokens_saved_total', saved)
+        return {
+            'prompt': prompt,
+            'documents': selected,
+            'prompt_tokens': prompt_tokens,
+            'prompt_tokens_saved': saved,
+            'duplicates': len(duplicates),
+            'over_budget': over_budget,
+        }
+
+    def stats(self):
+        """
+        Returns the assembler counters
+
+        Returns:
+            Dict with queries, prompt_tokens, prompt_tokens_saved,
+            duplicates_dropped, over_budget_dropped and the mean tokens
+            saved per query
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        queries = stats['queries']
+        stats['tokens_saved_per_query'] = stats['prompt_tokens_saved'] / queries if queries else 0.0
+        return stats
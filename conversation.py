@@ -0,0 +1,231 @@
+"""
+Bounded-memory conversation history for the chat demo
+Keeps the most recent turns inside a sliding token window and folds the
+turns that fall out of it into a running summary on a background thread, so
+the prompt of every turn stays about the same size however long the
+conversation gets. Messages are formatted per provider by the codecs.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from deadlines import text_request
+from provider_codecs import SamplingParams, get_codec
+from rate_limiter import estimate_tokens
+
+# Estimated tokens of recent turns kept verbatim in the prompt
+DEFAULT_WINDOW_TOKENS = int(os.environ.get("CHAT_WINDOW_TOKENS", "2000"))
+# Upper bound of the running summary of evicted turns
+SUMMARY_MAX_TOKENS = int(os.environ.get("CHAT_SUMMARY_TOKENS", "300"))
+SUMMARY_SAMPLING = SamplingParams(max_tokens=SUMMARY_MAX_TOKENS, temperature=0.0, top_p=None)
+
+# Per-turn statistics kept for reporting
+TURN_STATS_HISTORY = 1000
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+
+def model_summarizer(client, model_id):
+    """
+    Returns a summarizer that asks a Bedrock model to fold turns into the summary
+
+    Args:
+        client: A bedrock-runtime client
+        model_id: Model writing the summary (usually the chat model)
+
+    Returns:
+        Callable (summary, turns) -> new summary
+    """
+    codec = get_codec(model_id)
+
+    def summarize(summary, turns):
+        transcript = "\n".join(f"User: {user}\nAssistant: {assistant}" for user, assistant in turns)
+        prompt = (
+            f"Update the summary of a conversation with the new turns below. Keep every fact, "
+            f"name and decision the user may refer to later, in at most "
+            f"{SUMMARY_MAX_TOKENS * 3 // 4} words.\n\n"
+            f"Current summary:\n{summary or '(none)'}\n\nNew turns:\n{transcript}\n\nUpdated summary:"
+        )
+        body = codec.build_body(prompt, SUMMARY_SAMPLING)
+        return text_request(client, model_id, body)().strip()
+
+    return summarize
+
+
+class ConversationMemory:
+    """
+    Sliding-window conversation history with a background summary
+
+    The prompt of a turn holds the summary (as the system text), the turns
+    inside the window and the new user message. Turns pushed out of the
+    window are summarized on one background thread; the summary in use is
+    the latest one finished, so a turn never waits for summarization.
+    """
+
+    def __init__(self, model_id, window_tokens=DEFAULT_WINDOW_TOKENS, summarizer=None,
+                 summary_max_tokens=SUMMARY_MAX_TOKENS, estimate=estimate_tokens):
+        """
+        Args:
+            model_id: The chat model (selects the message format)
+            window_tokens: Estimated tokens of the turns kept verbatim
+            summarizer: Callable (summary, turns) -> summary (None drops
+                evicted turns without summarizing them)
+            summary_max_tokens: Estimated tokens the summary is cut to
+            estimate: Function estimating the tokens of a text
+        """
+        self.model_id = model_id
+        self.codec = get_codec(model_id)
+        self.window_tokens = window_tokens
+        self.summarizer = summarizer
+        self.summary_max_tokens = summary_max_tokens
+        self.estimate = estimate
+        self.summary = ''
+        self.last_error = None
+        self._turns = deque()
+        self._window_used = 0
+        self._evicted = []
+        self._summarizing = None
+        self._executor = None
+        self._closed = False
+        self._lock = threading.Lock()
+        self.turn_stats = deque(maxlen=TURN_STATS_HISTORY)
+        self._totals = {'turns': 0, 'evicted_turns': 0, 'summaries': 0}
+
+    def messages(self, user_message):
+        """Returns the window turns followed by the new user message"""
+        with self._lock:
+            turns = list(self._turns)
+        messages = []
+        for user, assistant, _ in turns:
+            messages.append({"role": "user", "content": user})
+            messages.append({"role": "assistant", "content": assistant})
+        messages.append({"role": "user", "content": user_message})
+        return messages
+
+    def system_prompt(self):
+        """Returns the system text carrying the summary ('' before the first eviction)"""
+        summary = self.summary
+        return f"{SUMMARY_PREFIX}{summary}" if summary else ''
+
+    def build_body(self, user_message, params):
+        """
+        Builds the request body of the next turn
+
+        Args:
+            user_message: The new user message
+            params: SamplingParams
+
+        Returns:
+            The JSON body in the chat model's format, or None if the model
+            family is not supported
+        """
+        if self.codec is None:
+            return None
+        return self.codec.build_chat_body(self.messages(user_message), params, self.system_prompt() or None)
+
+    def add_turn(self, user_message, answer, prompt_tokens=None, input_tokens=None,
+                 output_tokens=None, seconds=None):
+        """
+        Appends a completed turn and evicts the oldest turns beyond the window
+
+        Args:
+            user_message: What the user said
+            answer: What the model answered
+            prompt_tokens: Estimated tokens of the request body
+            input_tokens: Input tokens reported by Bedrock
+            output_tokens: Output tokens reported by Bedrock
+            seconds: Latency of the turn
+        """
+        cost = self.estimate(user_message) + self.estimate(answer)
+        with self._lock:
+            self._turns.append((user_message, answer, cost))
+            self._window_used += cost
+            while self._turns and self._window_used > self.window_tokens:
+                user, assistant, evicted_cost = self._turns.popleft()
+                self._window_used -= evicted_cost
+                self._evicted.append((user, assistant))
+                self._totals['evicted_turns'] += 1
+            self._totals['turns'] += 1
+            self.turn_stats.append({
+                'turn': self._totals['turns'],
+                'prompt_tokens': prompt_tokens,
+                'input_tokens': input_tokens,
+                'output_tokens': output_tokens,
+                'seconds': seconds,
+                'window_turns': len(self._turns),
+            })
+            if self._evicted and self._summarizing is None:
+                self._schedule()
+
+    def _schedule(self):
+        # Called with the lock held
+        if self.summarizer is None or self._closed:
+            self._evicted.clear()
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-summary")
+        self._summarizing = self._executor.submit(self._summarize)
+
+    def _summarize(self):
+        with self._lock:
+            turns, self._evicted = self._evicted, []
+        try:
+            summary = self.summarizer(self.summary, turns)
+            # Keep the summary bounded even if the model ignores the limit
+            limit = self.summary_max_tokens * 4
+            if len(summary) > limit:
+                words = summary[:limit].rsplit(None, 1)
+                summary = words[0] if words else ''
+            self.summary = summary
+            self.last_error = None
+            with self._lock:
+                self._totals['summaries'] += 1
+        except Exception as e:
+            # Drop these turns rather than letting the backlog grow
+            self.last_error = e
+        finally:
+            with self._lock:
+                self._summarizing = None
+                if self._evicted:
+                    self._schedule()
+
+    def wait(self, timeout=None):
+        """Waits until every evicted turn has been summarized"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                future = self._summarizing
+            if future is None:
+                return
+            future.result(None if deadline is None else max(0.0, deadline - time.monotonic()))
+
+    def stats(self):
+        """
+        Returns the conversation counters
+
+        Returns:
+            Dict with turns, evicted_turns, summaries, the turns and
+            estimated tokens in the window, the summary tokens and the mean
+            prompt tokens, input tokens and seconds of the recorded turns
+        """
+        with self._lock:
+            stats = dict(self._totals)
+            stats['window_turns'] = len(self._turns)
+            stats['window_tokens'] = self._window_used
+            recorded = list(self.turn_stats)
+        stats['summary_tokens'] = self.estimate(self.summary) if self.summary else 0
+        for name in ('prompt_tokens', 'input_tokens', 'seconds'):
+            values = [turn[name] for turn in recorded if turn[name] is not None]
+            stats[f"mean_{name}"] = sum(values) / len(values) if values else None
+        return stats
+
+    def close(self):
+        """Stops the summarization thread; turns evicted later are dropped"""
+        with self._lock:
+            self._closed = True
+            executor = self._executor
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
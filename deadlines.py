@@ -0,0 +1,400 @@
+"""
+Deadline-aware and hedged Bedrock invocations
+Runs blocking calls on a shared thread pool so that the caller can stop
+waiting at a deadline. Optionally fires a duplicate (hedge) request once a
+call has been outstanding longer than the observed p95 latency, limited by
+a global hedge budget, and races a faster fallback model when the deadline
+is near. The first successful response wins; pending losers are cancelled.
+
+A boto3 call that is already running cannot be interrupted: a losing or
+timed-out request finishes on its worker thread and its result is dropped.
+Its latency is still recorded when it finishes, and a call still running at
+the deadline records the time it had taken so far, so slow calls keep
+counting towards the percentile that sets the hedge point.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from instrumentation import get_instrumentation, parse_token_usage
+from provider_codecs import get_codec
+from rate_limiter import estimate_tokens, get_limiter
+
+# Seconds a generation request may take (0 disables the deadline)
+GENERATION_DEADLINE_SECONDS = float(os.environ.get("BEDROCK_DEADLINE_SECONDS", "60"))
+# Seconds a streamed response may take to start (0 leaves only the
+# generation deadline); the fallback model is raced against the first token
+FIRST_TOKEN_DEADLINE_SECONDS = float(os.environ.get("BEDROCK_FIRST_TOKEN_DEADLINE_SECONDS", "20"))
+# Seconds an embedding batch may take (0 disables the deadline)
+EMBEDDING_DEADLINE_SECONDS = float(os.environ.get("BEDROCK_EMBED_DEADLINE_SECONDS", "60"))
+
+# Hedging is opt-in (BEDROCK_HEDGING=1)
+HEDGING_ENABLED = os.environ.get("BEDROCK_HEDGING", "0") == "1"
+HEDGE_PERCENTILE = float(os.environ.get("BEDROCK_HEDGE_PERCENTILE", "95"))
+# Hedges allowed per request on average, and the burst allowance
+HEDGE_BUDGET_RATIO = float(os.environ.get("BEDROCK_HEDGE_BUDGET", "0.05"))
+HEDGE_BUDGET_BURST = 10
+
+# Faster model raced against the primary when the deadline is near
+FALLBACK_MODEL = os.environ.get("BEDROCK_FALLBACK_MODEL") or None
+# Seconds before the deadline at which the fallback is started (when its
+# own p95 is not known yet)
+FALLBACK_LEAD_SECONDS = float(os.environ.get("BEDROCK_FALLBACK_LEAD_SECONDS", "5"))
+
+# Latency samples kept per model, and samples needed before hedging
+LATENCY_WINDOW = 512
+MIN_SAMPLES = 20
+
+INVOKER_MAX_WORKERS = int(os.environ.get("BEDROCK_INVOKER_WORKERS", "32"))
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when no response arrived before the request deadline"""
+
+
+def deadline_after(seconds):
+    """Returns the monotonic deadline `seconds` from now (None when seconds is falsy)"""
+    return time.monotonic() + seconds if seconds else None
+
+
+class LatencyTracker:
+    """Sliding window of recent latencies"""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, p):
+        """Nearest-rank percentile of the window (None if empty)"""
+        with self._lock:
+            ordered = sorted(self._samples)
+        if not ordered:
+            return None
+        rank = max(1, min(len(ordered), int(-(-p * len(ordered) // 100))))
+        return ordered[rank - 1]
+
+
+class HedgeBudget:
+    """
+    Global limit on hedged requests
+
+    Every request earns `ratio` of a hedge (capped at `burst`); a hedge
+    spends one, so hedges stay below `ratio` of the traffic over time.
+    """
+
+    def __init__(self, ratio=HEDGE_BUDGET_RATIO, burst=HEDGE_BUDGET_BURST):
+        self.ratio = ratio
+        self.burst = burst
+        self._credit = float(burst)
+        self._lock = threading.Lock()
+
+    def record_request(self):
+        with self._lock:
+            self._credit = min(self.burst, self._credit + self.ratio)
+
+    def try_acquire(self):
+        """Spends one hedge if the budget allows it"""
+        with self._lock:
+            if self._credit >= 1.0:
+                self._credit -= 1.0
+                return True
+            return False
+
+
+class _Call:
+    """A submitted call; its latency is recorded once"""
+
+    __slots__ = ('role', 'key', 'started', 'recorded')
+
+    def __init__(self, role, key):
+        self.role = role
+        self.key = key
+        self.started = time.monotonic()
+        self.recorded = False
+
+
+class HedgedInvoker:
+    """Runs calls with deadlines, optional hedging and a fallback model"""
+
+    def __init__(self, max_workers=INVOKER_MAX_WORKERS, hedging=HEDGING_ENABLED,
+                 hedge_percentile=HEDGE_PERCENTILE, budget=None, min_samples=MIN_SAMPLES,
+                 fallback_lead_seconds=FALLBACK_LEAD_SECONDS):
+        """
+        Args:
+            max_workers: Threads available for in-flight calls (hedges included)
+            hedging: Fire a duplicate request after the observed percentile
+            hedge_percentile: Latency percentile after which a call is hedged
+            budget: HedgeBudget shared by every call (a new one if None)
+            min_samples: Latency samples needed before hedging a model
+            fallback_lead_seconds: Default time before the deadline to start the fallback
+        """
+        self.hedging = hedging
+        self.hedge_percentile = hedge_percentile
+        self.budget = budget or HedgeBudget()
+        self.min_samples = min_samples
+        self.fallback_lead_seconds = fallback_lead_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bedrock-call")
+        self._trackers = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            'calls': 0,
+            'hedges': 0,
+            'hedge_wins': 0,
+            'fallbacks': 0,
+            'fallback_wins': 0,
+            'deadlines_exceeded': 0,
+        }
+
+    def tracker(self, key):
+        """Returns the latency tracker of a model"""
+        with self._lock:
+            tracker = self._trackers.get(key)
+            if tracker is None:
+                tracker = self._trackers[key] = LatencyTracker()
+            return tracker
+
+    def _count(self, name, key):
+        with self._lock:
+            self._stats[name] += 1
+        get_instrumentation().increment(f"bedrock_{name}_total", model=key)
+
+    def _record(self, call, seconds):
+        """Records the latency of a call unless it was already recorded"""
+        with self._lock:
+            if call.recorded:
+                return
+            call.recorded = True
+        self.tracker(call.key).record(seconds)
+
+    def _finished(self, future, call):
+        # Done callback: losers that complete after the race are recorded too
+        if not future.cancelled() and future.exception() is None:
+            self._record(call, time.monotonic() - call.started)
+
+    def _submit(self, pending, role, key, func):
+        call = _Call(role, key)
+        future = self._executor.submit(func)
+        pending[future] = call
+        future.add_done_callback(lambda done: self._finished(done, call))
+
+    def call(self, key, func, deadline=None, fallback=None, outcome=None):
+        """
+        Runs `func` and returns the first successful result
+
+        Args:
+            key: Latency key of the call (the model id)
+            func: Zero-argument callable performing the request
+            deadline: Monotonic deadline (see deadline_after); None waits forever
+            fallback: Optional (key, func) of a faster model raced against
+                the primary when the deadline is near, or run at once if the
+                primary fails first
+            outcome: Optional dict receiving the 'role' ('primary', 'hedge'
+                or 'fallback') and the 'key' of the call that won
+
+        Returns:
+            The result of the first call to succeed
+
+        Raises:
+            DeadlineExceeded: If nothing succeeded before the deadline
+            Exception: The first error, if every call failed
+        """
+        self._count('calls', key)
+        self.budget.record_request()
+        pending = {}
+        errors = []
+        self._submit(pending, 'primary', key, func)
+        started = time.monotonic()
+
+        hedge_at = None
+        if self.hedging:
+            tracker = self.tracker(key)
+            if len(tracker) >= self.min_samples:
+                hedge_at = started + tracker.percentile(self.hedge_percentile)
+
+        fallback_at = None
+        fallback_submitted = False
+        if fallback is not None and deadline is not None:
+            fallback_p95 = self.tracker(fallback[0]).percentile(95)
+            lead = fallback_p95 if fallback_p95 is not None else self.fallback_lead_seconds
+            fallback_at = deadline - lead
+
+        while True:
+            events = [t for t in (hedge_at, fallback_at, deadline) if t is not None]
+            timeout = max(0.0, min(events) - time.monotonic()) if events else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                call = pending.pop(future)
+                error = future.exception()
+                if error is not None:
+                    errors.append(error)
+                    continue
+                self._record(call, time.monotonic() - call.started)
+                for loser in pending:
+                    loser.cancel()
+                if call.role != 'primary':
+                    self._count(f"{call.role}_wins", call.key)
+                if outcome is not None:
+                    outcome['role'] = call.role
+                    outcome['key'] = call.key
+                return future.result()
+
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                for loser, call in pending.items():
+                    if not loser.cancel():
+                        # Still running: the latency is at least this long
+                        self._record(call, now - call.started)
+                self._count('deadlines_exceeded', key)
+                raise DeadlineExceeded(f"No response from {key} before the deadline")
+            if hedge_at is not None and now >= hedge_at:
+                hedge_at = None
+                if pending and self.budget.try_acquire():
+                    self._count('hedges', key)
+                    self._submit(pending, 'hedge', key, func)
+            if fallback is not None and not fallback_submitted and (
+                    (fallback_at is not None and now >= fallback_at) or not pending):
+                # The deadline is near, or every call so far failed
+                fallback_at = None
+                fallback_submitted = True
+                self._count('fallbacks', fallback[0])
+                self._submit(pending, 'fallback', fallback[0], fallback[1])
+            if not pending:
+                raise errors[0]
+
+    def stats(self):
+        """
+        Returns the invoker counters
+
+        Returns:
+            Dict with calls, hedges, hedge_wins, fallbacks, fallback_wins,
+            deadlines_exceeded and the p95 latency per model
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            trackers = dict(self._trackers)
+        stats['p95_seconds'] = {key: tracker.percentile(95) for key, tracker in trackers.items()}
+        return stats
+
+    def shutdown(self):
+        """Stops the worker threads"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def text_request(client, model_id, body, deadline=None, usage=None):
+    """
+    Returns a zero-argument callable running one text generation request
+
+    The request goes through the model's rate limiter (see rate_limiter),
+    queueing at most until the deadline.
+
+    Args:
+        client: A bedrock-runtime client
+        model_id: The model to invoke
+        body: The JSON request body
+        deadline: Monotonic deadline for queueing behind the rate limiter
+        usage: Optional dict receiving the 'input_tokens' and 'output_tokens'
+            reported by Bedrock
+
+    Returns:
+        Callable returning the generated text
+    """
+    codec = get_codec(model_id)
+    limiter = get_limiter(model_id)
+    reserved = estimate_tokens(body)
+
+    def send():
+        return client.invoke_model(
+            modelId=model_id,
+            body=body,
+            contentType='application/json',
+            accept='application/json'
+        )
+
+    def invoke():
+        response = limiter.call(send, tokens=reserved, deadline=deadline)
+        response_body = json.loads(response['body'].read())
+        input_tokens, output_tokens = parse_token_usage(response, response_body)
+        if usage is not None:
+            usage['input_tokens'] = input_tokens
+            usage['output_tokens'] = output_tokens
+        if input_tokens is not None:
+            limiter.record_usage(reserved, input_tokens + (output_tokens or 0))
+        get_instrumentation().record_response(model_id, response, response_body)
+        return codec.parse_response(response_body)
+
+    return invoke
+
+
+def fallback_body(prompt, params, primary_model, fallback_model=FALLBACK_MODEL, history=None):
+    """
+    Returns the (model_id, body) of the fallback model for a text generation request
+
+    Args:
+        prompt: The user prompt
+        params: SamplingParams of the request
+        primary_model: The model the request was sent to
+        fallback_model: The faster model (BEDROCK_FALLBACK_MODEL if not given)
+        history: Optional ConversationMemory; the fallback then gets the same
+            conversation in its own message format
+
+    Returns:
+        The fallback pair, or None if no usable fallback is configured
+    """
+    if not fallback_model or fallback_model == primary_model:
+        return None
+    codec = get_codec(fallback_model)
+    if codec is None:
+        return None
+    if history is not None:
+        body = codec.build_chat_body(history.messages(prompt), params, history.system_prompt() or None)
+    else:
+        body = codec.build_body(prompt, params)
+    return fallback_model, body
+
+
+def fallback_request(client, prompt, params, primary_model, fallback_model=FALLBACK_MODEL,
+                     deadline=None, history=None):
+    """
+    Returns the (model_id, callable) fallback of a text generation request
+
+    Args:
+        client: A bedrock-runtime client
+        prompt: The user prompt
+        params: SamplingParams of the request
+        primary_model: The model the request was sent to
+        fallback_model: The faster model (BEDROCK_FALLBACK_MODEL if not given)
+        deadline: Monotonic deadline for queueing behind the rate limiter
+        history: Optional ConversationMemory (see fallback_body)
+
+    Returns:
+        The fallback pair, or None if no usable fallback is configured
+    """
+    fallback = fallback_body(prompt, params, primary_model, fallback_model, history)
+    if fallback is None:
+        return None
+    return fallback[0], text_request(client, fallback[0], fallback[1], deadline)
+
+
+_invoker = None
+_invoker_lock = threading.Lock()
+
+
+def get_invoker():
+    """Returns the shared invoker, creating it on first use"""
+    global _invoker
+    with _invoker_lock:
+        if _invoker is None:
+            _invoker = HedgedInvoker()
+        return _invoker
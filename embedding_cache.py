@@ -0,0 +1,233 @@
+"""
+Persistent, content-addressed embedding cache
+Vectors are keyed by (model id, SHA-256 of the text) and stored in SQLite as
+float32 blobs, so unchanged documents are never sent to Bedrock twice
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+
+# Default cache configuration
+DEFAULT_CACHE_PATH = os.path.join(".cache", "embeddings.sqlite3")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def text_hash(text):
+    """Returns the SHA-256 hex digest used as the cache key for a text"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _pack(vector):
+    return array('f', vector).tobytes()
+
+
+def _unpack(blob):
+    vector = array('f')
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+class EmbeddingCache:
+    """
+    Disk-backed embedding cache with size-bounded LRU eviction
+
+    Rows carry a last-access timestamp; once the stored vectors exceed
+    `max_bytes` the least recently used rows are deleted. The stored size is
+    summed once when the cache opens and kept as a running total; it is
+    summed again only when the total crosses `max_bytes`, which also picks up
+    rows written by other processes sharing the file.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Args:
+            path: SQLite database file (":memory:" for a throwaway cache)
+            max_bytes: Maximum total size of the stored vectors
+        """
+        if path != ":memory:":
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                   model TEXT NOT NULL,
+                   hash TEXT NOT NULL,
+                   vector BLOB NOT NULL,
+                   size INTEGER NOT NULL,
+                   accessed REAL NOT NULL,
+                   PRIMARY KEY (model, hash)
+               )"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_accessed ON embeddings (accessed)"
+        )
+        self._conn.commit()
+        self._bytes = self._stored_bytes()
+
+    def _stored_bytes(self):
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model_id, texts):
+        """
+        Looks up cached embeddings
+
+        Args:
+            model_id: Embedding model the vectors were produced with
+            texts: List of texts
+
+        Returns:
+            Dict mapping the index of every cached text to its embedding
+        """
+        hashes = [text_hash(text) for text in texts]
+        found = {}
+        with self._lock:
+            unique = list(dict.fromkeys(hashes))
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT hash, vector FROM embeddings "
+                    f"WHERE model = ? AND hash IN ({placeholders})",
+                    [model_id, *batch]
+                ).fetchall()
+                for digest, blob in rows:
+                    found[digest] = _unpack(blob)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET accessed = ? WHERE model = ? AND hash = ?",
+                    [(now, model_id, digest) for digest in found]
+                )
+                self._conn.commit()
+
+            result = {}
+            for i, digest in enumerate(hashes):
+                if digest in found:
+                    result[i] = found[digest]
+            self.hits += len(result)
+            self.misses += len(texts) - len(result)
+        return result
+
+    def put_many(self, model_id, texts, embeddings):
+        """
+        Stores embeddings and evicts old rows if the cache is over its size
+
+        Args:
+            model_id: Embedding model the vectors were produced with
+            texts: List of texts
+            embeddings: List of embeddings matching `texts`
+        """
+        now = time.time()
+        rows = {}
+        for text, embedding in zip(texts, embeddings):
+            blob = _pack(embedding)
+            digest = text_hash(text)
+            rows[digest] = (model_id, digest, blob, len(blob), now)
+        with self._lock:
+            # Replaced rows only change the total by their difference in size
+            replaced = 0
+            digests = list(rows)
+            for start in range(0, len(digests), 500):
+                batch = digests[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                replaced += self._conn.execute(
+                    f"SELECT COALESCE(SUM(size), 0) FROM embeddings "
+                    f"WHERE model = ? AND hash IN ({placeholders})",
+                    [model_id, *batch]
+                ).fetchone()[0]
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vector, size, accessed) "
+                "VALUES (?, ?, ?, ?, ?)",
+                list(rows.values())
+            )
+            self._bytes += sum(row[3] for row in rows.values()) - replaced
+            if self._bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        total = self._bytes = self._stored_bytes()
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        freed = 0
+        doomed = []
+        for model, digest, size in self._conn.execute(
+            "SELECT model, hash, size FROM embeddings ORDER BY accessed ASC"
+        ):
+            doomed.append((model, digest))
+            freed += size
+            if freed >= excess:
+                break
+        self._conn.executemany(
+            "DELETE FROM embeddings WHERE model = ? AND hash = ?", doomed
+        )
+        self._bytes -= freed
+        self.evictions += len(doomed)
+
+    def get_or_embed(self, model_id, texts, embed):
+        """
+        Returns embeddings for `texts`, calling `embed` only for cache misses
+
+        Args:
+            model_id: Embedding model the vectors are produced with
+            texts: List of texts
+            embed: Callable that embeds a list of texts (in order)
+
+        Returns:
+            List of embeddings in the same order as `texts`
+        """
+        texts = list(texts)
+        cached = self.get_many(model_id, texts)
+        if len(cached) == len(texts):
+            return [cached[i] for i in range(len(texts))]
+
+        # Embed each distinct missing text once
+        missing = {}
+        for i, text in enumerate(texts):
+            if i not in cached:
+                missing.setdefault(text, []).append(i)
+        missing_texts = list(missing)
+        new_embeddings = embed(missing_texts)
+        self.put_many(model_id, missing_texts, new_embeddings)
+
+        results = [None] * len(texts)
+        for i, embedding in cached.items():
+            results[i] = embedding
+        for text, embedding in zip(missing_texts, new_embeddings):
+            for i in missing[text]:
+                results[i] = embedding
+        return results
+
+    def stats(self):
+        """Returns hit/miss counters and the current cache size"""
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM embeddings"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'entries': entries,
+            'bytes': size,
+        }
+
+    def close(self):
+        """Closes the underlying database connection"""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,213 @@
+"""
+Concurrent embedding engine for Amazon Bedrock
+Fans a batch of texts out over a bounded thread pool, keeps the output in
+input order and retries only the items that failed, within an optional
+deadline per call
+"""
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from deadlines import DeadlineExceeded, deadline_after
+from instrumentation import get_instrumentation, parse_token_usage
+from rate_limiter import estimate_tokens, get_limiter
+
+# Default tunables
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_CHUNK_SIZE = 64
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_RETRY_BACKOFF = 0.5
+
+
+class EmbeddingError(Exception):
+    """Raised when some texts could not be embedded after every retry"""
+
+    def __init__(self, failures):
+        self.failures = failures
+        first_index, first_error = next(iter(failures.items()))
+        super().__init__(
+            f"{len(failures)} text(s) could not be embedded "
+            f"(first failure at index {first_index}: {first_error})"
+        )
+
+
+class EmbeddingEngine:
+    """
+    Bounded thread-pool embedding engine
+
+    Texts are processed in chunks of `chunk_size`; each chunk is fanned out
+    over at most `max_workers` concurrent `invoke_model` calls, so the number
+    of in-flight requests never exceeds `max_workers`.
+    """
+
+    def __init__(self, client, model_id, max_workers=DEFAULT_MAX_WORKERS,
+                 chunk_size=DEFAULT_CHUNK_SIZE, max_retries=DEFAULT_MAX_RETRIES,
+                 retry_backoff=DEFAULT_RETRY_BACKOFF, deadline_seconds=None, verbose=False):
+        """
+        Args:
+            client: A bedrock-runtime client (anything with `invoke_model`)
+            model_id: Embedding model to invoke
+            max_workers: Maximum number of concurrent requests
+            chunk_size: Number of texts submitted to the pool at a time
+            max_retries: Retry rounds for failed items before giving up
+            retry_backoff: Base delay in seconds between retry rounds
+            deadline_seconds: Time allowed per `embed` call, retries included
+                (None waits for every request)
+            verbose: Print throughput after every call
+        """
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1")
+        self.client = client
+        self.model_id = model_id
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.deadline_seconds = deadline_seconds
+        self.verbose = verbose
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="bedrock-embed"
+                )
+            return self._executor
+
+    def embed_one(self, text, deadline=None):
+        """
+        Embeds a single text with a blocking `invoke_model` call
+
+        The call goes through the model's rate limiter: throttled requests
+        are queued and retried rather than failed.
+
+        Args:
+            text: The text to embed
+            deadline: Monotonic deadline for queueing behind the rate limiter
+
+        Returns:
+            The embedding (list of floats)
+        """
+        body = json.dumps({"inputText": text})
+        limiter = get_limiter(self.model_id)
+        reserved = estimate_tokens(text)
+        response = limiter.call(
+            lambda: self.client.invoke_model(
+                modelId=self.model_id,
+                body=body,
+                contentType='application/json',
+                accept='application/json'
+            ),
+            tokens=reserved,
+            deadline=deadline
+        )
+        response_body = json.loads(response['body'].read())
+        limiter.record_usage(reserved, parse_token_usage(response, response_body)[0])
+        get_instrumentation().record_response(self.model_id, response, response_body)
+        return response_body['embedding']
+
+    def _run_round(self, texts, indices, results, deadline=None):
+        """
+        Embeds `texts[i]` for every i in `indices`; returns the failures
+
+        Items still pending at the deadline fail with DeadlineExceeded (a
+        request already running finishes in the background).
+        """
+        executor = self._get_executor()
+        failures = {}
+        for start in range(0, len(indices), self.chunk_size):
+            chunk = indices[start:start + self.chunk_size]
+            timeout = None if deadline is None else deadline - time.monotonic()
+            if timeout is not None and timeout <= 0:
+                for i in chunk:
+                    failures[i] = DeadlineExceeded("Embedding deadline reached")
+                continue
+            futures = {executor.submit(self.embed_one, texts[i], deadline): i for i in chunk}
+            wait(futures, timeout=timeout)
+            for future, i in futures.items():
+                if not future.done():
+                    future.cancel()
+                    failures[i] = DeadlineExceeded("Embedding deadline reached")
+                    continue
+                error = future.exception()
+                if error is None:
+                    results[i] = future.result()
+                else:
+                    failures[i] = error
+        return failures
+
+    def embed(self, texts, deadline=None, stats=None):
+        """
+        Embeds a list of texts concurrently
+
+        Args:
+            texts: List of texts to convert to embeddings
+            deadline: Monotonic deadline (`deadline_seconds` from now if None)
+            stats: Optional dict receiving the counters of this call ('texts',
+                'embedded', 'failed', 'retries', 'seconds', 'texts_per_second'),
+                filled in even when the call raises
+
+        Returns:
+            List of embeddings in the same order as `texts`
+
+        Raises:
+            EmbeddingError: If some texts still fail after `max_retries` rounds
+                or are not embedded before the deadline
+        """
+        texts = list(texts)
+        started = time.perf_counter()
+        if deadline is None:
+            deadline = deadline_after(self.deadline_seconds)
+        results = [None] * len(texts)
+        pending = list(range(len(texts)))
+        retries = 0
+
+        failures = self._run_round(texts, pending, results, deadline)
+        for attempt in range(1, self.max_retries + 1):
+            if not failures:
+                break
+            backoff = self.retry_backoff * (2 ** (attempt - 1))
+            if deadline is not None and time.monotonic() + backoff >= deadline:
+                break
+            time.sleep(backoff)
+            pending = sorted(failures)
+            retries += len(pending)
+            failures = self._run_round(texts, pending, results, deadline)
+
+        elapsed = time.perf_counter() - started
+        embedded = len(texts) - len(failures)
+        texts_per_second = embedded / elapsed if elapsed > 0 else 0.0
+        if stats is not None:
+            stats.update({
+                'texts': len(texts),
+                'embedded': embedded,
+                'failed': len(failures),
+                'retries': retries,
+                'seconds': elapsed,
+                'texts_per_second': texts_per_second,
+            })
+        instrumentation = get_instrumentation()
+        instrumentation.increment('embedding_retries_total', retries, model=self.model_id)
+        instrumentation.increment('embedding_failures_total', len(failures), model=self.model_id)
+        if self.verbose and texts:
+            print(f"[EMBED] {embedded}/{len(texts)} texts in {elapsed:.2f}s "
+                  f"({texts_per_second:.1f} texts/s, "
+                  f"{retries} retries)")
+
+        if failures:
+            raise EmbeddingError(failures)
+        return results
+
+    def shutdown(self):
+        """Stops the worker threads"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
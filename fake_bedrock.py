@@ -0,0 +1,422 @@
+"""
+Offline Amazon Bedrock stand-in
+In-process fake of the bedrock-runtime and bedrock clients with
+deterministic embeddings and completions, configurable latency
+distributions, token rates and ThrottlingException injection (at random
+or above a concurrency quota)
+
+Enable it for every module with BEDROCK_FAKE=1 (see bedrock_clients); the
+BEDROCK_FAKE_* variables below tune its behaviour.
+"""
+
+import hashlib
+import io
+import json
+import math
+import os
+import random
+import threading
+import time
+
+import numpy as np
+from botocore.exceptions import ClientError
+
+from rate_limiter import estimate_tokens
+
+DEFAULT_EMBEDDING_DIMENSION = 1536
+DEFAULT_TOKENS_PER_SECOND = 80.0
+DEFAULT_OUTPUT_TOKENS = 64
+
+# Vocabulary used to build deterministic completions
+_VOCABULARY = (
+    "bedrock model retrieval context answer embedding vector document query "
+    "foundation generation knowledge latency response system token search "
+    "relevant service provides improves combines uses enables based data"
+).split()
+
+# Catalog returned by list_foundation_models
+FAKE_MODEL_CATALOG = [
+    ("amazon.titan-embed-text-v1", "Titan Embeddings G1 - Text", "Amazon",
+     ["TEXT"], ["EMBEDDING"], ["ON_DEMAND"]),
+    ("amazon.titan-text-express-v1", "Titan Text G1 - Express", "Amazon",
+     ["TEXT"], ["TEXT"], ["ON_DEMAND"]),
+    ("anthropic.claude-3-haiku-20240307-v1:0", "Claude 3 Haiku", "Anthropic",
+     ["TEXT", "IMAGE"], ["TEXT"], ["ON_DEMAND"]),
+    ("anthropic.claude-v2:1", "Claude", "Anthropic",
+     ["TEXT"], ["TEXT"], ["ON_DEMAND"]),
+    ("anthropic.claude-sonnet-4-20250514-v1:0", "Claude Sonnet 4", "Anthropic",
+     ["TEXT", "IMAGE"], ["TEXT"], ["INFERENCE_PROFILE"]),
+    ("meta.llama3-8b-instruct-v1:0", "Llama 3 8B Instruct", "Meta",
+     ["TEXT"], ["TEXT"], ["ON_DEMAND"]),
+    ("mistral.mistral-7b-instruct-v0:2", "Mistral 7B Instruct", "Mistral AI",
+     ["TEXT"], ["TEXT"], ["ON_DEMAND"]),
+]
+
+
+class LatencyModel:
+    """
+    Seeded latency distribution
+
+    Kinds (parameters in seconds):
+        fixed:      value
+        uniform:    low, high
+        normal:     mean, stddev (truncated at zero)
+        lognormal:  median, sigma (sigma of the underlying normal)
+    """
+
+    def __init__(self, kind="fixed", params=(0.0,), seed=0):
+        if kind not in ("fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {kind}")
+        self.kind = kind
+        self.params = tuple(float(p) for p in params)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def parse(cls, spec, seed=0):
+        """
+        Builds a model from a spec such as "lognormal:0.4,0.5" or "0.2"
+
+        Args:
+            spec: "<kind>:<p1>[,<p2>]" or a bare number for a fixed latency
+            seed: Seed of the random generator
+        """
+        if ":" not in spec:
+            return cls("fixed", (float(spec),), seed)
+        kind, params = spec.split(":", 1)
+        return cls(kind.strip(), [p for p in params.split(",") if p.strip()], seed)
+
+    def sample(self):
+        """Returns one latency sample in seconds"""
+        with self._lock:
+            if self.kind == "fixed":
+                return self.params[0]
+            if self.kind == "uniform":
+                return self._random.uniform(self.params[0], self.params[1])
+            if self.kind == "normal":
+                return max(0.0, self._random.gauss(self.params[0], self.params[1]))
+            return self.params[0] * math.exp(self._random.gauss(0.0, self.params[1]))
+
+
+def _throttling_error(operation):
+    return ClientError(
+        {
+            'Error': {'Code': 'ThrottlingException', 'Message': 'Rate exceeded (simulated)'},
+            'ResponseMetadata': {'HTTPStatusCode': 429},
+        },
+        operation
+    )
+
+
+class FakeBedrock:
+    """
+    Fake client implementing the Bedrock operations used in this project
+
+    One instance can stand in for both the 'bedrock-runtime' and the
+    'bedrock' client. It is thread-safe.
+    """
+
+    def __init__(self, latency=None, tokens_per_second=DEFAULT_TOKENS_PER_SECOND,
+                 throttle_rate=0.0, output_tokens=DEFAULT_OUTPUT_TOKENS,
+                 embedding_dimension=DEFAULT_EMBEDDING_DIMENSION, seed=0, sleep=time.sleep,
+                 max_concurrency=None):
+        """
+        Args:
+            latency: LatencyModel for the time to first byte (default: none)
+            tokens_per_second: Output token rate for generation
+            throttle_rate: Probability of raising ThrottlingException per call
+            output_tokens: Tokens generated when the request sets no limit below it
+            embedding_dimension: Size of the returned embeddings
+            seed: Seed for throttling decisions
+            sleep: Sleep function (replace to run without real delays)
+            max_concurrency: Throttle invoke_model calls beyond this many in
+                flight, like a Bedrock quota (None for no quota)
+        """
+        self.latency = latency or LatencyModel("fixed", (0.0,))
+        self.tokens_per_second = tokens_per_second
+        self.throttle_rate = throttle_rate
+        self.output_tokens = output_tokens
+        self.embedding_dimension = embedding_dimension
+        self.sleep = sleep
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._word_vectors = {}
+        self.calls = 0
+        self.throttles = 0
+
+    @classmethod
+    def from_env(cls):
+        """Builds a fake configured from the BEDROCK_FAKE_* environment variables"""
+        seed = int(os.environ.get("BEDROCK_FAKE_SEED", "0"))
+        return cls(
+            latency=LatencyModel.parse(os.environ.get("BEDROCK_FAKE_LATENCY", "0"), seed),
+            tokens_per_second=float(os.environ.get("BEDROCK_FAKE_TOKENS_PER_SECOND",
+                                                   str(DEFAULT_TOKENS_PER_SECOND))),
+            throttle_rate=float(os.environ.get("BEDROCK_FAKE_THROTTLE_RATE", "0")),
+            output_tokens=int(os.environ.get("BEDROCK_FAKE_OUTPUT_TOKENS",
+                                             str(DEFAULT_OUTPUT_TOKENS))),
+            seed=seed,
+            max_concurrency=int(os.environ.get("BEDROCK_FAKE_MAX_CONCURRENCY", "0")) or None
+        )
+
+    def _admit(self, operation, concurrent=False):
+        """
+        Counts the call and raises ThrottlingException at the configured rate
+
+        With `concurrent`, the call also takes an in-flight slot (release it
+        with `_leave`) and is throttled when the quota is full.
+        """
+        with self._lock:
+            self.calls += 1
+            throttled = self.throttle_rate > 0 and self._random.random() < self.throttle_rate
+            if concurrent and not throttled:
+                throttled = self.max_concurrency is not None and self.in_flight >= self.max_concurrency
+                if not throttled:
+                    self.in_flight += 1
+            if throttled:
+                self.throttles += 1
+        if throttled:
+            raise _throttling_error(operation)
+
+    def _leave(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    # Deterministic content -------------------------------------------------
+
+    def _word_vector(self, word):
+        with self._lock:
+            vector = self._word_vectors.get(word)
+        if vector is None:
+            seed = int.from_bytes(hashlib.sha256(word.encode('utf-8')).digest()[:8], 'little')
+            vector = np.random.default_rng(seed).standard_normal(self.embedding_dimension)
+            with self._lock:
+                if len(self._word_vectors) < 100000:
+                    self._word_vectors[word] = vector
+        return vector
+
+    def embed(self, text):
+        """
+        Deterministic embedding: normalized sum of per-word random vectors,
+        so texts sharing words end up close in cosine similarity
+        """
+        words = [w.strip(".,;:!?()\"'").lower() for w in text.split()]
+        vector = np.zeros(self.embedding_dimension)
+        for word in words:
+            if word:
+                vector += self._word_vector(word)
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector.astype(np.float32).tolist()
+
+    def complete(self, prompt, max_tokens):
+        """Deterministic completion of `max_tokens` words for a prompt"""
+        seed = int.from_bytes(hashlib.sha256(prompt.encode('utf-8')).digest()[:8], 'little')
+        rng = random.Random(seed)
+        count = max(1, min(max_tokens, self.output_tokens))
+        return " ".join(rng.choice(_VOCABULARY) for _ in range(count)) + "."
+
+    # Request / response shapes ---------------------------------------------
+
+    @staticmethod
+    def _family(model_id):
+        model = model_id.lower()
+        if 'claude' in model:
+            return 'claude-3' if 'claude-3' in model else 'claude-v2'
+        if 'titan' in model:
+            return 'titan-embed' if 'embed' in model else 'titan-text'
+        if 'llama' in model:
+            return 'llama'
+        if 'mistral' in model:
+            return 'mistral'
+        return None
+
+    @staticmethod
+    def _prompt_and_limit(family, request):
+        if family == 'claude-3':
+            parts = []
+            for message in request.get('messages', []):
+                content = message.get('content', '')
+                if isinstance(content, list):
+                    content = " ".join(block.get('text', '') for block in content)
+                parts.append(content)
+            return request.get('system', '') + "\n".join(parts), request.get('max_tokens', 1000)
+        if family == 'claude-v2':
+            return request.get('prompt', ''), request.get('max_tokens_to_sample', 1000)
+        if family == 'titan-text':
+            config = request.get('textGenerationConfig', {})
+            return request.get('inputText', ''), config.get('maxTokenCount', 1000)
+        if family == 'llama':
+            return request.get('prompt', ''), request.get('max_gen_len', 1000)
+        return request.get('prompt', ''), request.get('max_tokens', 1000)
+
+    @staticmethod
+    def _response_body(family, text, input_tokens, output_tokens):
+        if family == 'claude-3':
+            return {
+                'id': 'msg_fake',
+                'type': 'message',
+                'role': 'assistant',
+                'content': [{'type': 'text', 'text': text}],
+                'stop_reason': 'end_turn',
+                'usage': {'input_tokens': input_tokens, 'output_tokens': output_tokens},
+            }
+        if family == 'claude-v2':
+            return {'completion': text, 'stop_reason': 'stop_sequence'}
+        if family == 'titan-text':
+            return {
+                'inputTextTokenCount': input_tokens,
+                'results': [{'tokenCount': output_tokens, 'outputText': text,
+                             'completionReason': 'FINISH'}],
+            }
+        if family == 'llama':
+            return {
+                'generation': text,
+                'prompt_token_count': input_tokens,
+                'generation_token_count': output_tokens,
+                'stop_reason': 'stop',
+            }
+        return {'outputs': [{'text': text, 'stop_reason': 'stop'}]}
+
+    @staticmethod
+    def _stream_chunks(family, pieces, input_tokens):
+        if family == 'claude-3':
+            yield {'type': 'message_start',
+                   'message': {'role': 'assistant', 'usage': {'input_tokens': input_tokens}}}
+            yield {'type': 'content_block_start', 'index': 0,
+                   'content_block': {'type': 'text', 'text': ''}}
+            for piece in pieces:
+                yield {'type': 'content_block_delta', 'index': 0,
+                       'delta': {'type': 'text_delta', 'text': piece}}
+            yield {'type': 'content_block_stop', 'index': 0}
+            yield {'type': 'message_delta', 'delta': {'stop_reason': 'end_turn'},
+                   'usage': {'output_tokens': len(pieces)}}
+            yield {'type': 'message_stop',
+                   'amazon-bedrock-invocationMetrics': {
+                       'inputTokenCount': input_tokens,
+                       'outputTokenCount': len(pieces)}}
+        elif family == 'claude-v2':
+            for piece in pieces:
+                yield {'completion': piece, 'stop_reason': None}
+        elif family == 'titan-text':
+            for piece in pieces:
+                yield {'outputText': piece, 'index': 0}
+        elif family == 'llama':
+            for piece in pieces:
+                yield {'generation': piece}
+        else:
+            for piece in pieces:
+                yield {'outputs': [{'text': piece, 'stop_reason': None}]}
+
+    @staticmethod
+    def _metadata(input_tokens, output_tokens, latency):
+        return {
+            'HTTPStatusCode': 200,
+            'HTTPHeaders': {
+                'x-amzn-bedrock-input-token-count': str(input_tokens),
+                'x-amzn-bedrock-output-token-count': str(output_tokens),
+                'x-amzn-bedrock-invocation-latency': str(int(latency * 1000)),
+            },
+        }
+
+    def _parse(self, operation, modelId, body):
+        family = self._family(modelId)
+        if family is None:
+            raise ClientError(
+                {'Error': {'Code': 'ValidationException',
+                           'Message': f'Model not available in the fake: {modelId}'}},
+                operation
+            )
+        if isinstance(body, bytes):
+            body = body.decode('utf-8')
+        return family, json.loads(body)
+
+    # Client API ------------------------------------------------------------
+
+    def invoke_model(self, modelId, body, contentType='application/json',
+                     accept='application/json', **kwargs):
+        """Simulates bedrock-runtime InvokeModel"""
+        self._admit('InvokeModel', concurrent=True)
+        try:
+            return self._invoke_model(modelId, body)
+        finally:
+            self._leave()
+
+    def _invoke_model(self, modelId, body):
+        family, request = self._parse('InvokeModel', modelId, body)
+        started = time.perf_counter()
+        self.sleep(self.latency.sample())
+
+        if family == 'titan-embed':
+            text = request.get('inputText', '')
+            input_tokens = estimate_tokens(text)
+            output_tokens = 0
+            response_body = {'embedding': self.embed(text), 'inputTextTokenCount': input_tokens}
+        else:
+            prompt, limit = self._prompt_and_limit(family, request)
+            text = self.complete(prompt, limit)
+            input_tokens = estimate_tokens(prompt)
+            output_tokens = len(text.split())
+            if self.tokens_per_second > 0:
+                self.sleep(output_tokens / self.tokens_per_second)
+            response_body = self._response_body(family, text, input_tokens, output_tokens)
+
+        return {
+            'body': io.BytesIO(json.dumps(response_body).encode('utf-8')),
+            'contentType': 'application/json',
+            'ResponseMetadata': self._metadata(
+                input_tokens, output_tokens, time.perf_counter() - started),
+        }
+
+    def invoke_model_with_response_stream(self, modelId, body, contentType='application/json',
+                                          accept='application/json', **kwargs):
+        """Simulates bedrock-runtime InvokeModelWithResponseStream"""
+        self._admit('InvokeModelWithResponseStream')
+        family, request = self._parse('InvokeModelWithResponseStream', modelId, body)
+        prompt, limit = self._prompt_and_limit(family, request)
+        words = self.complete(prompt, limit).split()
+        pieces = [words[0]] + [" " + word for word in words[1:]]
+        input_tokens = estimate_tokens(prompt)
+        first_byte = self.latency.sample()
+
+        def events():
+            self.sleep(first_byte)
+            for i, chunk in enumerate(self._stream_chunks(family, pieces, input_tokens)):
+                if i and self.tokens_per_second > 0:
+                    self.sleep(1.0 / self.tokens_per_second)
+                yield {'chunk': {'bytes': json.dumps(chunk).encode('utf-8')}}
+
+        return {
+            'body': events(),
+            'contentType': 'application/json',
+            'ResponseMetadata': self._metadata(input_tokens, len(pieces), first_byte),
+        }
+
+    def list_foundation_models(self, **kwargs):
+        """Simulates bedrock ListFoundationModels"""
+        self._admit('ListFoundationModels')
+        self.sleep(self.latency.sample())
+        return {
+            'modelSummaries': [
+                {
+                    'modelId': model_id,
+                    'modelArn': f"arn:aws:bedrock:us-east-1::foundation-model/{model_id}",
+                    'modelName': name,
+                    'providerName': provider,
+                    'inputModalities': inputs,
+                    'outputModalities': outputs,
+                    'responseStreamingSupported': 'EMBEDDING' not in outputs,
+                    'inferenceTypesSupported': inference_types,
+                    'modelLifecycle': {'status': 'ACTIVE'},
+                }
+                for model_id, name, provider, inputs, outputs, inference_types in FAKE_MODEL_CATALOG
+            ]
+        }
+
+    def stats(self):
+        """Returns the call and throttle counters"""
+        with self._lock:
+            return {'calls': self.calls, 'throttles': self.throttles}
@@ -0,0 +1,481 @@
+"""
+Streaming document ingestion
+Reads directories of .txt, .md and .jsonl files, splits them into
+overlapping chunks, drops duplicates and writes them to the Chroma
+collection in batches. Files are read block by block and only one batch is
+held in memory, so memory use does not grow with the corpus.
+
+With --processes, chunks are routed by id to one writer process per shard
+(see sharding), which embeds and writes them to its own shard directory;
+chunking stays streaming in the main process, so memory remains bounded.
+
+Usage:
+    python ingest.py docs/ notes.md data.jsonl --persist-dir ./chroma
+    python ingest.py docs/ --persist-dir ./chroma --shards 4 --processes
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from vector_store import CHROMA_PERSIST_DIR, COLLECTION_NAME, VECTOR_SHARDS, content_hash, upsert_documents
+
+# Chunking and batching tunables (sizes in characters)
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_CHUNK_OVERLAP = 200
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_EXTENSIONS = ('.txt', '.md', '.jsonl')
+DEFAULT_TEXT_FIELD = "text"
+
+# Number of recent chunk hashes remembered to drop duplicates before the
+# store is consulted (the store itself dedupes by content-addressed id)
+DEFAULT_DEDUPE_WINDOW = 100_000
+
+READ_BLOCK_SIZE = 64 * 1024
+PROGRESS_INTERVAL = 1.0
+
+# Batches queued per shard writer before the router waits for one to finish
+MAX_PENDING_BATCHES = 2
+
+
+def iter_files(paths, extensions=DEFAULT_EXTENSIONS):
+    """
+    Yields the files to ingest, walking directories in sorted order
+
+    Args:
+        paths: Files and/or directories
+        extensions: File extensions to include when walking directories
+
+    Yields:
+        File paths
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(tuple(extensions)):
+                        yield os.path.join(root, name)
+        elif os.path.isfile(path):
+            yield path
+        else:
+            print(f"[WARNING] Not found: {path}")
+
+
+def chunk_stream(blocks, chunk_size=DEFAULT_CHUNK_SIZE, overlap=DEFAULT_CHUNK_OVERLAP):
+    """
+    Splits a stream of text blocks into overlapping chunks
+
+    Chunks end at the last whitespace before `chunk_size` when there is one,
+    and the next chunk starts `overlap` characters earlier on a word boundary.
+
+    Args:
+        blocks: Iterable of text blocks (e.g. successive reads of a file)
+        chunk_size: Maximum chunk length in characters
+        overlap: Characters shared by consecutive chunks
+
+    Yields:
+        Chunks of text
+    """
+    if not 0 <= overlap < chunk_size:
+        raise ValueError("overlap must be at least 0 and smaller than chunk_size")
+
+    buffer = ""
+    # Characters at the start of the buffer already emitted in the last chunk
+    carried = 0
+    for block in blocks:
+        buffer += block
+        while len(buffer) > chunk_size:
+            cut = buffer.rfind(" ", chunk_size // 2, chunk_size)
+            if cut <= 0:
+                cut = chunk_size
+            chunk = buffer[:cut].strip()
+            if chunk:
+                yield chunk
+            start = max(cut - overlap, 1)
+            if overlap:
+                boundary = buffer.find(" ", start, cut)
+                if boundary != -1:
+                    start = boundary + 1
+            carried = max(0, cut - start)
+            buffer = buffer[start:]
+
+    # The tail is emitted if it holds any text after the carried overlap
+    tail = buffer.strip()
+    if tail and buffer[carried:].strip():
+        yield tail
+
+
+def read_blocks(path, block_size=READ_BLOCK_SIZE):
+    """Yields a text file in blocks of `block_size` characters"""
+    with open(path, encoding='utf-8', errors='replace') as handle:
+        for block in iter(lambda: handle.read(block_size), ''):
+            yield block.replace("\r\n", "\n")
+
+
+def read_jsonl(path, text_field=DEFAULT_TEXT_FIELD):
+    """
+    Yields the text of every record of a JSONL file
+
+    Records may be JSON strings or objects holding the text in `text_field`;
+    malformed lines are reported and skipped.
+    """
+    with open(path, encoding='utf-8', errors='replace') as handle:
+        for line_number, line in enumerate(handle, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"[WARNING] {path}:{line_number}: invalid JSON ({e})")
+                continue
+            text = record if isinstance(record, str) else record.get(text_field) if isinstance(record, dict) else None
+            if isinstance(text, str) and text.strip():
+                yield text
+            else:
+                print(f"[WARNING] {path}:{line_number}: no '{text_field}' text")
+
+
+def iter_chunks(paths, chunk_size=DEFAULT_CHUNK_SIZE, overlap=DEFAULT_CHUNK_OVERLAP,
+                extensions=DEFAULT_EXTENSIONS, text_field=DEFAULT_TEXT_FIELD, stats=None):
+    """
+    Yields every chunk of every file
+
+    Args:
+        paths: Files and/or directories
+        chunk_size: Maximum chunk length in characters
+        overlap: Characters shared by consecutive chunks
+        extensions: File extensions to include when walking directories
+        text_field: Field holding the text of JSONL records
+        stats: Optional dict whose 'files' count is updated
+
+    Yields:
+        Tuples (chunk text, metadata dict with 'source' and 'chunk')
+    """
+    for path in iter_files(paths, extensions):
+        if stats is not None:
+            stats['files'] = stats.get('files', 0) + 1
+        if path.lower().endswith('.jsonl'):
+            texts = (chunk_stream([text], chunk_size, overlap) for text in read_jsonl(path, text_field))
+        else:
+            texts = [chunk_stream(read_blocks(path), chunk_size, overlap)]
+        index = 0
+        for chunks in texts:
+            for chunk in chunks:
+                yield chunk, {'source': path, 'chunk': index}
+                index += 1
+
+
+def batched(iterable, size):
+    """Yields lists of at most `size` items"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def ingest(collection, paths, chunk_size=DEFAULT_CHUNK_SIZE, overlap=DEFAULT_CHUNK_OVERLAP,
+           batch_size=DEFAULT_BATCH_SIZE, extensions=DEFAULT_EXTENSIONS,
+           text_field=DEFAULT_TEXT_FIELD, dedupe_window=DEFAULT_DEDUPE_WINDOW, verbose=True):
+    """
+    Ingests files into a Chroma collection
+
+    Each batch is deduplicated, then embedded (by the collection's embedding
+    function) and added in one call; chunks already stored are skipped
+    without being embedded.
+
+    Args:
+        collection: The Chroma collection
+        paths: Files and/or directories
+        chunk_size: Maximum chunk length in characters
+        overlap: Characters shared by consecutive chunks
+        batch_size: Chunks embedded and added per call
+        extensions: File extensions to include when walking directories
+        text_field: Field holding the text of JSONL records
+        dedupe_window: Recent chunk hashes remembered across batches
+        verbose: Print progress
+
+    Returns:
+        Dict with files, chunks, added, duplicates, skipped, seconds and
+        docs_per_second
+    """
+    stats = {'files': 0, 'chunks': 0, 'added': 0, 'duplicates': 0, 'skipped': 0}
+    seen = OrderedDict()
+    started = last_report = time.perf_counter()
+
+    chunks = iter_chunks(paths, chunk_size, overlap, extensions, text_field, stats)
+    for batch in batched(chunks, batch_size):
+        stats['chunks'] += len(batch)
+        docs, metadatas = [], []
+        for text, metadata in batch:
+            digest = content_hash(text)
+            if digest in seen:
+                seen.move_to_end(digest)
+                stats['duplicates'] += 1
+                continue
+            seen[digest] = None
+            if len(seen) > dedupe_window:
+                seen.popitem(last=False)
+            docs.append(text)
+            metadatas.append(metadata)
+
+        if docs:
+            added, skipped = upsert_documents(collection, docs, metadatas=metadatas)
+            stats['added'] += added
+            stats['skipped'] += skipped
+
+        now = time.perf_counter()
+        if verbose and now - last_report >= PROGRESS_INTERVAL:
+            last_report = now
+            _print_progress(stats, now - started)
+
+    # Collections that buffer writes (the numpy backend) persist them now
+    flush = getattr(collection, 'flush', None)
+    if flush is not None:
+        flush()
+    stats['seconds'] = time.perf_counter() - started
+    stats['docs_per_second'] = stats['chunks'] / stats['seconds'] if stats['seconds'] > 0 else 0.0
+    if verbose:
+        _print_progress(stats, stats['seconds'])
+    return stats
+
+
+# The shard a writer process owns (set by _open_shard)
+_shard_system = None
+
+
+def _open_shard(persist_directory, collection_name, shard, shards, vector_backend):
+    """Opens the collection of one shard in a writer process"""
+    global _shard_system
+    from rag_system import EMBEDDING_CACHE_PATH, RAGSystem
+    from sharding import shard_directory, shard_name
+
+    # One embedding cache file per writer: writers sharing a SQLite file
+    # contend for its write lock, and each would track a stale size
+    cache_path = None
+    if EMBEDDING_CACHE_PATH:
+        root, extension = os.path.splitext(EMBEDDING_CACHE_PATH)
+        cache_path = shard_name(root, shard, shards) + extension
+    _shard_system = RAGSystem(
+        persist_directory=shard_directory(persist_directory, shard, shards),
+        embedding_cache_path=cache_path,
+        load_samples=False,
+        collection_name=shard_name(collection_name, shard, shards),
+        vector_backend=vector_backend,
+        semantic_cache=False,
+        shards=1
+    )
+    _shard_system.collection
+
+
+def _write_shard(docs, metadatas):
+    """Embeds and writes one batch to the writer's shard"""
+    return upsert_documents(_shard_system.collection, docs, metadatas=metadatas)
+
+
+def _close_shard():
+    """Persists collections that buffer writes (pool workers skip atexit)"""
+    flush = getattr(_shard_system.chroma_client, 'flush', None)
+    if flush is not None:
+        flush()
+
+
+def ingest_sharded(paths, persist_directory, collection_name=COLLECTION_NAME, shards=VECTOR_SHARDS,
+                   chunk_size=DEFAULT_CHUNK_SIZE, overlap=DEFAULT_CHUNK_OVERLAP,
+                   batch_size=DEFAULT_BATCH_SIZE, extensions=DEFAULT_EXTENSIONS,
+                   text_field=DEFAULT_TEXT_FIELD, dedupe_window=DEFAULT_DEDUPE_WINDOW,
+                   vector_backend=None, verbose=True):
+    """
+    Ingests files into a sharded persistent store with one process per shard
+
+    This process streams the chunks (as ingest() does), drops duplicates and
+    routes every chunk by its id to the writer process of its shard, which
+    embeds and writes batches to the shard's own directory. At most
+    MAX_PENDING_BATCHES + 1 batches per shard are held at a time.
+
+    Args:
+        paths: Files and/or directories
+        persist_directory: Store directory (one subdirectory per shard)
+        collection_name: Name of the sharded collection
+        shards: Number of shards (one writer process each)
+        chunk_size: Maximum chunk length in characters
+        overlap: Characters shared by consecutive chunks
+        batch_size: Chunks embedded and added per writer call
+        extensions: File extensions to include when walking directories
+        text_field: Field holding the text of JSONL records
+        dedupe_window: Recent chunk hashes remembered across files
+        vector_backend: "chroma" or "numpy" (defaults to VECTOR_BACKEND)
+        verbose: Print progress
+
+    Returns:
+        Dict like ingest() plus the chunks added per shard
+    """
+    if not persist_directory:
+        raise ValueError("Ingesting with writer processes needs a persist directory")
+    if not 0 <= overlap < chunk_size:
+        raise ValueError("overlap must be at least 0 and smaller than chunk_size")
+    from sharding import shard_of
+
+    stats = {'files': 0, 'chunks': 0, 'added': 0, 'duplicates': 0, 'skipped': 0,
+             'added_per_shard': [0] * shards}
+    seen = OrderedDict()
+    started = last_report = time.perf_counter()
+
+    # Spawned, not forked: the parent may already run client threads
+    context = multiprocessing.get_context("spawn")
+    writers = [
+        ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=_open_shard,
+                            initargs=(persist_directory, collection_name, shard, shards, vector_backend))
+        for shard in range(shards)
+    ]
+    batches = [([], []) for _ in range(shards)]
+    pending = [deque() for _ in range(shards)]
+
+    def collect(shard, future):
+        added, skipped = future.result()
+        stats['added'] += added
+        stats['skipped'] += skipped
+        stats['added_per_shard'][shard] += added
+
+    def submit(shard):
+        docs, metadatas = batches[shard]
+        if not docs:
+            return
+        batches[shard] = ([], [])
+        pending[shard].append(writers[shard].submit(_write_shard, docs, metadatas))
+        while len(pending[shard]) > MAX_PENDING_BATCHES:
+            collect(shard, pending[shard].popleft())
+
+    try:
+        for text, metadata in iter_chunks(paths, chunk_size, overlap, extensions, text_field, stats):
+            stats['chunks'] += 1
+            digest = content_hash(text)
+            if digest in seen:
+                seen.move_to_end(digest)
+                stats['duplicates'] += 1
+                continue
+            seen[digest] = None
+            if len(seen) > dedupe_window:
+                seen.popitem(last=False)
+            # Same content-addressed id as upsert_documents
+            shard = shard_of(f"doc_{digest[:32]}", shards)
+            batches[shard][0].append(text)
+            batches[shard][1].append(metadata)
+            if len(batches[shard][0]) >= batch_size:
+                submit(shard)
+
+            now = time.perf_counter()
+            if verbose and now - last_report >= PROGRESS_INTERVAL:
+                last_report = now
+                _print_progress(stats, now - started)
+
+        for shard in range(shards):
+            submit(shard)
+        for shard in range(shards):
+            while pending[shard]:
+                collect(shard, pending[shard].popleft())
+        for writer in writers:
+            writer.submit(_close_shard).result()
+    finally:
+        for writer in writers:
+            writer.shutdown(cancel_futures=True)
+
+    stats['seconds'] = time.perf_counter() - started
+    stats['docs_per_second'] = stats['chunks'] / stats['seconds'] if stats['seconds'] > 0 else 0.0
+    if verbose:
+        _print_progress(stats, stats['seconds'])
+    return stats
+
+
+def _print_progress(stats, elapsed):
+    rate = stats['chunks'] / elapsed if elapsed > 0 else 0.0
+    print(f"[INGEST] {stats['files']} files, {stats['chunks']} chunks: "
+          f"{stats['added']} added, {stats['skipped']} already stored, "
+          f"{stats['duplicates']} duplicates ({rate:.1f} docs/s)")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest text, Markdown and JSONL files into the RAG collection")
+    parser.add_argument("paths", nargs="+", help="Files or directories to ingest")
+    parser.add_argument("--persist-dir", default=CHROMA_PERSIST_DIR,
+                        help="Chroma directory (default: CHROMA_PERSIST_DIR)")
+    parser.add_argument("--collection", default=COLLECTION_NAME, help="Collection name")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="Maximum chunk length in characters")
+    parser.add_argument("--overlap", type=int, default=DEFAULT_CHUNK_OVERLAP,
+                        help="Characters shared by consecutive chunks")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="Chunks embedded and added per batch")
+    parser.add_argument("--text-field", default=DEFAULT_TEXT_FIELD,
+                        help="Field holding the text of JSONL records")
+    parser.add_argument("--extensions", default=",".join(DEFAULT_EXTENSIONS),
+                        help="Comma-separated extensions to include from directories")
+    parser.add_argument("--shards", type=int, default=VECTOR_SHARDS,
+                        help="Collections the chunks are partitioned across (default: VECTOR_SHARDS)")
+    parser.add_argument("--processes", action="store_true",
+                        help="Write every shard from its own process (needs --persist-dir)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.persist_dir:
+        print("[WARNING] No --persist-dir or CHROMA_PERSIST_DIR: the collection is kept in memory only")
+
+    extensions = tuple(ext.strip() for ext in args.extensions.split(",") if ext.strip())
+    try:
+        if args.processes:
+            stats = ingest_sharded(
+                args.paths,
+                args.persist_dir,
+                collection_name=args.collection,
+                shards=args.shards,
+                chunk_size=args.chunk_size,
+                overlap=args.overlap,
+                batch_size=args.batch_size,
+                extensions=extensions,
+                text_field=args.text_field
+            )
+        else:
+            # Imported here so that --help does not load chromadb
+            from rag_system import RAGSystem
+
+            system = RAGSystem(
+                persist_directory=args.persist_dir,
+                load_samples=False,
+                collection_name=args.collection,
+                shards=args.shards
+            )
+            stats = ingest(
+                system.collection,
+                args.paths,
+                chunk_size=args.chunk_size,
+                overlap=args.overlap,
+                batch_size=args.batch_size,
+                extensions=extensions,
+                text_field=args.text_field
+            )
+    except ValueError as e:
+        print(f"[ERROR] {e}")
+        return 1
+    except Exception as e:
+        print(f"[ERROR] Error ingesting documents: {e}")
+        return 1
+    print(f"[OK] Ingested {stats['added']} new chunks in {stats['seconds']:.2f}s "
+          f"({stats['docs_per_second']:.1f} docs/s)")
+    if 'added_per_shard' in stats and len(stats['added_per_shard']) > 1:
+        print(f"[SHARDS] Chunks added per shard: {stats['added_per_shard']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
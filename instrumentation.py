@@ -0,0 +1,370 @@
+"""
+Tracing and metrics hooks for the RAG hot path
+Span-style timings, retry/error counters and Bedrock token counts, with a
+no-op default and exporters for log lines, Prometheus text format and an
+in-memory collector for tests
+
+Enable from the environment with RAG_INSTRUMENTATION, a comma-separated
+list of exporters: "log" and/or "prometheus[:port]".
+"""
+
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_PROMETHEUS_PORT = 9464
+
+# Histogram buckets for span durations (seconds)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def parse_token_usage(response, response_body=None):
+    """
+    Extracts input/output token counts from a Bedrock invoke_model response
+
+    The x-amzn-bedrock-*-token-count headers are used when present, falling
+    back to the usage fields of each provider's response body.
+
+    Args:
+        response: The invoke_model response dict
+        response_body: The decoded JSON body (optional)
+
+    Returns:
+        Tuple (input tokens, output tokens); unknown counts are None
+    """
+    headers = response.get('ResponseMetadata', {}).get('HTTPHeaders', {})
+    input_tokens = headers.get('x-amzn-bedrock-input-token-count')
+    output_tokens = headers.get('x-amzn-bedrock-output-token-count')
+    if input_tokens is not None or output_tokens is not None:
+        return (int(input_tokens) if input_tokens is not None else None,
+                int(output_tokens) if output_tokens is not None else None)
+
+    body = response_body or {}
+    if 'usage' in body:
+        # Claude 3 messages API
+        return body['usage'].get('input_tokens'), body['usage'].get('output_tokens')
+    if 'inputTextTokenCount' in body:
+        # Titan text and embeddings
+        results = body.get('results') or [{}]
+        return body['inputTextTokenCount'], results[0].get('tokenCount')
+    if 'prompt_token_count' in body:
+        # Llama
+        return body['prompt_token_count'], body.get('generation_token_count')
+    return None, None
+
+
+class _NullSpan:
+    """Span returned by the no-op instrumentation"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+    def set(self, key, value):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Instrumentation:
+    """
+    No-op instrumentation (the default)
+
+    Every hook returns immediately, so instrumented code pays one method
+    call per hook when nothing is listening.
+    """
+
+    enabled = False
+
+    def span(self, name, **attributes):
+        """Returns a context manager timing one operation"""
+        return _NULL_SPAN
+
+    def increment(self, name, value=1, **labels):
+        """Adds `value` to a counter"""
+
+    def record_response(self, model_id, response, response_body=None):
+        """Counts the tokens and retries reported by a Bedrock response"""
+
+
+class Span:
+    """A timed operation reported to the exporters when it ends"""
+
+    __slots__ = ('instrumentation', 'name', 'attributes', 'started', 'duration', 'error')
+
+    def __init__(self, instrumentation, name, attributes):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.attributes = attributes
+        self.started = None
+        self.duration = None
+        self.error = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.duration = time.perf_counter() - self.started
+        if exc_type is not None:
+            self.error = exc_type.__name__
+            self.instrumentation.increment('errors_total', span=self.name, error=self.error)
+        self.instrumentation.finish(self)
+        return False
+
+    def set(self, key, value):
+        """Attaches an attribute to the span"""
+        self.attributes[key] = value
+
+
+class MetricsInstrumentation(Instrumentation):
+    """Instrumentation that forwards spans and counters to exporters"""
+
+    enabled = True
+
+    def __init__(self, exporters=()):
+        self.exporters = list(exporters)
+
+    def span(self, name, **attributes):
+        return Span(self, name, attributes)
+
+    def finish(self, span):
+        for exporter in self.exporters:
+            exporter.export_span(span)
+
+    def increment(self, name, value=1, **labels):
+        if not value:
+            return
+        for exporter in self.exporters:
+            exporter.export_counter(name, value, labels)
+
+    def record_response(self, model_id, response, response_body=None):
+        input_tokens, output_tokens = parse_token_usage(response, response_body)
+        if input_tokens:
+            self.increment('bedrock_input_tokens_total', input_tokens, model=model_id)
+        if output_tokens:
+            self.increment('bedrock_output_tokens_total', output_tokens, model=model_id)
+        retries = response.get('ResponseMetadata', {}).get('RetryAttempts', 0)
+        if retries:
+            self.increment('bedrock_retries_total', retries, model=model_id)
+
+
+class LogExporter:
+    """Writes one line per span and counter update"""
+
+    def __init__(self, write=print, counters=False):
+        """
+        Args:
+            write: Function receiving each line
+            counters: Also log counter updates
+        """
+        self.write = write
+        self.counters = counters
+
+    def export_span(self, span):
+        attributes = " ".join(f"{key}={value}" for key, value in span.attributes.items())
+        status = f" error={span.error}" if span.error else ""
+        self.write(f"[TRACE] {span.name} {span.duration * 1000:.1f}ms {attributes}{status}".rstrip())
+
+    def export_counter(self, name, value, labels):
+        if self.counters:
+            rendered = " ".join(f"{key}={value}" for key, value in labels.items())
+            self.write(f"[METRIC] {name} +{value} {rendered}".rstrip())
+
+
+class InMemoryCollector:
+    """Keeps every span and counter in memory (for tests and benchmarks)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.spans = []
+        self.counters = {}
+
+    def export_span(self, span):
+        with self._lock:
+            self.spans.append({
+                'name': span.name,
+                'duration': span.duration,
+                'attributes': dict(span.attributes),
+                'error': span.error,
+            })
+
+    def export_counter(self, name, value, labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def counter(self, name, **labels):
+        """Returns a counter value; without labels, the sum over all label sets"""
+        with self._lock:
+            if labels:
+                return self.counters.get((name, tuple(sorted(labels.items()))), 0)
+            return sum(value for (key, _), value in self.counters.items() if key == name)
+
+    def span_durations(self, name):
+        """Returns the durations of every finished span with this name"""
+        with self._lock:
+            return [span['duration'] for span in self.spans if span['name'] == name]
+
+    def clear(self):
+        with self._lock:
+            self.spans.clear()
+            self.counters.clear()
+
+
+def _metric_name(name):
+    return name.replace('.', '_').replace('-', '_')
+
+
+def _render_labels(labels):
+    if not labels:
+        return ""
+    rendered = ",".join(
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels
+    )
+    return "{" + rendered + "}"
+
+
+class PrometheusExporter:
+    """Aggregates spans into histograms and counters in Prometheus text format"""
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._server = None
+
+    def export_span(self, span):
+        labels = (('span', span.name),)
+        with self._lock:
+            histogram = self._histograms.get(labels)
+            if histogram is None:
+                histogram = self._histograms[labels] = {
+                    'buckets': [0] * len(self.buckets), 'count': 0, 'sum': 0.0}
+            for i, bound in enumerate(self.buckets):
+                if span.duration <= bound:
+                    histogram['buckets'][i] += 1
+            histogram['count'] += 1
+            histogram['sum'] += span.duration
+
+    def export_counter(self, name, value, labels):
+        key = (_metric_name(name), tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def render(self):
+        """Returns every metric in Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            if self._histograms:
+                lines.append("# TYPE rag_span_duration_seconds histogram")
+            for labels, histogram in sorted(self._histograms.items()):
+                for bound, count in zip(self.buckets, histogram['buckets']):
+                    lines.append(f"rag_span_duration_seconds_bucket"
+                                 f"{_render_labels(labels + (('le', bound),))} {count}")
+                lines.append(f"rag_span_duration_seconds_bucket"
+                             f"{_render_labels(labels + (('le', '+Inf'),))} {histogram['count']}")
+                lines.append(f"rag_span_duration_seconds_sum{_render_labels(labels)} {histogram['sum']}")
+                lines.append(f"rag_span_duration_seconds_count{_render_labels(labels)} {histogram['count']}")
+
+            typed = set()
+            for (name, labels), value in sorted(self._counters.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} counter")
+                    typed.add(name)
+                lines.append(f"{name}{_render_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port=DEFAULT_PROMETHEUS_PORT, host="127.0.0.1"):
+        """
+        Serves /metrics from a background thread
+
+        Args:
+            port: TCP port to listen on
+            host: Interface to bind
+
+        Returns:
+            The HTTP server
+        """
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                payload = exporter.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        thread = threading.Thread(target=self._server.serve_forever, name="prometheus-exporter",
+                                  daemon=True)
+        thread.start()
+        return self._server
+
+
+_instrumentation = Instrumentation()
+
+
+def get_instrumentation():
+    """Returns the active instrumentation"""
+    return _instrumentation
+
+
+def set_instrumentation(instrumentation):
+    """
+    Installs an instrumentation for the whole process
+
+    Args:
+        instrumentation: An Instrumentation (None restores the no-op default)
+
+    Returns:
+        The previously active instrumentation
+    """
+    global _instrumentation
+    previous = _instrumentation
+    _instrumentation = instrumentation or Instrumentation()
+    return previous
+
+
+def configure_from_env():
+    """
+    Installs exporters listed in RAG_INSTRUMENTATION ("log", "prometheus[:port]")
+
+    Returns:
+        The active instrumentation
+    """
+    spec = os.environ.get("RAG_INSTRUMENTATION", "").strip()
+    if not spec:
+        return get_instrumentation()
+
+    exporters = []
+    for item in spec.split(","):
+        kind, _, option = item.strip().partition(":")
+        if kind == "log":
+            exporters.append(LogExporter())
+        elif kind == "prometheus":
+            exporter = PrometheusExporter()
+            port = int(option) if option else DEFAULT_PROMETHEUS_PORT
+            exporter.serve(port)
+            print(f"[OK] Prometheus metrics on http://127.0.0.1:{port}/metrics")
+            exporters.append(exporter)
+        elif kind:
+            print(f"[WARNING] Unknown instrumentation exporter: {kind}")
+    set_instrumentation(MetricsInstrumentation(exporters))
+    return get_instrumentation()
@@ -1,163 +1,259 @@
-import boto3
-import json
+import os
+import time
 from botocore.exceptions import ClientError
+from bedrock_clients import client_stats, get_client
+from bedrock_streaming import StreamTimer, stream_text
+from conversation import ConversationMemory, model_summarizer
+from deadlines import (
+    FALLBACK_MODEL, GENERATION_DEADLINE_SECONDS, DeadlineExceeded, deadline_after, fallback_body,
+    fallback_request, get_invoker, text_request
+)
+from instrumentation import configure_from_env, get_instrumentation
+from model_catalog import MODEL_FAMILIES, get_catalog
+from provider_codecs import SamplingParams, get_codec
+from rate_limiter import RateLimitTimeout, estimate_tokens
+from response_cache import ResponseCache
 
+# Sampling parameters of chat requests. Chat replies are sampled, so they
+# bypass the response cache unless RESPONSE_CACHE_SAMPLED=1 (or
+# BEDROCK_CHAT_TEMPERATURE=0). Claude messages requests leave temperature and
+# top_p at Bedrock's defaults unless BEDROCK_CHAT_TEMPERATURE is set; the
+# other providers are sent 0.7 and 0.9
+CHAT_TEMPERATURE = os.environ.get("BEDROCK_CHAT_TEMPERATURE")
+CHAT_SAMPLING = SamplingParams(max_tokens=1000, temperature=float(CHAT_TEMPERATURE or "0.7"), top_p=0.9)
+CLAUDE_CHAT_SAMPLING = SamplingParams(
+    max_tokens=1000,
+    temperature=float(CHAT_TEMPERATURE) if CHAT_TEMPERATURE else None,
+    top_p=None
+)
 
-def list_bedrock_models():
-    """Lists all available models in Amazon Bedrock"""
-    bedrock = boto3.client('bedrock', region_name='us-east-1')
+# Print responses as they stream in (set BEDROCK_STREAMING=0 to disable)
+STREAMING_ENABLED = os.environ.get("BEDROCK_STREAMING", "1") == "1"
 
-    try:
-        response = bedrock.list_foundation_models()
-        models = response.get('modelSummaries', [])
-
-        print("\n" + "=" * 80)
-        print("AVAILABLE MODELS IN AMAZON BEDROCK")
-        print("=" * 80 + "\n")
-
-        # Filter only models that support conversation and on-demand invocation
-        chat_models = []
-        
-        # Models that require inference profiles (exclude these)
-        excluded_models = [
-            'anthropic.claude-sonnet-4',
-            'anthropic.claude-opus-4',
-        ]
-        
-        for idx, model in enumerate(models, 1):
-            model_id = model.get('modelId', 'N/A')
-            model_name = model.get('modelName', 'N/A')
-            provider = model.get('providerName', 'N/A')
-            inference_types = model.get('inferenceTypesSupported', [])
-
-            # Filter chat/conversation models
-            if any(keyword in model_id.lower() for keyword in ['claude', 'llama', 'mistral', 'titan']):
-                # Exclude models that require inference profiles
-                if any(excluded in model_id.lower() for excluded in excluded_models):
-                    continue
-                
-                # Only include models that support ON_DEMAND inference
-                if 'ON_DEMAND' in inference_types or not inference_types:
-                    chat_models.append({
-                        'index': len(chat_models) + 1,
-                        'id': model_id,
-                        'name': model_name,
-                        'provider': provider
-                    })
-                    print(f"{len(chat_models)}. {model_name}")
-                    print(f"   ID: {model_id}")
-                    print(f"   Provider: {provider}")
-                    print()
-
-        if chat_models:
-            print("💡 Note: Only models with on-demand support are shown.\n")
-        
-        return chat_models
+# Generation response cache; sampled (temperature > 0) requests are cached
+# only when RESPONSE_CACHE_SAMPLED is enabled
+RESPONSE_CACHE_PATH = os.environ.get("RESPONSE_CACHE_PATH")
+RESPONSE_CACHE_SAMPLED = os.environ.get("RESPONSE_CACHE_SAMPLED", "0") == "1"
+response_cache = ResponseCache(
+    disk_path=RESPONSE_CACHE_PATH,
+    cache_sampled=RESPONSE_CACHE_SAMPLED
+)
 
+
+def list_bedrock_models():
+    """Lists all available models in Amazon Bedrock (from the cached model catalog)"""
+    try:
+        catalog = get_catalog()
     except ClientError as e:
         print(f"Error listing models: {e}")
         return []
 
+    print("\n" + "=" * 80)
+    print("AVAILABLE MODELS IN AMAZON BEDROCK")
+    print("=" * 80 + "\n")
 
-def chat_with_bedrock(model_id, user_message):
-    """Sends a message to a Bedrock model and gets the response"""
-    bedrock_runtime = boto3.client('bedrock-runtime', region_name='us-east-1')
+    # Filter only models that support conversation and on-demand invocation
+    chat_models = []
 
-    try:
-        if 'claude' in model_id.lower():
-            # Claude v3 and above uses the messages format
-            if 'claude-3' in model_id.lower():
-                body = json.dumps({
-                    "anthropic_version": "bedrock-2023-05-31",
-                    "max_tokens": 1000,
-                    "messages": [
-                        {
-                            "role": "user",
-                            "content": user_message
-                        }
-                    ]
-                })
-            else:
-                # Claude v2 uses the prompt format
-                body = json.dumps({
-                    "prompt": f"\n\nHuman: {user_message}\n\nAssistant:",
-                    "max_tokens_to_sample": 1000,
-                    "temperature": 0.7,
-                    "top_p": 0.9
-                })
-        elif 'titan' in model_id.lower():
-            body = json.dumps({
-                "inputText": user_message,
-                "textGenerationConfig": {
-                    "maxTokenCount": 1000,
-                    "temperature": 0.7,
-                    "topP": 0.9
-                }
-            })
-        elif 'llama' in model_id.lower():
-            body = json.dumps({
-                "prompt": f"<s>[INST] {user_message} [/INST]",
-                "max_gen_len": 1000,
-                "temperature": 0.7,
-                "top_p": 0.9
-            })
-        elif 'mistral' in model_id.lower():
-            body = json.dumps({
-                "prompt": f"<s>[INST] {user_message} [/INST]",
-                "max_tokens": 1000,
-                "temperature": 0.7,
-                "top_p": 0.9
+    # Models that require inference profiles (exclude these)
+    excluded_models = [
+        'anthropic.claude-sonnet-4',
+        'anthropic.claude-opus-4',
+    ]
+
+    # Chat/conversation families, keeping the order Bedrock listed them in
+    candidates = {model['modelId'] for family in MODEL_FAMILIES for model in catalog.by_family(family)}
+    on_demand = {model['modelId'] for model in catalog.with_inference_type('ON_DEMAND')}
+
+    for model in catalog.models():
+        model_id = model.get('modelId', 'N/A')
+        if model_id not in candidates:
+            continue
+
+        # Exclude models that require inference profiles
+        if any(excluded in model_id.lower() for excluded in excluded_models):
+            continue
+
+        # Only include models that support ON_DEMAND inference
+        if model_id in on_demand or not model.get('inferenceTypesSupported'):
+            chat_models.append({
+                'index': len(chat_models) + 1,
+                'id': model_id,
+                'name': model.get('modelName', 'N/A'),
+                'provider': model.get('providerName', 'N/A')
             })
+            print(f"{len(chat_models)}. {chat_models[-1]['name']}")
+            print(f"   ID: {model_id}")
+            print(f"   Provider: {chat_models[-1]['provider']}")
+            print()
+
+    if chat_models:
+        print("💡 Note: Only models with on-demand support are shown.\n")
+
+    return chat_models
+
+
+def chat_sampling(model_id):
+    """Returns the sampling parameters of chat requests to a model"""
+    codec = get_codec(model_id) if model_id else None
+    if codec is not None and codec.name == 'claude-messages':
+        return CLAUDE_CHAT_SAMPLING
+    return CHAT_SAMPLING
+
+
+def build_request_body(model_id, user_message):
+    """
+    Builds the provider-specific request body for a user message
+
+    Returns:
+        The JSON body, or None if the model family is not supported
+    """
+    codec = get_codec(model_id)
+    if codec is None:
+        return None
+    return codec.build_body(user_message, chat_sampling(model_id))
+
+
+def report_client_error(e):
+    """Prints a Bedrock ClientError with a suggestion for the common cases"""
+    error_code = e.response.get('Error', {}).get('Code', 'Unknown')
+    if error_code == 'ValidationException':
+        print(f"Validation error: {e}")
+        print("💡 Suggestion: This model may require inference profiles or may not be available in your region.")
+        print("   Try another model from the list.")
+    elif error_code == 'AccessDeniedException':
+        print(f"Access error: {e}")
+        print("💡 Suggestion: Verify that your account has access to this model in AWS Bedrock.")
+    else:
+        print(f"Error invoking model: {e}")
+
+
+def chat_with_bedrock(model_id, user_message, memory=None):
+    """
+    Sends a message to a Bedrock model and gets the response
+
+    The request is abandoned after BEDROCK_DEADLINE_SECONDS; see deadlines.py
+    for hedging and the fallback model.
+
+    Args:
+        model_id: The chat model
+        user_message: The new user message
+        memory: Optional ConversationMemory; the message is sent with the
+            conversation so far and the completed turn is recorded in it
+    """
+    bedrock_runtime = get_client('bedrock-runtime', region_name='us-east-1')
+
+    try:
+        started = time.perf_counter()
+        deadline = deadline_after(GENERATION_DEADLINE_SECONDS)
+        if memory is not None:
+            body = memory.build_body(user_message, chat_sampling(model_id))
         else:
+            body = build_request_body(model_id, user_message)
+        if body is None:
             print(f"Model not supported in this demo: {model_id}")
             return None
+        usage = {}
+        outcome = {}
 
-        # Invoke the model
-        response = bedrock_runtime.invoke_model(
-            modelId=model_id,
-            body=body,
-            contentType='application/json',
-            accept='application/json'
-        )
-
-        # Parse the response
-        response_body = json.loads(response['body'].read())
-
-        # Extract text according to the provider
-        if 'claude' in model_id.lower():
-            if 'claude-3' in model_id.lower():
-                return response_body['content'][0]['text']
-            else:
-                # Claude v2 uses 'completion'
-                return response_body.get('completion', 'No response')
-        elif 'titan' in model_id.lower():
-            return response_body['results'][0]['outputText']
-        elif 'llama' in model_id.lower():
-            return response_body.get('generation', 'No response')
-        elif 'mistral' in model_id.lower():
-            return response_body.get('outputs', [{}])[0].get('text', 'No response')
+        def invoke():
+            return get_invoker().call(
+                model_id,
+                text_request(bedrock_runtime, model_id, body, deadline, usage),
+                deadline=deadline,
+                fallback=fallback_request(bedrock_runtime, user_message, chat_sampling(FALLBACK_MODEL),
+                                          model_id, deadline=deadline, history=memory),
+                outcome=outcome
+            )
 
-        return str(response_body)
+        with get_instrumentation().span('chat', model=model_id):
+            # A fallback model's reply is not cached as this model's
+            response = response_cache.get_or_generate(model_id, body, invoke,
+                                                      lambda: outcome.get('role') != 'fallback')
+        if memory is not None:
+            memory.add_turn(user_message, response, estimate_tokens(body), usage.get('input_tokens'),
+                            usage.get('output_tokens'), time.perf_counter() - started)
+        return response
 
     except ClientError as e:
-        error_code = e.response.get('Error', {}).get('Code', 'Unknown')
-        if error_code == 'ValidationException':
-            print(f"Validation error: {e}")
-            print("💡 Suggestion: This model may require inference profiles or may not be available in your region.")
-            print("   Try another model from the list.")
-        elif error_code == 'AccessDeniedException':
-            print(f"Access error: {e}")
-            print("💡 Suggestion: Verify that your account has access to this model in AWS Bedrock.")
-        else:
-            print(f"Error invoking model: {e}")
+        report_client_error(e)
+        return None
+    except (DeadlineExceeded, RateLimitTimeout) as e:
+        print(f"Request timed out: {e}")
+        print("💡 Suggestion: Set BEDROCK_FALLBACK_MODEL to a faster model or raise BEDROCK_DEADLINE_SECONDS.")
         return None
     except Exception as e:
         print(f"Unexpected error: {e}")
         return None
 
 
+def chat_with_bedrock_stream(model_id, user_message, memory=None):
+    """
+    Sends a message to a Bedrock model and yields the response as it streams
+
+    The stream keeps to the same deadline and fallback model as
+    chat_with_bedrock (see bedrock_streaming.stream_text).
+
+    Args:
+        model_id: The chat model
+        user_message: The new user message
+        memory: Optional ConversationMemory (see chat_with_bedrock)
+
+    Yields:
+        Text chunks as they arrive (nothing if the request fails)
+    """
+    bedrock_runtime = get_client('bedrock-runtime', region_name='us-east-1')
+
+    try:
+        started = time.perf_counter()
+        deadline = deadline_after(GENERATION_DEADLINE_SECONDS)
+        if memory is not None:
+            body = memory.build_body(user_message, chat_sampling(model_id))
+        else:
+            body = build_request_body(model_id, user_message)
+        if body is None:
+            print(f"Model not supported in this demo: {model_id}")
+            return
+        usage = {}
+        chunks = []
+        fallback = fallback_body(user_message, chat_sampling(FALLBACK_MODEL), model_id, history=memory)
+        outcome = {}
+
+        with get_instrumentation().span('chat', model=model_id):
+            for chunk in response_cache.get_or_stream(
+                model_id,
+                body,
+                lambda: stream_text(bedrock_runtime, model_id, body, usage, deadline, fallback, outcome),
+                lambda: outcome.get('role') != 'fallback'
+            ):
+                chunks.append(chunk)
+                yield chunk
+        if memory is not None and chunks:
+            memory.add_turn(user_message, "".join(chunks), estimate_tokens(body), usage.get('input_tokens'),
+                            usage.get('output_tokens'), time.perf_counter() - started)
+
+    except ClientError as e:
+        report_client_error(e)
+    except (DeadlineExceeded, RateLimitTimeout) as e:
+        print(f"Request timed out: {e}")
+        print("💡 Suggestion: Set BEDROCK_FALLBACK_MODEL to a faster model or raise BEDROCK_DEADLINE_SECONDS.")
+    except Exception as e:
+        print(f"Unexpected error: {e}")
+
+
+def format_turn(memory):
+    """Returns a one-line summary of the last turn recorded in a ConversationMemory"""
+    if not memory.turn_stats:
+        return ''
+    turn = memory.turn_stats[-1]
+    tokens = turn['input_tokens'] if turn['input_tokens'] is not None else f"~{turn['prompt_tokens']}"
+    summary = f", summary {memory.stats()['summary_tokens']} tokens" if memory.summary else ''
+    return f"turn {turn['turn']}: {tokens} input tokens, {turn['window_turns']} turns in window{summary}"
+
+
 def main():
     """Main demo function"""
+    configure_from_env()
     print("\n🤖 AMAZON BEDROCK CONVERSATION DEMO 🤖\n")
 
     # Step 1: List available models
@@ -183,6 +279,13 @@ def main():
     print(f"\n✅ Selected model: {selected_model['name']}")
     print(f"   ID: {selected_model['id']}\n")
 
+    # Recent turns go into every prompt; older ones are summarized
+    memory = ConversationMemory(
+        selected_model['id'],
+        summarizer=model_summarizer(get_client('bedrock-runtime', region_name='us-east-1'),
+                                    selected_model['id'])
+    )
+
     # Step 3: Start conversation
     print("=" * 80)
     print("CONVERSATION (type 'exit' or 'quit' to end)")
@@ -192,6 +295,16 @@ def main():
         user_input = input("You: ")
 
         if user_input.lower() in ['salir', 'exit', 'quit']:
+            chat_stats = memory.stats()
+            if chat_stats['turns']:
+                mean_tokens = chat_stats['mean_input_tokens'] or chat_stats['mean_prompt_tokens']
+                print(f"\n[CHAT] {chat_stats['turns']} turns, {chat_stats['evicted_turns']} summarized, "
+                      f"{mean_tokens:.0f} input tokens and {chat_stats['mean_seconds']:.2f}s per turn on average")
+            memory.close()
+            stats = client_stats()
+            print(f"\n[CLIENTS] {stats['clients_created']} clients created, "
+                  f"{stats['client_reuses']} reused, "
+                  f"{stats['connection_reuses']} requests on reused connections")
             print("\n👋 Goodbye!")
             break
 
@@ -199,12 +312,24 @@ def main():
             continue
 
         print("\n🤖 Assistant: ", end="", flush=True)
-        response = chat_with_bedrock(selected_model['id'], user_input)
 
-        if response:
-            print(response)
+        if STREAMING_ENABLED:
+            stream = StreamTimer(chat_with_bedrock_stream(selected_model['id'], user_input, memory))
+            for chunk in stream:
+                print(chunk, end="", flush=True)
+
+            if stream.text:
+                print(f"\n   ({stream.summary()}; {format_turn(memory)})")
+            else:
+                print("Could not get a response.")
         else:
-            print("Could not get a response.")
+            response = chat_with_bedrock(selected_model['id'], user_input, memory)
+
+            if response:
+                print(response)
+                print(f"   ({format_turn(memory)})")
+            else:
+                print("Could not get a response.")
 
         print()
 
@@ -0,0 +1,235 @@
+"""
+Cached Bedrock model catalog
+Keeps the `list_foundation_models` result on disk with a TTL and serves it
+stale-while-revalidate: a fresh copy is used as is, a stale copy is used
+immediately while a background thread refreshes it, and only a missing
+cache waits on the network. Models are indexed by id, provider, family,
+capability and inference type, so lookups are dictionary reads.
+
+Each region has its own cache file, and the file records its region, so a
+catalog is never served for a region it was not fetched from.
+"""
+
+import json
+import os
+import threading
+import time
+
+from bedrock_clients import DEFAULT_REGION, get_client
+
+# "{region}" in the path is replaced by the catalog's region
+DEFAULT_CATALOG_PATH = os.environ.get("MODEL_CATALOG_PATH", ".cache/bedrock_models_{region}.json")
+DEFAULT_TTL_SECONDS = int(os.environ.get("MODEL_CATALOG_TTL", str(24 * 3600)))
+
+# Model families recognized from the model id
+MODEL_FAMILIES = ('claude', 'llama', 'mistral', 'titan')
+
+
+def model_family(model_id):
+    """Returns the family of a model id ('claude', 'llama', ...) or None"""
+    lowered = model_id.lower()
+    for family in MODEL_FAMILIES:
+        if family in lowered:
+            return family
+    return None
+
+
+class _Index:
+    """Immutable lookup tables over one catalog snapshot"""
+
+    def __init__(self, models):
+        self.models = tuple(models)
+        self.by_id = {}
+        self.by_provider = {}
+        self.by_family = {}
+        self.by_capability = {}
+        self.by_inference_type = {}
+        for model in self.models:
+            self.by_id[model.get('modelId')] = model
+            self._add(self.by_provider, (model.get('providerName') or '').lower(), model)
+            self._add(self.by_family, model_family(model.get('modelId', '')), model)
+            for modality in model.get('inputModalities', []):
+                self._add(self.by_capability, f"input:{modality}", model)
+            for modality in model.get('outputModalities', []):
+                self._add(self.by_capability, modality, model)
+            if model.get('responseStreamingSupported'):
+                self._add(self.by_capability, 'STREAMING', model)
+            for inference_type in model.get('inferenceTypesSupported', []):
+                self._add(self.by_inference_type, inference_type, model)
+
+    @staticmethod
+    def _add(index, key, model):
+        index.setdefault(key, []).append(model)
+
+
+class ModelCatalog:
+    """Disk-cached, indexed view of the Bedrock foundation models"""
+
+    def __init__(self, client=None, path=DEFAULT_CATALOG_PATH, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 region_name=DEFAULT_REGION):
+        """
+        Args:
+            client: A 'bedrock' client (the shared registry client if None)
+            path: JSON file holding the cached model list, where "{region}"
+                is replaced by `region_name` (None disables the disk cache)
+            ttl_seconds: Age after which the cached list is refreshed
+            region_name: AWS region of the registry client
+        """
+        self._client = client
+        self.path = path.format(region=region_name) if path else None
+        self.ttl_seconds = ttl_seconds
+        self.region_name = region_name
+        self.fetched_at = None
+        self.last_error = None
+        self._index = _Index([])
+        self._lock = threading.Lock()
+        self._refresh_thread = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = get_client('bedrock', region_name=self.region_name)
+        return self._client
+
+    @property
+    def is_stale(self):
+        """True when the catalog is missing or older than the TTL"""
+        return self.fetched_at is None or time.time() - self.fetched_at > self.ttl_seconds
+
+    def load(self):
+        """
+        Loads the catalog, refreshing it as needed
+
+        A fresh disk copy is used as is; a stale one is used immediately and
+        refreshed in the background; without one the models are fetched now.
+
+        Returns:
+            self
+
+        Raises:
+            botocore ClientError: If there is no cached copy and the fetch fails
+        """
+        cached = self._read()
+        if cached is None:
+            self.refresh()
+            return self
+        self._install(cached['models'], cached['fetched_at'])
+        if self.is_stale:
+            self.refresh_async()
+        return self
+
+    def refresh(self):
+        """Fetches the model list, stores it on disk and rebuilds the indexes"""
+        response = self.client.list_foundation_models()
+        models = response.get('modelSummaries', [])
+        fetched_at = time.time()
+        self._install(models, fetched_at)
+        self._write(models, fetched_at)
+        self.last_error = None
+        return self
+
+    def refresh_async(self):
+        """
+        Refreshes the catalog on a background thread (at most one at a time)
+
+        Returns:
+            The refresh thread
+        """
+        with self._lock:
+            if self._refresh_thread is not None and self._refresh_thread.is_alive():
+                return self._refresh_thread
+            self._refresh_thread = threading.Thread(
+                target=self._refresh_quietly,
+                name="model-catalog-refresh",
+                daemon=True
+            )
+            self._refresh_thread.start()
+            return self._refresh_thread
+
+    def _refresh_quietly(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            # Keep serving the stale copy; the next start retries
+            self.last_error = e
+
+    def wait(self, timeout=None):
+        """Waits for a background refresh to finish"""
+        thread = self._refresh_thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _install(self, models, fetched_at):
+        # Readers see either the old or the new index, never a mix
+        self._index = _Index(models)
+        self.fetched_at = fetched_at
+
+    def _read(self):
+        if not self.path or not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, encoding='utf-8') as handle:
+                cached = json.load(handle)
+            if not isinstance(cached.get('models'), list) or 'fetched_at' not in cached:
+                return None
+            if cached.get('region') != self.region_name:
+                return None
+            return cached
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, models, fetched_at):
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as handle:
+            json.dump({'region': self.region_name, 'fetched_at': fetched_at, 'models': models}, handle)
+        os.replace(temporary, self.path)
+
+    # Lookups
+
+    def models(self):
+        """Returns every model summary, in the order Bedrock listed them"""
+        return list(self._index.models)
+
+    def get(self, model_id):
+        """Returns the summary of a model id (None if unknown)"""
+        return self._index.by_id.get(model_id)
+
+    def by_provider(self, provider):
+        """Returns the models of a provider (case-insensitive, e.g. 'anthropic')"""
+        return list(self._index.by_provider.get(provider.lower(), ()))
+
+    def by_family(self, family):
+        """Returns the models of a family ('claude', 'llama', 'mistral', 'titan')"""
+        return list(self._index.by_family.get(family, ()))
+
+    def with_capability(self, capability):
+        """
+        Returns the models with a capability
+
+        Args:
+            capability: An output modality ('TEXT', 'EMBEDDING', 'IMAGE'),
+                'input:<modality>' for an input modality, or 'STREAMING'
+        """
+        return list(self._index.by_capability.get(capability, ()))
+
+    def with_inference_type(self, inference_type):
+        """Returns the models supporting an inference type ('ON_DEMAND', 'INFERENCE_PROFILE', ...)"""
+        return list(self._index.by_inference_type.get(inference_type, ()))
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog():
+    """Returns the shared catalog, loading it on first use"""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = ModelCatalog().load()
+        return _catalog
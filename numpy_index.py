@@ -0,0 +1,490 @@
+"""
+In-process NumPy vector index
+A drop-in alternative to Chroma for small and medium corpora: embeddings
+live in one contiguous float32 matrix with L2-normalized rows, so a query is
+a single matrix-vector product followed by `argpartition`. Collections can
+be persisted to a directory and reloaded memory-mapped.
+
+Only the subset of the Chroma collection API used by this project is
+implemented (add, upsert, get, delete, query, count); `where` filters
+support field equality, $eq, $ne, $gt, $gte, $lt, $lte, $in, $nin, $and
+and $or.
+
+Writes are kept in memory until flush() is called; RAGSystem and the
+ingestion helpers flush after every write, and clients also flush when the
+process exits.
+
+With quantization="int8" (VECTOR_QUANTIZATION=int8) queries score int8
+codes held in memory and rerank the best candidates exactly; once flushed,
+the float32 vectors live in a writable memory map of the vectors file with
+spare rows, so later appends are written into the file in place.
+"""
+
+import atexit
+import json
+import operator
+import os
+import threading
+
+import numpy as np
+
+VECTORS_FILE = "vectors.npy"
+RECORDS_FILE = "records.json"
+
+# Initial row capacity of a growing matrix
+INITIAL_CAPACITY = 1024
+
+QUANTIZATION_MODES = (None, "int8")
+
+WHERE_OPERATORS = {
+    '$eq': operator.eq,
+    '$ne': operator.ne,
+    '$gt': operator.gt,
+    '$gte': operator.ge,
+    '$lt': operator.lt,
+    '$lte': operator.le,
+    '$in': lambda value, operand: value in operand,
+    '$nin': lambda value, operand: value not in operand,
+}
+
+
+def normalize_rows(matrix):
+    """Returns a float32 copy of `matrix` with unit-length rows (zero rows stay zero)"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def top_k(matrix, queries, k):
+    """
+    Exact cosine top-k over pre-normalized rows
+
+    Args:
+        matrix: (n, d) float32 matrix with unit-length rows
+        queries: (q, d) float32 matrix with unit-length rows
+        k: Number of neighbours per query
+
+    Returns:
+        Tuple (indices, similarities), both (q, k') with k' = min(k, n), best first
+    """
+    n = matrix.shape[0]
+    k = min(k, n)
+    if k == 0:
+        empty = np.empty((queries.shape[0], 0))
+        return empty.astype(np.int64), empty.astype(np.float32)
+    scores = queries @ matrix.T
+    if k < n:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(n), (queries.shape[0], n))
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind='stable')
+    return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(candidate_scores, order, axis=1)
+
+
+def matches(metadata, where):
+    """
+    True if a metadata dict satisfies a Chroma `where` filter
+
+    Documents without the filtered field never match.
+
+    Raises:
+        ValueError: If the filter uses an unsupported operator
+    """
+    metadata = metadata or {}
+    for key, condition in where.items():
+        if key == '$and':
+            if not all(matches(metadata, clause) for clause in condition):
+                return False
+        elif key == '$or':
+            if not any(matches(metadata, clause) for clause in condition):
+                return False
+        elif key.startswith('$'):
+            raise ValueError(f"Unsupported filter operator: {key}")
+        else:
+            if not isinstance(condition, dict):
+                condition = {'$eq': condition}
+            for name, operand in condition.items():
+                compare = WHERE_OPERATORS.get(name)
+                if compare is None:
+                    raise ValueError(f"Unsupported filter operator: {name}")
+                if key not in metadata:
+                    return False
+                try:
+                    if not compare(metadata[key], operand):
+                        return False
+                except TypeError:
+                    return False
+    return True
+
+
+class NumpyCollection:
+    """
+    Vector collection stored in a contiguous float32 matrix
+
+    Rows are appended to a matrix that grows by doubling; deletions compact
+    it. Replacing rows copies the matrix and record lists first, so queries
+    that took a snapshot keep searching consistent data. Distances are
+    cosine distances (1 - cosine similarity).
+    """
+
+    def __init__(self, name, embedding_function=None, directory=None, quantization=None,
+                 rerank_factor=4):
+        """
+        Args:
+            name: Collection name
+            embedding_function: Called with a list of texts when embeddings
+                are not supplied to add/upsert/query
+            directory: Directory to persist to (None keeps it in memory)
+            quantization: None for exact float32 search or "int8"
+            rerank_factor: Candidates reranked exactly per result (int8 only)
+        """
+        if quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"Unknown quantization: {quantization}")
+        self.name = name
+        self.embedding_function = embedding_function
+        self.directory = directory
+        self._lock = threading.RLock()
+        self._matrix = None
+        self._size = 0
+        self._ids = []
+        self._documents = []
+        self._metadatas = []
+        self._positions = {}
+        self._dirty = False
+        self.quantization = quantization
+        self.rerank_factor = rerank_factor
+        self._quantizer = None
+        self._codes = None
+        self._fitted_rows = 0
+        self._codes_stale = False
+        if directory and os.path.exists(os.path.join(directory, RECORDS_FILE)):
+            self._load()
+
+    # Persistence
+
+    def _load(self):
+        with open(os.path.join(self.directory, RECORDS_FILE), encoding='utf-8') as handle:
+            records = json.load(handle)
+        self._ids = records['ids']
+        self._documents = records['documents']
+        self._metadatas = records['metadatas']
+        self._positions = {doc_id: i for i, doc_id in enumerate(self._ids)}
+        self._size = len(self._ids)
+        # Memory-mapped read-only; copied into RAM on the first write
+        self._matrix = np.load(os.path.join(self.directory, VECTORS_FILE), mmap_mode='r')
+
+    def flush(self):
+        """Writes the collection to its directory if it changed"""
+        with self._lock:
+            if not self.directory or not self._dirty:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            vectors_path = os.path.join(self.directory, VECTORS_FILE)
+            records_path = os.path.join(self.directory, RECORDS_FILE)
+            mapped = self._mapped()
+            if mapped:
+                # Only rows appended in place since the last flush
+                self._matrix.flush()
+            elif self.quantization and self._size:
+                # Rows past the size are spare room for appends
+                vectors = np.lib.format.open_memmap(vectors_path + ".tmp", mode='w+', dtype=np.float32,
+                                                    shape=self._matrix.shape)
+                vectors[:self._size] = self._matrix[:self._size]
+                vectors.flush()
+                del vectors
+            else:
+                matrix = self._matrix[:self._size] if self._matrix is not None else np.empty((0, 0), np.float32)
+                with open(vectors_path + ".tmp", "wb") as handle:
+                    np.save(handle, np.ascontiguousarray(matrix))
+            with open(records_path + ".tmp", "w", encoding='utf-8') as handle:
+                json.dump({'ids': self._ids, 'documents': self._documents,
+                           'metadatas': self._metadatas}, handle)
+            if not mapped:
+                os.replace(vectors_path + ".tmp", vectors_path)
+            os.replace(records_path + ".tmp", records_path)
+            self._dirty = False
+            if self.quantization and self._size and not mapped:
+                # Keep only the int8 codes resident; reranks read the memory
+                # map and appends are written into it
+                self._matrix = np.lib.format.open_memmap(vectors_path, mode='r+')
+
+    def _mapped(self):
+        """Whether the matrix is the writable memory map of the vectors file"""
+        return isinstance(self._matrix, np.memmap) and self._matrix.mode == 'r+'
+
+    # Storage helpers
+
+    def _writable(self, extra_rows, dimension):
+        """Ensures an in-memory matrix with room for `extra_rows` more rows"""
+        needed = self._size + extra_rows
+        matrix = self._matrix
+        if matrix is not None and self._size and matrix.shape[1] != dimension:
+            raise ValueError(
+                f"Embedding dimension {dimension} does not match collection dimension {matrix.shape[1]}")
+        if (matrix is not None and matrix.flags.writeable
+                and matrix.shape[0] >= needed and matrix.shape[1] == dimension):
+            return matrix
+        capacity = max(INITIAL_CAPACITY, matrix.shape[0] if matrix is not None else 0)
+        while capacity < needed:
+            capacity *= 2
+        grown = np.empty((capacity, dimension), dtype=np.float32)
+        if self._size:
+            grown[:self._size] = matrix[:self._size]
+        self._matrix = grown
+        return self._matrix
+
+    def _embed(self, documents, embeddings):
+        if embeddings is not None:
+            return normalize_rows(embeddings)
+        if self.embedding_function is None:
+            raise ValueError("No embeddings given and the collection has no embedding function")
+        return normalize_rows(self.embedding_function(list(documents)))
+
+    def _write(self, ids, documents, metadatas, embeddings, replace):
+        ids = list(ids)
+        if not ids:
+            return
+        documents = list(documents) if documents is not None else [None] * len(ids)
+        metadatas = list(metadatas) if metadatas is not None else [None] * len(ids)
+        vectors = self._embed(documents, embeddings)
+        with self._lock:
+            matrix = self._writable(len(ids), vectors.shape[1])
+            if replace and any(doc_id in self._positions for doc_id in ids):
+                # Copy on write: running queries hold the current matrix and lists
+                matrix = self._matrix = np.array(matrix)
+                self._documents = list(self._documents)
+                self._metadatas = list(self._metadatas)
+            for doc_id, document, metadata, vector in zip(ids, documents, metadatas, vectors):
+                position = self._positions.get(doc_id)
+                if position is None:
+                    position = self._size
+                    self._positions[doc_id] = position
+                    self._ids.append(doc_id)
+                    self._documents.append(document)
+                    self._metadatas.append(metadata)
+                    self._size += 1
+                elif not replace:
+                    # Chroma ignores adds of existing ids
+                    continue
+                else:
+                    self._documents[position] = document
+                    self._metadatas[position] = metadata
+                    self._codes_stale = True
+                matrix[position] = vector
+            self._dirty = True
+
+    def _refresh_codes(self):
+        """Brings the int8 codes up to date with the matrix (called with the lock held)"""
+        from quantization import Int8Quantizer
+
+        if self._size == 0:
+            self._codes = None
+            return
+        matrix = self._matrix[:self._size]
+        if self._codes is None or self._codes_stale or self._size > 2 * self._fitted_rows:
+            # (Re)fit the ranges whenever the collection has doubled
+            self._quantizer = Int8Quantizer().fit(matrix)
+            self._codes = self._quantizer.encode(matrix)
+            self._fitted_rows = self._size
+            self._codes_stale = False
+        elif self._codes.shape[0] < self._size:
+            appended = self._quantizer.encode(matrix[self._codes.shape[0]:])
+            self._codes = np.concatenate([self._codes, appended])
+
+    def memory_usage(self):
+        """
+        Returns the resident vector storage
+
+        Returns:
+            Dict with the number of vectors, resident bytes (memory-mapped
+            float32 rows are not counted) and bytes per vector
+        """
+        with self._lock:
+            resident = 0
+            if self._matrix is not None and not isinstance(self._matrix, np.memmap):
+                resident += self._matrix[:self._size].nbytes
+            if self._codes is not None:
+                resident += self._codes.nbytes
+            return {
+                'vectors': self._size,
+                'resident_bytes': resident,
+                'bytes_per_vector': resident / self._size if self._size else 0.0,
+            }
+
+    # Chroma-compatible API
+
+    def count(self):
+        """Returns the number of stored documents"""
+        return self._size
+
+    def add(self, ids, documents=None, metadatas=None, embeddings=None):
+        """Adds documents; ids that already exist are left unchanged"""
+        self._write(ids, documents, metadatas, embeddings, replace=False)
+
+    def upsert(self, ids, documents=None, metadatas=None, embeddings=None):
+        """Adds documents, replacing the ones whose ids already exist"""
+        self._write(ids, documents, metadatas, embeddings, replace=True)
+
+    def get(self, ids=None, include=('documents', 'metadatas'), limit=None):
+        """
+        Returns stored documents
+
+        Args:
+            ids: Ids to fetch (None for every document); unknown ids are ignored
+            include: Fields to return ('documents', 'metadatas', 'embeddings')
+            limit: Maximum number of documents
+
+        Returns:
+            Dict with 'ids' and the included fields
+        """
+        with self._lock:
+            if ids is None:
+                positions = list(range(self._size))
+            else:
+                positions = [self._positions[doc_id] for doc_id in ids if doc_id in self._positions]
+            if limit is not None:
+                positions = positions[:limit]
+            result = {'ids': [self._ids[i] for i in positions]}
+            if 'documents' in include:
+                result['documents'] = [self._documents[i] for i in positions]
+            if 'metadatas' in include:
+                result['metadatas'] = [self._metadatas[i] for i in positions]
+            if 'embeddings' in include:
+                result['embeddings'] = np.array(self._matrix[positions]) if positions else []
+            return result
+
+    def delete(self, ids):
+        """Deletes documents by id and compacts the matrix"""
+        with self._lock:
+            doomed = sorted({self._positions[doc_id] for doc_id in ids if doc_id in self._positions})
+            if not doomed:
+                return
+            keep = np.setdiff1d(np.arange(self._size), doomed)
+            remaining = np.array(self._matrix[keep], dtype=np.float32)
+            self._ids = [self._ids[i] for i in keep]
+            self._documents = [self._documents[i] for i in keep]
+            self._metadatas = [self._metadatas[i] for i in keep]
+            self._positions = {doc_id: i for i, doc_id in enumerate(self._ids)}
+            self._size = len(self._ids)
+            self._matrix = remaining if self._size else None
+            self._dirty = True
+            self._codes_stale = True
+
+    def query(self, query_embeddings=None, query_texts=None, n_results=10,
+              include=('documents', 'metadatas', 'distances'), where=None):
+        """
+        Returns the nearest documents to each query
+
+        Args:
+            query_embeddings: List of query embeddings
+            query_texts: List of query texts (embedded with the embedding function)
+            n_results: Number of results per query
+            include: Fields to return ('documents', 'metadatas', 'distances', 'embeddings')
+            where: Metadata filter (see matches)
+
+        Returns:
+            Dict of per-query lists, in the Chroma result format
+
+        Raises:
+            ValueError: If the filter uses an unsupported operator
+        """
+        if query_embeddings is None:
+            if query_texts is None:
+                raise ValueError("query_embeddings or query_texts is required")
+            query_embeddings = self.embedding_function(list(query_texts))
+        queries = normalize_rows(query_embeddings)
+
+        # Snapshot under the lock; the search itself runs unlocked so that
+        # concurrent queries overlap (writes append past the snapshot or
+        # copy before replacing rows)
+        with self._lock:
+            size, ids, documents, metadatas = self._size, self._ids, self._documents, self._metadatas
+            matrix = self._matrix[:size] if size else np.empty((0, queries.shape[1]), np.float32)
+            if self.quantization and size:
+                self._refresh_codes()
+                quantizer, codes = self._quantizer, self._codes
+
+        # With a filter, search only the matching rows and map the results back
+        rows, searched = None, matrix
+        if where:
+            rows = np.array([i for i in range(size) if matches(metadatas[i], where)], dtype=np.int64)
+            searched = matrix[rows]
+        if self.quantization and len(searched):
+            from quantization import search
+            indices, similarities = search(quantizer, codes if rows is None else codes[rows], queries,
+                                           n_results, vectors=searched, rerank_factor=self.rerank_factor)
+        else:
+            indices, similarities = top_k(searched, queries, n_results)
+        if rows is not None:
+            indices = rows[indices]
+        result = {'ids': [[ids[i] for i in row] for row in indices]}
+        if 'documents' in include:
+            result['documents'] = [[documents[i] for i in row] for row in indices]
+        if 'metadatas' in include:
+            result['metadatas'] = [[metadatas[i] for i in row] for row in indices]
+        if 'distances' in include:
+            result['distances'] = (1.0 - similarities).tolist()
+        if 'embeddings' in include:
+            result['embeddings'] = [np.array(matrix[row]) for row in indices]
+        return result
+
+
+class NumpyClient:
+    """
+    Chroma-style client handing out NumpyCollections
+
+    Unlike Chroma, writes reach the persist directory only when flush() is
+    called (or the process exits).
+    """
+
+    def __init__(self, persist_directory=None, quantization=None):
+        """
+        Args:
+            persist_directory: Directory holding one subdirectory per
+                collection (None keeps every collection in memory)
+            quantization: None or "int8" for every collection of the client
+        """
+        self.persist_directory = persist_directory
+        self.quantization = quantization
+        self._collections = {}
+        self._lock = threading.Lock()
+        if persist_directory:
+            # Writes are persisted by flush(); exiting flushes what is left
+            atexit.register(self.flush)
+
+    def _directory(self, name):
+        return os.path.join(self.persist_directory, name) if self.persist_directory else None
+
+    def get_or_create_collection(self, name, embedding_function=None):
+        """Opens (or creates) a collection"""
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is None:
+                collection = NumpyCollection(name, embedding_function, self._directory(name),
+                                             quantization=self.quantization)
+                self._collections[name] = collection
+            elif embedding_function is not None:
+                collection.embedding_function = embedding_function
+            return collection
+
+    def delete_collection(self, name):
+        """Drops a collection and its files"""
+        with self._lock:
+            self._collections.pop(name, None)
+            directory = self._directory(name)
+        if directory and os.path.isdir(directory):
+            for filename in (VECTORS_FILE, RECORDS_FILE):
+                path = os.path.join(directory, filename)
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def flush(self):
+        """Persists every changed collection"""
+        with self._lock:
+            collections = list(self._collections.values())
+        for collection in collections:
+            collection.flush()
@@ -0,0 +1,285 @@
+"""
+Provider codecs for Bedrock text generation
+One codec per request/response format builds the request body (single
+prompts and multi-turn conversations) and parses the response and stream
+chunks. Model ids are matched against a rule table
+once and the resolved codec is cached, so per-call dispatch is a dictionary
+lookup no matter how many providers are registered.
+"""
+
+import json
+import threading
+
+
+class SamplingParams:
+    """Sampling parameters shared by every provider (None leaves a parameter at the model default)"""
+
+    __slots__ = ('max_tokens', 'temperature', 'top_p')
+
+    def __init__(self, max_tokens=1000, temperature=0.7, top_p=0.9):
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.top_p = top_p
+
+    def __repr__(self):
+        return (f"SamplingParams(max_tokens={self.max_tokens}, "
+                f"temperature={self.temperature}, top_p={self.top_p})")
+
+
+DEFAULT_SAMPLING = SamplingParams()
+
+
+def _with_sampling(body, params, names):
+    """Adds the non-None sampling parameters to a body under the provider's names"""
+    for attribute, name in zip(('max_tokens', 'temperature', 'top_p'), names):
+        value = getattr(params, attribute)
+        if value is not None and name is not None:
+            body[name] = value
+    return body
+
+
+class ProviderCodec:
+    """
+    Request/response format of one provider family
+
+    Subclasses implement `build_chat_request`, `parse_response` and
+    `parse_stream_chunk`. Conversations are lists of
+    {'role': 'user' | 'assistant', 'content': text} messages that alternate
+    and end with a user message.
+    """
+
+    name = None
+
+    def build_chat_request(self, messages, params, system=None):
+        """Returns the request body of a conversation as a dict"""
+        raise NotImplementedError
+
+    def build_request(self, prompt, params):
+        """Returns the request body of a single prompt as a dict"""
+        return self.build_chat_request([{"role": "user", "content": prompt}], params)
+
+    def build_body(self, prompt, params=DEFAULT_SAMPLING):
+        """
+        Builds the JSON request body for a prompt
+
+        Args:
+            prompt: The user prompt
+            params: SamplingParams
+
+        Returns:
+            The JSON body
+        """
+        return json.dumps(self.build_request(prompt, params))
+
+    def build_chat_body(self, messages, params=DEFAULT_SAMPLING, system=None):
+        """
+        Builds the JSON request body for a conversation
+
+        Args:
+            messages: Alternating user/assistant messages, ending with the user
+            params: SamplingParams
+            system: Optional system text (instructions, earlier-turn summary)
+
+        Returns:
+            The JSON body
+        """
+        return json.dumps(self.build_chat_request(messages, params, system))
+
+    def parse_response(self, response_body):
+        """Returns the generated text of a decoded invoke_model response"""
+        raise NotImplementedError
+
+    def parse_stream_chunk(self, chunk):
+        """Returns the text carried by a decoded stream chunk ('' if none)"""
+        raise NotImplementedError
+
+
+def _instruct_prompt(messages, system, system_format, turn_end):
+    """
+    Renders a conversation in the [INST] format of Llama and Mistral
+
+    Args:
+        messages: Alternating user/assistant messages, ending with the user
+        system: Optional system text, placed in the first instruction
+        system_format: Format of the system text ('{}' is replaced by it)
+        turn_end: Text closing an answered turn before the next [INST]
+
+    Returns:
+        The prompt string
+    """
+    parts = ["<s>"]
+    for i, message in enumerate(messages):
+        if message["role"] == "user":
+            content = message["content"]
+            if i == 0 and system:
+                content = system_format.format(system) + content
+            parts.append(f"[INST] {content} [/INST]")
+        else:
+            parts.append(f" {message['content']}{turn_end}")
+    return "".join(parts)
+
+
+class ClaudeMessagesCodec(ProviderCodec):
+    """Anthropic messages API (Claude 3 and later)"""
+
+    name = 'claude-messages'
+
+    def build_chat_request(self, messages, params, system=None):
+        body = {"anthropic_version": "bedrock-2023-05-31"}
+        if params.max_tokens is not None:
+            body["max_tokens"] = params.max_tokens
+        if system:
+            body["system"] = system
+        body["messages"] = [
+            {
+                "role": message["role"],
+                "content": message["content"]
+            }
+            for message in messages
+        ]
+        return _with_sampling(body, params, (None, "temperature", "top_p"))
+
+    def parse_response(self, response_body):
+        return response_body['content'][0]['text']
+
+    def parse_stream_chunk(self, chunk):
+        # Only content_block_delta events carry text
+        if chunk.get('type') == 'content_block_delta':
+            return chunk.get('delta', {}).get('text', '')
+        return ''
+
+
+class ClaudeTextCodec(ProviderCodec):
+    """Anthropic text completions (Claude v2 and Claude Instant)"""
+
+    name = 'claude-text'
+
+    def build_chat_request(self, messages, params, system=None):
+        # Text before the first Human turn acts as the system prompt
+        speakers = {"user": "Human", "assistant": "Assistant"}
+        turns = "".join(f"\n\n{speakers[m['role']]}: {m['content']}" for m in messages)
+        body = {"prompt": f"{system or ''}{turns}\n\nAssistant:"}
+        return _with_sampling(body, params, ("max_tokens_to_sample", "temperature", "top_p"))
+
+    def parse_response(self, response_body):
+        return response_body.get('completion', 'No response')
+
+    def parse_stream_chunk(self, chunk):
+        return chunk.get('completion', '')
+
+
+class TitanTextCodec(ProviderCodec):
+    """Amazon Titan text generation"""
+
+    name = 'titan-text'
+
+    def build_chat_request(self, messages, params, system=None):
+        if len(messages) == 1 and not system:
+            input_text = messages[0]["content"]
+        else:
+            # Titan has no message API; conversations use its User/Bot format
+            speakers = {"user": "User", "assistant": "Bot"}
+            lines = [system] if system else []
+            lines.extend(f"{speakers[m['role']]}: {m['content']}" for m in messages)
+            input_text = "\n".join(lines) + "\nBot:"
+        config = _with_sampling({}, params, ("maxTokenCount", "temperature", "topP"))
+        return {"inputText": input_text, "textGenerationConfig": config}
+
+    def parse_response(self, response_body):
+        return response_body['results'][0]['outputText']
+
+    def parse_stream_chunk(self, chunk):
+        return chunk.get('outputText', '')
+
+
+class LlamaCodec(ProviderCodec):
+    """Meta Llama"""
+
+    name = 'llama'
+
+    def build_chat_request(self, messages, params, system=None):
+        body = {"prompt": _instruct_prompt(messages, system, "<<SYS>>\n{}\n<</SYS>>\n\n", " </s><s>")}
+        return _with_sampling(body, params, ("max_gen_len", "temperature", "top_p"))
+
+    def parse_response(self, response_body):
+        return response_body.get('generation', 'No response')
+
+    def parse_stream_chunk(self, chunk):
+        return chunk.get('generation', '')
+
+
+class MistralCodec(ProviderCodec):
+    """Mistral AI"""
+
+    name = 'mistral'
+
+    def build_chat_request(self, messages, params, system=None):
+        body = {"prompt": _instruct_prompt(messages, system, "{}\n\n", "</s>")}
+        return _with_sampling(body, params, ("max_tokens", "temperature", "top_p"))
+
+    def parse_response(self, response_body):
+        return response_body.get('outputs', [{}])[0].get('text', 'No response')
+
+    def parse_stream_chunk(self, chunk):
+        outputs = chunk.get('outputs') or [{}]
+        return outputs[0].get('text', '')
+
+
+# Rules are checked in order against the lowercased model id; the first
+# substring that matches selects the codec
+_rules = [
+    ('claude-v2', ClaudeTextCodec()),
+    ('claude-instant', ClaudeTextCodec()),
+    ('claude', ClaudeMessagesCodec()),
+    ('titan-text', TitanTextCodec()),
+    ('titan-tg1', TitanTextCodec()),
+    ('llama', LlamaCodec()),
+    ('mistral', MistralCodec()),
+]
+_resolved = {}
+_lock = threading.Lock()
+
+
+def resolve_codec(model_id):
+    """Matches a model id against the rule table (uncached; see get_codec)"""
+    model = model_id.lower()
+    for pattern, codec in _rules:
+        if pattern in model:
+            return codec
+    return None
+
+
+def get_codec(model_id):
+    """
+    Returns the codec of a model id, resolving it once
+
+    Args:
+        model_id: The Bedrock model id
+
+    Returns:
+        The ProviderCodec, or None if no rule matches
+    """
+    try:
+        return _resolved[model_id]
+    except KeyError:
+        codec = resolve_codec(model_id)
+        with _lock:
+            _resolved[model_id] = codec
+        return codec
+
+
+def register_codec(pattern, codec, first=True):
+    """
+    Adds a rule mapping model ids containing `pattern` to a codec
+
+    Args:
+        pattern: Lowercase substring of the model ids
+        codec: The ProviderCodec
+        first: Check this rule before the existing ones
+    """
+    with _lock:
+        if first:
+            _rules.insert(0, (pattern, codec))
+        else:
+            _rules.append((pattern, codec))
+        _resolved.clear()
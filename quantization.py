@@ -0,0 +1,174 @@
+"""
+Scalar (int8) quantization for the NumPy vector index
+Vectors are stored as one signed byte per dimension with a per-dimension
+offset and scale, a 4x reduction over float32. Searches score the int8
+codes, keep `rerank_factor * k` candidates and rerank them exactly against
+the float32 vectors (which can stay memory-mapped on disk).
+"""
+
+import numpy as np
+
+from numpy_index import top_k
+
+DEFAULT_RERANK_FACTOR = 4
+
+# Rows scored per block, to bound the float32 temporaries of a search
+SCORE_BLOCK_ROWS = 65536
+
+# Rows used to fit the per-dimension ranges
+FIT_SAMPLE_ROWS = 100_000
+
+
+class Int8Quantizer:
+    """Per-dimension affine mapping between float32 values and int8 codes"""
+
+    def __init__(self, offset=None, scale=None):
+        self.offset = offset
+        self.scale = scale
+
+    def fit(self, matrix, seed=0):
+        """
+        Fits the per-dimension ranges to a sample of rows
+
+        Args:
+            matrix: (n, d) float32 matrix
+            seed: Seed of the row sample
+
+        Returns:
+            self
+        """
+        if matrix.shape[0] > FIT_SAMPLE_ROWS:
+            rows = np.random.default_rng(seed).choice(matrix.shape[0], FIT_SAMPLE_ROWS, replace=False)
+            sample = np.asarray(matrix[np.sort(rows)], dtype=np.float32)
+        else:
+            sample = np.asarray(matrix, dtype=np.float32)
+        low = sample.min(axis=0)
+        high = sample.max(axis=0)
+        self.offset = low.astype(np.float32)
+        self.scale = np.maximum((high - low) / 255.0, np.float32(1e-12)).astype(np.float32)
+        return self
+
+    def encode(self, matrix):
+        """Returns the int8 codes of a float32 matrix (values outside the fitted range are clipped)"""
+        codes = np.empty(matrix.shape, dtype=np.int8)
+        for start in range(0, matrix.shape[0], SCORE_BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + SCORE_BLOCK_ROWS], dtype=np.float32)
+            levels = np.rint((block - self.offset) / self.scale)
+            codes[start:start + SCORE_BLOCK_ROWS] = (np.clip(levels, 0, 255) - 128).astype(np.int8)
+        return codes
+
+    def decode(self, codes):
+        """Returns the float32 approximation of int8 codes"""
+        return (codes.astype(np.float32) + 128.0) * self.scale + self.offset
+
+    def scores(self, codes, queries):
+        """
+        Approximate dot products between queries and encoded rows
+
+        Uses q.x ~= (q * scale).c + q.(128 * scale + offset), so the codes
+        are never decoded as a whole.
+
+        Args:
+            codes: (n, d) int8 codes
+            queries: (q, d) float32 queries
+
+        Returns:
+            (q, n) float32 scores
+        """
+        scaled = (queries * self.scale).astype(np.float32)
+        bias = queries @ (128.0 * self.scale + self.offset)
+        scores = np.empty((queries.shape[0], codes.shape[0]), dtype=np.float32)
+        for start in range(0, codes.shape[0], SCORE_BLOCK_ROWS):
+            block = codes[start:start + SCORE_BLOCK_ROWS].astype(np.float32)
+            scores[:, start:start + SCORE_BLOCK_ROWS] = scaled @ block.T
+        scores += bias[:, None]
+        return scores
+
+
+def search(quantizer, codes, queries, k, vectors=None, rerank_factor=DEFAULT_RERANK_FACTOR):
+    """
+    Top-k search over int8 codes with an optional exact rerank
+
+    Args:
+        quantizer: The fitted Int8Quantizer
+        codes: (n, d) int8 codes
+        queries: (q, d) float32 queries with unit-length rows
+        k: Number of neighbours per query
+        vectors: (n, d) float32 rows for the exact rerank (None skips it)
+        rerank_factor: Candidates reranked per result
+
+    Returns:
+        Tuple (indices, similarities), both (q, k') with k' = min(k, n), best first
+    """
+    n = codes.shape[0]
+    k = min(k, n)
+    if k == 0 or vectors is None:
+        approximate = quantizer.scores(codes, queries)
+        candidates = _top_indices(approximate, k)
+        return candidates, np.take_along_axis(approximate, candidates, axis=1)
+
+    candidates = _top_indices(quantizer.scores(codes, queries), min(n, k * rerank_factor))
+    indices = np.empty((queries.shape[0], k), dtype=np.int64)
+    similarities = np.empty((queries.shape[0], k), dtype=np.float32)
+    for row, (query, rows) in enumerate(zip(queries, candidates)):
+        order = np.sort(rows)
+        local, exact = top_k(np.asarray(vectors[order], dtype=np.float32), query[None, :], k)
+        indices[row] = order[local[0]]
+        similarities[row] = exact[0]
+    return indices, similarities
+
+
+def _top_indices(scores, k):
+    """Indices of the k highest scores of every row (unordered)"""
+    if k == 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    if k >= scores.shape[1]:
+        return np.broadcast_to(np.arange(scores.shape[1]), (scores.shape[0], scores.shape[1])).copy()
+    return np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+
+def recall_at_k(expected, found):
+    """
+    Mean fraction of the exact top-k recovered by an approximate search
+
+    Args:
+        expected: (q, k) indices of the exact search
+        found: (q, k) indices of the approximate search
+
+    Returns:
+        Recall@k between 0 and 1
+    """
+    hits = sum(len(set(e.tolist()) & set(f.tolist())) for e, f in zip(expected, found))
+    total = sum(len(e) for e in expected)
+    return hits / total if total else 1.0
+
+
+def evaluate(vectors, queries, k=10, rerank_factor=DEFAULT_RERANK_FACTOR):
+    """
+    Compares int8 search (with and without rerank) with the exact float32 search
+
+    Args:
+        vectors: (n, d) float32 matrix with unit-length rows
+        queries: (q, d) float32 queries with unit-length rows
+        k: Neighbours per query
+        rerank_factor: Candidates reranked per result
+
+    Returns:
+        Dict with bytes per vector for float32 and int8 storage, and recall@k
+        with and without the exact rerank
+    """
+    quantizer = Int8Quantizer().fit(vectors)
+    codes = quantizer.encode(vectors)
+    exact, _ = top_k(vectors, queries, k)
+    approximate, _ = search(quantizer, codes, queries, k)
+    reranked, _ = search(quantizer, codes, queries, k, vectors=vectors, rerank_factor=rerank_factor)
+    return {
+        'vectors': vectors.shape[0],
+        'dimension': vectors.shape[1],
+        'float32_bytes_per_vector': vectors.shape[1] * 4,
+        'int8_bytes_per_vector': codes.itemsize * codes.shape[1],
+        'recall_at_k': recall_at_k(exact, approximate),
+        'recall_at_k_reranked': recall_at_k(exact, reranked),
+        'k': k,
+        'rerank_factor': rerank_factor,
+    }
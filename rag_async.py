@@ -0,0 +1,241 @@
+"""
+Asyncio RAG pipeline
+Async variant of the rag_system pipeline: blocking boto3 and Chroma calls
+run on a bounded thread pool, a semaphore caps the requests in flight and
+every stage has its own timeout
+"""
+
+import asyncio
+import functools
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import rag_system
+from deadlines import deadline_after
+from rag_system import RETRIEVAL_INCLUDE
+
+# Concurrency tunables
+DEFAULT_MAX_CONCURRENCY = 256
+DEFAULT_EXECUTOR_WORKERS = 64
+
+# Per-stage timeouts in seconds (None disables a timeout)
+DEFAULT_STAGE_TIMEOUTS = {
+    'embed': 15.0,
+    'retrieve': 15.0,
+    'generate': 60.0,
+    'rag': 90.0,
+    'ingest': 300.0,
+}
+
+
+class AsyncRAGPipeline:
+    """
+    Async facade over a RAGSystem
+
+    A cancelled or timed-out stage stops the awaiting coroutine immediately;
+    the underlying boto3 call cannot be interrupted, so it finishes on its
+    worker thread and its result is discarded.
+    """
+
+    def __init__(self, system=None, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 executor_workers=DEFAULT_EXECUTOR_WORKERS, stage_timeouts=None):
+        """
+        Args:
+            system: RAGSystem to wrap (defaults to rag_system.get_system())
+            max_concurrency: Maximum requests in flight at once
+            executor_workers: Threads available for blocking calls
+            stage_timeouts: Overrides for DEFAULT_STAGE_TIMEOUTS
+        """
+        self.system = system or rag_system.get_system()
+        self.max_concurrency = max_concurrency
+        self.stage_timeouts = dict(DEFAULT_STAGE_TIMEOUTS)
+        self.stage_timeouts.update(stage_timeouts or {})
+        self._executor = ThreadPoolExecutor(
+            max_workers=executor_workers,
+            thread_name_prefix="rag-async"
+        )
+        self._semaphore = None
+        self._collection = None
+
+    @property
+    def semaphore(self):
+        # Created on first use so it binds to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def _run(self, stage, func, *args, **kwargs):
+        """Runs a blocking call on the executor under the stage's timeout"""
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+        return await asyncio.wait_for(future, timeout=self.stage_timeouts.get(stage))
+
+    async def start(self):
+        """Builds the collection (and loads the sample corpus) ahead of the first request"""
+        if self._collection is None:
+            # RAGSystem builds it lazily and under a lock, so this may block
+            self._collection = await self._run('retrieve', lambda: self.system.collection)
+        return self._collection
+
+    async def embed(self, texts):
+        """
+        Embeds a list of texts
+
+        Args:
+            texts: List of texts
+
+        Returns:
+            List of embeddings in the same order as `texts`
+        """
+        return await self._run('embed', self.system.embedding_function, list(texts))
+
+    async def add_documents(self, docs):
+        """
+        Adds documents to the collection (see RAGSystem.add_documents)
+
+        Args:
+            docs: List of documents (strings) to index
+
+        Returns:
+            Tuple (number of documents added, number skipped)
+        """
+        await self.start()
+        return await self._run('ingest', self.system.add_documents, list(docs))
+
+    async def retrieve(self, query, top_k=2):
+        """
+        Retrieves the documents most relevant to a query
+
+        Args:
+            query: The user's query
+            top_k: Number of documents to retrieve
+
+        Returns:
+            List of retrieved documents
+        """
+        collection = await self.start()
+        query_embeddings = await self.embed([query])
+        results = await self._run(
+            'retrieve',
+            collection.query,
+            query_embeddings=query_embeddings,
+            n_results=top_k
+        )
+        return results['documents'][0]
+
+    async def retrieve_context(self, query, top_k=2):
+        """
+        Retrieves the documents of a query and packs them into its prompt
+
+        Args:
+            query: The user's query
+            top_k: Number of documents to retrieve
+
+        Returns:
+            The context dict of ContextAssembler.assemble (prompt, documents, tokens)
+        """
+        collection = await self.start()
+        query_embeddings = await self.embed([query])
+        results = await self._run(
+            'retrieve',
+            collection.query,
+            query_embeddings=query_embeddings,
+            n_results=top_k,
+            include=RETRIEVAL_INCLUDE
+        )
+        return self.system.context_assembler.assemble(
+            query,
+            results['documents'][0],
+            distances=results['distances'][0],
+            embeddings=results['embeddings'][0]
+        )
+
+    async def generate_text(self, prompt):
+        """
+        Generates text using Claude 3 on Amazon Bedrock
+
+        Args:
+            prompt: The prompt to generate text
+
+        Returns:
+            The text generated by the model
+        """
+        # The worker stops waiting on Bedrock when the stage times out
+        deadline = deadline_after(self.stage_timeouts.get('generate'))
+        return await self._run('generate', self.system.generate_text, prompt, deadline)
+
+    async def rag_generate(self, query, top_k=2):
+        """
+        Generates a response using RAG
+
+        Runs RAGSystem.rag_answer on a worker thread, so near-duplicate
+        queries are answered from the semantic cache and the context is
+        packed and traced exactly as in the synchronous pipeline.
+
+        Args:
+            query: The user's query
+            top_k: Number of relevant documents to retrieve
+
+        Returns:
+            The generated response with context
+        """
+        async with self.semaphore:
+            deadline = deadline_after(self.stage_timeouts.get('rag'))
+            answer = await self._run('rag', self.system.rag_answer, query, top_k, deadline=deadline)
+            return answer['answer']
+
+    async def generate_without_rag(self, query):
+        """
+        Generates a response without using RAG
+
+        Args:
+            query: The user's query
+
+        Returns:
+            The generated response without context
+        """
+        async with self.semaphore:
+            return await self.generate_text(query)
+
+    def close(self):
+        """Stops the worker threads"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def main(queries):
+    """Answers the queries concurrently and prints them with their latency"""
+    pipeline = AsyncRAGPipeline()
+    try:
+        await pipeline.start()
+
+        async def answer(query):
+            started = time.perf_counter()
+            response = await pipeline.rag_generate(query)
+            return response, time.perf_counter() - started
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(answer(query) for query in queries), return_exceptions=True)
+        elapsed = time.perf_counter() - started
+
+        for query, result in zip(queries, results):
+            print(f"\n{'='*80}")
+            print(f"Query: {query}")
+            print(f"{'='*80}")
+            if isinstance(result, Exception):
+                print(f"[ERROR] {type(result).__name__}: {result}")
+            else:
+                response, latency = result
+                print(response)
+                print(f"({latency:.2f}s)")
+        print(f"\n[OK] {len(queries)} queries answered in {elapsed:.2f}s")
+    finally:
+        pipeline.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1:] or [
+        "What are embeddings used for in AI?",
+        "Explain the benefits of using RAG in AI applications.",
+        "How does Amazon Bedrock support foundation models?"
+    ]))
@@ -3,154 +3,146 @@ Interactive RAG System with Amazon Bedrock
 Allows interactive queries and comparison of responses with and without RAG
 """
 
-import boto3
-import json
-import chromadb
-from chromadb import Documents, EmbeddingFunction, Embeddings
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from bedrock_clients import client_stats
+from bedrock_streaming import StreamTimer
+from instrumentation import configure_from_env
+from rag_system import get_system
 
-# Initialize Bedrock client
-bedrock_runtime = boto3.client('bedrock-runtime', region_name='us-east-1')
+# Print responses as they stream in (set BEDROCK_STREAMING=0 to disable)
+STREAMING_ENABLED = os.environ.get("BEDROCK_STREAMING", "1") == "1"
 
-# Model configuration
-EMBEDDING_MODEL = "amazon.titan-embed-text-v1"
-TEXT_GENERATION_MODEL = "anthropic.claude-3-haiku-20240307-v1:0"
 
-
-class BedrockEmbeddingFunction(EmbeddingFunction):
-    """Custom embedding function for Amazon Bedrock"""
-    
-    def __init__(self):
-        pass
-    
-    def __call__(self, input: Documents) -> Embeddings:
-        embeddings = []
-        for text in input:
-            body = json.dumps({"inputText": text})
-            try:
-                response = bedrock_runtime.invoke_model(
-                    modelId=EMBEDDING_MODEL,
-                    body=body,
-                    contentType='application/json',
-                    accept='application/json'
-                )
-                response_body = json.loads(response['body'].read())
-                embeddings.append(response_body['embedding'])
-            except Exception as e:
-                print(f"[ERROR] Error getting embedding: {e}")
-                raise
-        return embeddings
-
-
-def generate_text(prompt):
-    """Generates text using Claude 3 on Amazon Bedrock"""
-    body = json.dumps({
-        "anthropic_version": "bedrock-2023-05-31",
-        "max_tokens": 500,
-        "messages": [
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ],
-        "temperature": 0.7,
-        "top_p": 0.9,
-    })
-    
+def add_documents(docs):
+    """Adds new documents to the Chroma collection; returns (added, skipped) or None on error"""
     try:
-        response = bedrock_runtime.invoke_model(
-            modelId=TEXT_GENERATION_MODEL, 
-            body=body,
-            contentType='application/json',
-            accept='application/json'
-        )
-        response_body = json.loads(response['body'].read())
-        return response_body['content'][0]['text']
-    except Exception as e:
-        print(f"[ERROR] Error generating text: {e}")
-        raise
-
-
-# Initialize ChromaDB
-print("Initializing ChromaDB...")
-chroma_client = chromadb.Client()
+        return get_system().add_documents(docs)
+    except Exception:
+        return None
 
-# Create custom embedding function
-bedrock_ef = BedrockEmbeddingFunction()
 
-# Create collection
-try:
+def remove_documents(ids):
+    """Deletes documents from the Chroma collection by id; returns the number deleted"""
     try:
-        chroma_client.delete_collection(name="bedrock_docs")
-    except:
-        pass
-    
-    collection = chroma_client.create_collection(
-        name="bedrock_docs",
-        embedding_function=bedrock_ef
-    )
-    print("[OK] Chroma collection created successfully\n")
-except Exception as e:
-    print(f"[ERROR] Error creating collection: {e}")
-    exit(1)
+        return get_system().remove_documents(ids=ids)
+    except Exception:
+        return 0
 
 
-def add_documents(docs):
-    """Adds documents to the Chroma collection"""
-    try:
-        collection.add(
-            documents=docs,
-            ids=[f"doc_{i}" for i in range(len(docs))]
-        )
-        return True
-    except Exception as e:
-        print(f"[ERROR] Error adding documents: {e}")
-        return False
+def show_details(details):
+    """Prints where a RAG answer came from (see RAGSystem.rag_answer)"""
+    if details['cached']:
+        print(f"\n[CACHE] Answer reused from \"{details['cached_query']}\" "
+              f"(similarity {details['similarity']:.3f})")
+    show_retrieved_documents(details['documents'])
+    if details['prompt_tokens_saved']:
+        print(f"[CONTEXT] {details['prompt_tokens']} prompt tokens, "
+              f"{details['prompt_tokens_saved']} saved")
 
 
 def rag_generate(query, top_k=2, verbose=False):
     """Generates a response using RAG"""
     try:
-        # Retrieve relevant documents
-        results = collection.query(
-            query_texts=[query],
-            n_results=top_k
-        )
-        
-        # Show retrieved documents if verbose is enabled
-        if verbose:
-            print("\nRetrieved documents:")
-            for i, doc in enumerate(results['documents'][0], 1):
-                print(f"  {i}. {doc}")
-            print()
-        
-        # Build prompt with retrieved context
-        context = "\n".join(results['documents'][0])
-        
-        prompt = f"""Given the following context, please answer the question.
+        answer = get_system().rag_answer(query, top_k)
+    except Exception:
+        return None
+    if verbose:
+        show_details(answer)
+    return answer['answer']
 
-Context: {context}
 
-Question: {query}
+def rag_generate_stream(query, top_k=2, verbose=False):
+    """Generates a response using RAG, yielding chunks as they arrive"""
+    details = {}
+    try:
+        for i, chunk in enumerate(get_system().rag_generate_stream(query, top_k, details)):
+            if i == 0 and verbose:
+                show_details(details)
+            yield chunk
+    except Exception:
+        return
 
-Based on the provided context, my answer is:"""
-        
-        # Generate response
-        response = generate_text(prompt)
-        return response
-    except Exception as e:
-        print(f"[ERROR] Error in rag_generate: {e}")
-        return None
+
+def print_stream(chunks):
+    """Prints streamed chunks as they arrive and reports time to first token"""
+    stream = StreamTimer(chunks)
+    for i, chunk in enumerate(stream):
+        if i == 0:
+            print("Response:")
+            print("-"*80)
+        print(chunk, end="", flush=True)
+    if stream.text:
+        print()
+        print("-"*80)
+        print(f"({stream.summary()})")
 
 
 def generate_without_rag(query):
     """Generates a response without using RAG"""
     try:
-        return generate_text(query)
-    except Exception as e:
-        print(f"[ERROR] Error in generate_without_rag: {e}")
+        return get_system().generate_without_rag(query)
+    except Exception:
         return None
 
 
+def generate_without_rag_stream(query):
+    """Generates a response without using RAG, yielding chunks as they arrive"""
+    try:
+        yield from get_system().generate_text_stream(query)
+    except Exception:
+        return
+
+
+def show_retrieved_documents(documents):
+    """Prints the retrieved documents"""
+    print("\nRetrieved documents:")
+    for i, doc in enumerate(documents, 1):
+        print(f"  {i}. {doc}")
+    print()
+
+
+def compare_rag(query, top_k=3):
+    """
+    Runs the RAG and no-RAG generations concurrently
+    
+    Returns a dict with both responses, the retrieved documents, the latency
+    of each arm, the wall-clock time and the speedup over running them in turn
+    """
+    def rag_arm():
+        started = time.perf_counter()
+        try:
+            answer = get_system().rag_answer(query, top_k)
+            documents, response = answer['documents'], answer['answer']
+        except Exception:
+            documents, response = [], None
+        return documents, response, time.perf_counter() - started
+    
+    def no_rag_arm():
+        started = time.perf_counter()
+        response = generate_without_rag(query)
+        return response, time.perf_counter() - started
+    
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="rag-compare") as executor:
+        rag_future = executor.submit(rag_arm)
+        no_rag_future = executor.submit(no_rag_arm)
+        documents, rag_response, rag_seconds = rag_future.result()
+        no_rag_response, no_rag_seconds = no_rag_future.result()
+    wall_seconds = time.perf_counter() - started
+    
+    return {
+        'documents': documents,
+        'rag': rag_response,
+        'no_rag': no_rag_response,
+        'rag_seconds': rag_seconds,
+        'no_rag_seconds': no_rag_seconds,
+        'wall_seconds': wall_seconds,
+        'speedup': (rag_seconds + no_rag_seconds) / wall_seconds if wall_seconds > 0 else 1.0,
+    }
+
+
 def show_menu():
     """Shows the main menu"""
     print("\n" + "="*80)
@@ -162,58 +154,50 @@ def show_menu():
     print("  3. Compare RAG vs Without RAG")
     print("  4. Add new documents")
     print("  5. View current documents")
-    print("  6. Exit")
+    print("  6. Delete a document")
+    print("  7. Exit")
     print("="*80)
 
 
 def view_documents():
-    """Shows all documents in the collection"""
+    """Shows all documents in the collection and returns their ids in display order"""
     try:
         # Get all documents
-        results = collection.get()
+        results = get_system().collection.get()
         docs = results.get('documents', [])
         
         if not docs:
             print("\nNo documents in collection.")
-            return
+            return []
         
         print(f"\nDocuments in collection ({len(docs)} total):")
         print("-"*80)
         for i, doc in enumerate(docs, 1):
             print(f"{i}. {doc}")
         print("-"*80)
+        return results['ids']
     except Exception as e:
         print(f"[ERROR] Error getting documents: {e}")
+        return []
 
 
 def main():
     """Main function of the interactive system"""
+    configure_from_env()
     
-    # Add initial sample documents
-    print("Loading sample documents...")
-    sample_docs = [
-        "Amazon Bedrock is a fully managed service for foundation models.",
-        "RAG systems combine retrieval and generation to improve responses.",
-        "Embeddings are vector representations of text in high-dimensional spaces.",
-        "Chroma is an efficient vector store for building AI applications.",
-        "Foundation models can be fine-tuned for specific tasks and domains.",
-        "Amazon Bedrock provides access to AI models from leading companies like Anthropic, AI21 Labs, and Amazon.",
-        "RAG improves response accuracy by providing relevant context from stored knowledge.",
-        "Embeddings enable searching for similar documents using cosine similarity.",
-        "Claude is a language model developed by Anthropic available on Amazon Bedrock.",
-        "RAG systems are especially useful for applications requiring domain-specific knowledge."
-    ]
-    
-    if add_documents(sample_docs):
-        print(f"[OK] {len(sample_docs)} documents loaded successfully\n")
-    else:
+    # Open the collection (sample documents are loaded into an empty one)
+    print("Initializing the RAG system...")
+    system = get_system()
+    try:
+        system.collection
+    except Exception:
         print("[ERROR] Error loading initial documents")
         return
     
     # Main loop
     while True:
         show_menu()
-        choice = input("\nSelect an option (1-6): ").strip()
+        choice = input("\nSelect an option (1-7): ").strip()
         
         if choice == '1':
             # Query with RAG
@@ -224,12 +208,15 @@ def main():
             
             if query:
                 print("\nProcessing with RAG...")
-                response = rag_generate(query, top_k=3, verbose=True)
-                if response:
-                    print("Response:")
-                    print("-"*80)
-                    print(response)
-                    print("-"*80)
+                if STREAMING_ENABLED:
+                    print_stream(rag_generate_stream(query, top_k=3, verbose=True))
+                else:
+                    response = rag_generate(query, top_k=3, verbose=True)
+                    if response:
+                        print("Response:")
+                        print("-"*80)
+                        print(response)
+                        print("-"*80)
         
         elif choice == '2':
             # Query without RAG
@@ -240,12 +227,15 @@ def main():
             
             if query:
                 print("\nProcessing without RAG...")
-                response = generate_without_rag(query)
-                if response:
-                    print("Response:")
-                    print("-"*80)
-                    print(response)
-                    print("-"*80)
+                if STREAMING_ENABLED:
+                    print_stream(generate_without_rag_stream(query))
+                else:
+                    response = generate_without_rag(query)
+                    if response:
+                        print("Response:")
+                        print("-"*80)
+                        print(response)
+                        print("-"*80)
         
         elif choice == '3':
             # Compare RAG vs Without RAG
@@ -255,11 +245,11 @@ def main():
             query = input("\nEnter your query: ").strip()
             
             if query:
-                print("\nProcessing with RAG...")
-                rag_response = rag_generate(query, top_k=3, verbose=True)
-                
-                print("\nProcessing without RAG...")
-                no_rag_response = generate_without_rag(query)
+                print("\nProcessing with and without RAG in parallel...")
+                comparison = compare_rag(query, top_k=3)
+                rag_response = comparison['rag']
+                no_rag_response = comparison['no_rag']
+                show_retrieved_documents(comparison['documents'])
                 
                 print("\n" + "="*80)
                 print("COMPARISON RESULTS")
@@ -276,6 +266,11 @@ def main():
                 if no_rag_response:
                     print(no_rag_response)
                 print("-"*80)
+                
+                print(f"\n[TIMING] With RAG {comparison['rag_seconds']:.2f}s, "
+                      f"without RAG {comparison['no_rag_seconds']:.2f}s, "
+                      f"wall clock {comparison['wall_seconds']:.2f}s "
+                      f"({comparison['speedup']:.2f}x speedup)")
         
         elif choice == '4':
             # Add new documents
@@ -295,8 +290,7 @@ def main():
             
             if new_docs:
                 print(f"\nAdding {len(new_docs)} documents...")
-                if add_documents(new_docs):
-                    print(f"[OK] {len(new_docs)} documents added successfully")
+                add_documents(new_docs)
             else:
                 print("[WARNING] No documents were added")
         
@@ -305,13 +299,36 @@ def main():
             view_documents()
         
         elif choice == '6':
+            # Delete a document
+            print("\n" + "="*80)
+            print("DELETE A DOCUMENT")
+            print("="*80)
+            ids = view_documents()
+            if ids:
+                selection = input(f"\nDocument to delete (1-{len(ids)}): ").strip()
+                if selection.isdigit() and 1 <= int(selection) <= len(ids):
+                    remove_documents([ids[int(selection) - 1]])
+                else:
+                    print("[WARNING] No document was deleted")
+        
+        elif choice == '7':
             # Exit
+            if system.semantic_cache is not None:
+                semantic_stats = system.semantic_cache.stats()
+                print(f"\n[CACHE] Semantic answers: {semantic_stats['hits']} hits, "
+                      f"{semantic_stats['misses']} misses ({semantic_stats['hit_rate']:.0%} hit rate)")
+            context_stats = system.context_assembler.stats()
+            print(f"[CONTEXT] {context_stats['prompt_tokens_saved']} prompt tokens saved "
+                  f"({context_stats['tokens_saved_per_query']:.1f} per query)")
+            stats = client_stats()
+            print(f"\n[CLIENTS] {stats['clients_created']} clients created, "
+                  f"{stats['connection_reuses']} requests on reused connections")
             print("\nThank you for using the RAG System!")
             print("="*80 + "\n")
             break
         
         else:
-            print("\n[WARNING] Invalid option. Please select 1-6.")
+            print("\n[WARNING] Invalid option. Please select 1-7.")
         
         input("\nPress Enter to continue...")
 
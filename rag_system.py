@@ -1,133 +1,66 @@
-import boto3
-import json
-import chromadb
-from chromadb import Documents, EmbeddingFunction, Embeddings
-
-# Initialize Bedrock client
-bedrock_runtime = boto3.client('bedrock-runtime', region_name='us-east-1')
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from bedrock_clients import client_stats, get_client
+from bedrock_streaming import stream_text
+from context_assembler import ContextAssembler
+from deadlines import (
+    GENERATION_DEADLINE_SECONDS, deadline_after, fallback_body, fallback_request, get_invoker,
+    text_request
+)
+from embedding_cache import DEFAULT_CACHE_PATH, EmbeddingCache
+from instrumentation import configure_from_env, get_instrumentation
+from provider_codecs import SamplingParams, get_codec
+from rate_limiter import limiter_stats
+from response_cache import ResponseCache
+from vector_store import (
+    COLLECTION_NAME, create_client, delete_documents, get_collection, upsert_documents
+)
 
 # Model configuration
 EMBEDDING_MODEL = "amazon.titan-embed-text-v1"
 TEXT_GENERATION_MODEL = "anthropic.claude-3-haiku-20240307-v1:0"  # Claude 3 Haiku Model
 
+# Sampling parameters of every generation request. Answers are sampled, so
+# they bypass the response cache unless RESPONSE_CACHE_SAMPLED=1;
+# BEDROCK_GENERATION_TEMPERATURE=0 opts into greedy decoding, which the
+# response cache serves without the opt-in
+GENERATION_TEMPERATURE = float(os.environ.get("BEDROCK_GENERATION_TEMPERATURE", "0.7"))
+GENERATION_SAMPLING = SamplingParams(max_tokens=500, temperature=GENERATION_TEMPERATURE, top_p=0.9)
 
-class BedrockEmbeddingFunction(EmbeddingFunction):
-    """
-    Custom embedding function for Amazon Bedrock
-    Compatible with ChromaDB
-    """
-    
-    def __init__(self):
-        pass
-    
-    def __call__(self, input: Documents) -> Embeddings:
-        """
-        Gets embeddings for a list of texts
-        
-        Args:
-            input: List of texts to convert to embeddings
-            
-        Returns:
-            List of embeddings (each one is a list of floats)
-        """
-        embeddings = []
-        for text in input:
-            body = json.dumps({"inputText": text})
-            try:
-                response = bedrock_runtime.invoke_model(
-                    modelId=EMBEDDING_MODEL,
-                    body=body,
-                    contentType='application/json',
-                    accept='application/json'
-                )
-                response_body = json.loads(response['body'].read())
-                embeddings.append(response_body['embedding'])
-            except Exception as e:
-                print(f"Error getting embedding: {e}")
-                raise
-        return embeddings
-
+# Embedding engine tunables
+EMBEDDING_MAX_WORKERS = 8
+EMBEDDING_CHUNK_SIZE = 64
 
-def generate_text(prompt):
-    """
-    Generates text using Claude 3 on Amazon Bedrock
-    
-    Args:
-        prompt: The prompt to generate text
-        
-    Returns:
-        The text generated by the model
-    """
-    body = json.dumps({
-        "anthropic_version": "bedrock-2023-05-31",
-        "max_tokens": 500,
-        "messages": [
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ],
-        "temperature": 0.7,
-        "top_p": 0.9,
-    })
-    
-    try:
-        response = bedrock_runtime.invoke_model(
-            modelId=TEXT_GENERATION_MODEL, 
-            body=body,
-            contentType='application/json',
-            accept='application/json'
-        )
-        response_body = json.loads(response['body'].read())
-        return response_body['content'][0]['text']
-    except Exception as e:
-        print(f"Error generating text: {e}")
-        raise
+# Maximum concurrent generation requests in rag_generate_batch
+GENERATION_MAX_CONCURRENCY = 4
 
+# Fields retrieved for context assembly (distances rank the chunks,
+# embeddings catch near-duplicates)
+RETRIEVAL_INCLUDE = ['documents', 'distances', 'embeddings']
 
-# Initialize Chroma client
-chroma_client = chromadb.Client()
+# Persistent embedding cache (set EMBEDDING_CACHE_PATH to relocate it)
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", DEFAULT_CACHE_PATH)
 
-# Create custom embedding function using Bedrock
-bedrock_ef = BedrockEmbeddingFunction()
+# Generation response cache; sampled (temperature > 0) requests are cached
+# only when RESPONSE_CACHE_SAMPLED is enabled
+RESPONSE_CACHE_PATH = os.environ.get("RESPONSE_CACHE_PATH")
+RESPONSE_CACHE_SAMPLED = os.environ.get("RESPONSE_CACHE_SAMPLED", "0") == "1"
 
-# Create collection with custom embedding function
-try:
-    # Try to delete collection if it exists (to avoid errors on multiple runs)
-    try:
-        chroma_client.delete_collection(name="bedrock_docs")
-    except:
-        pass
-    
-    collection = chroma_client.create_collection(
-        name="bedrock_docs",
-        embedding_function=bedrock_ef
-    )
-    print("[OK] Chroma collection created successfully")
-except Exception as e:
-    print(f"Error creating collection: {e}")
-    raise
+# Semantic answer cache in front of rag_generate (SEMANTIC_CACHE=0 disables it)
+SEMANTIC_CACHE_ENABLED = os.environ.get("SEMANTIC_CACHE", "1") == "1"
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.environ.get("SEMANTIC_CACHE_MAX_ENTRIES", "1024"))
 
+# Importing this module must stay cheap: no clients, no network, no disk.
+# `python rag_system.py --startup-check` fails if it takes longer than this.
+STARTUP_BUDGET_SECONDS = 0.5
 
-def add_documents(docs):
-    """
-    Adds documents to the Chroma collection
-    
-    Args:
-        docs: List of documents (strings) to index
-    """
-    try:
-        collection.add(
-            documents=docs,
-            ids=[f"doc_{i}" for i in range(len(docs))]
-        )
-        print(f"[OK] {len(docs)} documents added to collection")
-    except Exception as e:
-        print(f"Error adding documents: {e}")
-        raise
-
-
-# Add sample documents
+# Sample documents loaded into an empty system
 sample_docs = [
     "Amazon Bedrock is a fully managed service for foundation models.",
     "RAG systems combine retrieval and generation to improve responses.",
@@ -141,67 +74,686 @@ sample_docs = [
     "RAG systems are especially useful for applications requiring domain-specific knowledge."
 ]
 
-print("\nAdding sample documents...")
-add_documents(sample_docs)
-
 
-def rag_generate(query, top_k=2):
+def build_generation_body(prompt):
     """
-    Generates a response using RAG (Retrieval-Augmented Generation)
+    Builds the request body of the text generation model for a prompt
     
     Args:
-        query: The user's query
-        top_k: Number of relevant documents to retrieve
+        prompt: The prompt to generate text
         
     Returns:
-        The generated response with context
+        The JSON request body
     """
+    return get_codec(TEXT_GENERATION_MODEL).build_body(prompt, GENERATION_SAMPLING)
+
+
+@contextmanager
+def stage_timer(timings, stage):
+    """
+    Records the duration of a pipeline stage
+    
+    Args:
+        timings: Dict that receives the duration (None skips timing)
+        stage: Stage name used as the key
+    """
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
     try:
-        # Retrieve relevant documents
-        results = collection.query(
-            query_texts=[query],
-            n_results=top_k
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - started
+
+
+class RAGSystem:
+    """
+    Lazily initialized RAG pipeline
+    
+    Nothing is created in the constructor: the Bedrock client, the embedding
+    cache, the Chroma client and the collection (including the sample
+    corpus) are built on first use, each exactly once.
+    """
+    
+    def __init__(self, bedrock_client=None, persist_directory=None,
+                 embedding_cache_path=EMBEDDING_CACHE_PATH, load_samples=True,
+                 collection_name=COLLECTION_NAME, vector_backend=None,
+                 semantic_cache=SEMANTIC_CACHE_ENABLED, context_assembler=None, shards=None,
+                 response_cache=True):
+        """
+        Args:
+            bedrock_client: bedrock-runtime client to use (created lazily if None)
+            persist_directory: Chroma directory (defaults to CHROMA_PERSIST_DIR)
+            embedding_cache_path: SQLite file of the embedding cache (None disables it)
+            load_samples: Load the sample documents when the collection is opened
+            collection_name: Name of the Chroma collection
+            vector_backend: "chroma" or "numpy" (defaults to VECTOR_BACKEND)
+            semantic_cache: Answer near-duplicate queries from the semantic cache
+            context_assembler: ContextAssembler packing the retrieved chunks
+                into the prompt (default token budget if None)
+            shards: Collections the documents are partitioned across; queries
+                search all of them concurrently (defaults to VECTOR_SHARDS)
+            response_cache: Serve repeated generation requests from the
+                response cache (False sends every request to Bedrock)
+        """
+        self._bedrock_runtime = bedrock_client
+        self.persist_directory = persist_directory
+        self.embedding_cache_path = embedding_cache_path
+        self.load_samples = load_samples
+        self.collection_name = collection_name
+        self.vector_backend = vector_backend
+        self.shards = shards
+        self.semantic_cache_enabled = semantic_cache
+        self.response_cache_enabled = response_cache
+        self.context_assembler = context_assembler or ContextAssembler()
+        self._lock = threading.RLock()
+        self._response_cache = None
+        self._semantic_cache = None
+        self._embedding_cache = None
+        self._embedding_function = None
+        self._chroma_client = None
+        self._collection = None
+    
+    @property
+    def bedrock_runtime(self):
+        """The bedrock-runtime client"""
+        with self._lock:
+            if self._bedrock_runtime is None:
+                self._bedrock_runtime = get_client('bedrock-runtime', region_name='us-east-1')
+            return self._bedrock_runtime
+    
+    @property
+    def response_cache(self):
+        """The generation response cache (None when disabled)"""
+        with self._lock:
+            if self._response_cache is None and self.response_cache_enabled:
+                self._response_cache = ResponseCache(
+                    disk_path=RESPONSE_CACHE_PATH,
+                    cache_sampled=RESPONSE_CACHE_SAMPLED
+                )
+            return self._response_cache
+    
+    @property
+    def semantic_cache(self):
+        """The semantic answer cache (None when disabled)"""
+        with self._lock:
+            if self._semantic_cache is None and self.semantic_cache_enabled:
+                # Imported here so that importing this module does not load numpy
+                from semantic_cache import SemanticCache
+                self._semantic_cache = SemanticCache(
+                    threshold=SEMANTIC_CACHE_THRESHOLD,
+                    max_entries=SEMANTIC_CACHE_MAX_ENTRIES
+                )
+            return self._semantic_cache
+    
+    @property
+    def embedding_cache(self):
+        """The persistent embedding cache (None when disabled)"""
+        with self._lock:
+            if self._embedding_cache is None and self.embedding_cache_path:
+                self._embedding_cache = EmbeddingCache(self.embedding_cache_path)
+            return self._embedding_cache
+    
+    @property
+    def embedding_function(self):
+        """The Bedrock embedding function used by the collection"""
+        with self._lock:
+            if self._embedding_function is None:
+                # Imported here so that importing this module does not load chromadb
+                from bedrock_embeddings import BedrockEmbeddingFunction
+                self._embedding_function = BedrockEmbeddingFunction(
+                    self.bedrock_runtime,
+                    EMBEDDING_MODEL,
+                    max_workers=EMBEDDING_MAX_WORKERS,
+                    chunk_size=EMBEDDING_CHUNK_SIZE,
+                    cache=self.embedding_cache
+                )
+            return self._embedding_function
+    
+    @property
+    def chroma_client(self):
+        """The Chroma client (persistent when a directory is configured)"""
+        with self._lock:
+            if self._chroma_client is None:
+                if self.persist_directory:
+                    self._chroma_client = create_client(self.persist_directory, self.vector_backend,
+                                                        self.shards)
+                else:
+                    self._chroma_client = create_client(backend=self.vector_backend, shards=self.shards)
+            return self._chroma_client
+    
+    @property
+    def collection(self):
+        """The Chroma collection, loaded with the sample documents on first use"""
+        with self._lock:
+            if self._collection is None:
+                try:
+                    self._collection = get_collection(
+                        self.chroma_client,
+                        self.embedding_function,
+                        name=self.collection_name
+                    )
+                    print(f"[OK] Chroma collection ready ({self._collection.count()} documents stored)")
+                except Exception as e:
+                    print(f"Error creating collection: {e}")
+                    raise
+                
+                if self.load_samples:
+                    print("\nAdding sample documents...")
+                    self.add_documents(sample_docs)
+                    if self.embedding_cache is not None:
+                        cache_stats = self.embedding_cache.stats()
+                        print(f"[CACHE] Embeddings: {cache_stats['hits']} hits, "
+                              f"{cache_stats['misses']} misses")
+            return self._collection
+    
+    def generate_text(self, prompt, deadline=None):
+        """
+        Generates text using Claude 3 on Amazon Bedrock
+        
+        The request is abandoned at the deadline; with BEDROCK_HEDGING=1 a
+        slow request is hedged, and BEDROCK_FALLBACK_MODEL is raced against
+        it when the deadline is near.
+        
+        Args:
+            prompt: The prompt to generate text
+            deadline: Monotonic deadline (GENERATION_DEADLINE_SECONDS from now if None)
+            
+        Returns:
+            The text generated by the model
+            
+        Raises:
+            DeadlineExceeded: If no response arrived before the deadline
+        """
+        if deadline is None:
+            deadline = deadline_after(GENERATION_DEADLINE_SECONDS)
+        body = build_generation_body(prompt)
+        outcome = {}
+        
+        def invoke():
+            return get_invoker().call(
+                TEXT_GENERATION_MODEL,
+                text_request(self.bedrock_runtime, TEXT_GENERATION_MODEL, body, deadline),
+                deadline=deadline,
+                fallback=fallback_request(self.bedrock_runtime, prompt, GENERATION_SAMPLING,
+                                          TEXT_GENERATION_MODEL, deadline=deadline),
+                outcome=outcome
+            )
+        
+        try:
+            with get_instrumentation().span('generate', model=TEXT_GENERATION_MODEL):
+                response_cache = self.response_cache
+                if response_cache is None:
+                    return invoke()
+                # A fallback model's answer is not cached as this model's
+                return response_cache.get_or_generate(TEXT_GENERATION_MODEL, body, invoke,
+                                                      lambda: outcome.get('role') != 'fallback')
+        except Exception as e:
+            print(f"Error generating text: {e}")
+            raise
+    
+    def generate_text_stream(self, prompt, deadline=None):
+        """
+        Generates text using Claude 3 on Amazon Bedrock, streaming the response
+        
+        The stream keeps to the deadline; BEDROCK_FALLBACK_MODEL is raced
+        against it while the first token is late (see generate_text).
+        
+        Args:
+            prompt: The prompt to generate text
+            deadline: Monotonic deadline (GENERATION_DEADLINE_SECONDS from now if None)
+            
+        Yields:
+            Text chunks as they arrive
+            
+        Raises:
+            DeadlineExceeded: If the response did not start or finish before the deadline
+        """
+        if deadline is None:
+            deadline = deadline_after(GENERATION_DEADLINE_SECONDS)
+        body = build_generation_body(prompt)
+        fallback = fallback_body(prompt, GENERATION_SAMPLING, TEXT_GENERATION_MODEL)
+        outcome = {}
+        
+        def stream():
+            return stream_text(self.bedrock_runtime, TEXT_GENERATION_MODEL, body,
+                               deadline=deadline, fallback=fallback, outcome=outcome)
+        
+        try:
+            with get_instrumentation().span('generate', model=TEXT_GENERATION_MODEL):
+                response_cache = self.response_cache
+                if response_cache is None:
+                    yield from stream()
+                else:
+                    yield from response_cache.get_or_stream(TEXT_GENERATION_MODEL, body, stream,
+                                                            lambda: outcome.get('role') != 'fallback')
+        except Exception as e:
+            print(f"Error generating text: {e}")
+            raise
+    
+    def add_documents(self, docs):
+        """
+        Adds documents to the Chroma collection
+        
+        Documents are identified by a hash of their content, so documents that
+        are already stored are skipped without being embedded again.
+        
+        Args:
+            docs: List of documents (strings) to index
+            
+        Returns:
+            Tuple (number of documents added, number skipped)
+        """
+        try:
+            added, skipped = upsert_documents(self.collection, docs)
+            if added:
+                self._flush()
+            if added and self._semantic_cache is not None:
+                self._semantic_cache.invalidate()
+            print(f"[OK] {added} documents added to collection ({skipped} already stored)")
+            return added, skipped
+        except Exception as e:
+            print(f"Error adding documents: {e}")
+            raise
+    
+    def _flush(self):
+        """Persists the writes of collections that buffer them (the numpy backend)"""
+        flush = getattr(self.collection, 'flush', None)
+        if flush is not None:
+            flush()
+    
+    def remove_documents(self, docs=None, ids=None):
+        """
+        Deletes documents from the Chroma collection
+        
+        Args:
+            docs: List of documents (strings) to delete
+            ids: List of document ids to delete
+            
+        Returns:
+            Number of documents deleted
+        """
+        try:
+            deleted = delete_documents(self.collection, docs=docs, ids=ids)
+            if deleted:
+                self._flush()
+            if deleted and self._semantic_cache is not None:
+                self._semantic_cache.invalidate()
+            print(f"[OK] {deleted} documents deleted from collection")
+            return deleted
+        except Exception as e:
+            print(f"Error deleting documents: {e}")
+            raise
+    
+    def rag_generate(self, query, top_k=2, timings=None):
+        """
+        Generates a response using RAG (Retrieval-Augmented Generation)
+        
+        Args:
+            query: The user's query
+            top_k: Number of relevant documents to retrieve
+            timings: Optional dict that receives the seconds spent in each
+                stage ('embed', 'search', 'prompt', 'generate')
+            
+        Returns:
+            The generated response with context
+        """
+        return self.rag_answer(query, top_k, timings)['answer']
+    
+    def _assemble(self, query, results, i):
+        """Assembles the context of the i-th query of a collection.query result"""
+        embeddings = results.get('embeddings')
+        return self.context_assembler.assemble(
+            query,
+            results['documents'][i],
+            distances=results['distances'][i] if results.get('distances') is not None else None,
+            embeddings=embeddings[i] if embeddings is not None else None
         )
+    
+    def _retrieve(self, query, top_k, timings=None):
+        """
+        Embeds a query and answers it from the semantic cache or retrieves its context
+        
+        Returns:
+            Tuple (query embedding, semantic cache version, cache hit or None,
+            assembled context or None for a cache hit)
+        """
+        collection = self.collection
+        semantic_cache = self.semantic_cache
+        
+        # Embed the query and retrieve relevant documents
+        with stage_timer(timings, 'embed'):
+            query_embeddings = self.embedding_function([query])
+        version = None
+        if semantic_cache is not None:
+            version = semantic_cache.version
+            hit = semantic_cache.lookup(query_embeddings[0], top_k)
+            if hit is not None:
+                return query_embeddings[0], version, hit, None
+        with stage_timer(timings, 'search'), get_instrumentation().span('vector_search', top_k=top_k):
+            results = collection.query(
+                query_embeddings=query_embeddings,
+                n_results=top_k,
+                include=RETRIEVAL_INCLUDE
+            )
+        
+        # Pack the retrieved chunks into the prompt within the token budget
+        with stage_timer(timings, 'prompt'):
+            context = self._assemble(query, results, 0)
+        return query_embeddings[0], version, None, context
+    
+    @staticmethod
+    def _describe(hit=None, context=None):
+        """The fields of a rag_answer result other than the answer"""
+        if hit is not None:
+            return {
+                'documents': hit['documents'],
+                'cached': True,
+                'similarity': hit['similarity'],
+                'cached_query': hit['query'],
+                'prompt_tokens': None,
+                'prompt_tokens_saved': None,
+            }
+        return {
+            'documents': context['documents'],
+            'cached': False,
+            'similarity': None,
+            'cached_query': None,
+            'prompt_tokens': context['prompt_tokens'],
+            'prompt_tokens_saved': context['prompt_tokens_saved'],
+        }
+    
+    def _remember(self, query, query_embedding, answer, context, top_k, version):
+        """Stores a generated answer in the semantic cache (empty answers are not stored)"""
+        semantic_cache = self.semantic_cache
+        if semantic_cache is not None and answer:
+            semantic_cache.store(query, query_embedding, answer, context['documents'], top_k, version)
+    
+    def rag_answer(self, query, top_k=2, timings=None, deadline=None):
+        """
+        Generates a response using RAG, answering near-duplicate queries
+        from the semantic cache
+        
+        Args:
+            query: The user's query
+            top_k: Number of relevant documents to retrieve
+            timings: Optional dict that receives the seconds spent in each
+                stage ('embed', 'search', 'prompt', 'generate')
+            deadline: Monotonic deadline of the generation (see generate_text)
+            
+        Returns:
+            Dict with the answer, the documents it is based on, whether it
+            came from the semantic cache, the similarity and text of the
+            cached query, and the estimated prompt tokens and tokens saved by
+            the context assembler (None for cached answers)
+        """
+        try:
+            query_embedding, version, hit, context = self._retrieve(query, top_k, timings)
+            if hit is not None:
+                return {'answer': hit['answer'], **self._describe(hit=hit)}
+            
+            # Generate response
+            with stage_timer(timings, 'generate'):
+                response = self.generate_text(context['prompt'], deadline)
+            
+            self._remember(query, query_embedding, response, context, top_k, version)
+            return {'answer': response, **self._describe(context=context)}
+        except Exception as e:
+            print(f"Error in rag_generate: {e}")
+            raise
+    
+    def rag_generate_batch(self, queries, top_k=2, max_concurrency=GENERATION_MAX_CONCURRENCY):
+        """
+        Generates RAG responses for many queries at once
+        
+        All queries are embedded in one concurrent pass and retrieved with a
+        single multi-query search; generation then runs with at most
+        `max_concurrency` requests in flight.
+        
+        Args:
+            queries: List of user queries
+            top_k: Number of relevant documents to retrieve per query
+            max_concurrency: Maximum concurrent generation requests
+            
+        Returns:
+            List of generated responses, in the same order as `queries`
+        """
+        queries = list(queries)
+        if not queries:
+            return []
+        try:
+            collection = self.collection
+            
+            # Embed every query in one pass, then retrieve them all at once
+            query_embeddings = self.embedding_function(queries)
+            with get_instrumentation().span('vector_search', top_k=top_k, queries=len(queries)):
+                results = collection.query(
+                    query_embeddings=query_embeddings,
+                    n_results=top_k,
+                    include=RETRIEVAL_INCLUDE
+                )
+            
+            prompts = [
+                self._assemble(query, results, i)['prompt']
+                for i, query in enumerate(queries)
+            ]
+            
+            workers = max(1, min(max_concurrency, len(prompts)))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rag-generate") as executor:
+                return list(executor.map(self.generate_text, prompts))
+        except Exception as e:
+            print(f"Error in rag_generate_batch: {e}")
+            raise
+    
+    def generate_without_rag_batch(self, queries, max_concurrency=GENERATION_MAX_CONCURRENCY):
+        """
+        Generates responses without RAG for many queries concurrently
+        
+        Args:
+            queries: List of user queries
+            max_concurrency: Maximum concurrent generation requests
+            
+        Returns:
+            List of generated responses, in the same order as `queries`
+        """
+        queries = list(queries)
+        if not queries:
+            return []
+        workers = max(1, min(max_concurrency, len(queries)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="no-rag-generate") as executor:
+            return list(executor.map(self.generate_without_rag, queries))
+    
+    def compare_batch(self, queries, top_k=2, max_concurrency=GENERATION_MAX_CONCURRENCY):
+        """
+        Runs the RAG and no-RAG arms of a comparison concurrently
+        
+        The two arms are independent, so retrieval and generation for the RAG
+        arm overlap with generation for the no-RAG arm.
+        
+        Args:
+            queries: List of user queries
+            top_k: Number of relevant documents to retrieve per query
+            max_concurrency: Maximum concurrent generation requests per arm
+            
+        Returns:
+            Dict with the responses of each arm ('rag', 'no_rag'), each arm's
+            latency, the wall-clock time and the speedup over running the
+            arms one after the other
+        """
+        queries = list(queries)
+        # Build the collection up front so that neither arm pays for it
+        self.collection
+        
+        def timed(func, *args):
+            started = time.perf_counter()
+            result = func(*args)
+            return result, time.perf_counter() - started
+        
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix="rag-compare") as executor:
+            rag_arm = executor.submit(timed, self.rag_generate_batch, queries, top_k, max_concurrency)
+            no_rag_arm = executor.submit(timed, self.generate_without_rag_batch, queries, max_concurrency)
+            rag_responses, rag_seconds = rag_arm.result()
+            no_rag_responses, no_rag_seconds = no_rag_arm.result()
+        wall_seconds = time.perf_counter() - started
+        
+        return {
+            'rag': rag_responses,
+            'no_rag': no_rag_responses,
+            'rag_seconds': rag_seconds,
+            'no_rag_seconds': no_rag_seconds,
+            'wall_seconds': wall_seconds,
+            'speedup': (rag_seconds + no_rag_seconds) / wall_seconds if wall_seconds > 0 else 1.0,
+        }
+    
+    def rag_generate_stream(self, query, top_k=2, details=None):
+        """
+        Generates a response using RAG, streaming the response
         
-        # Build prompt with retrieved context
-        context = "\n".join(results['documents'][0])
+        A near-duplicate query is answered from the semantic cache as a
+        single chunk; a streamed answer is stored in it once complete.
+        
+        Args:
+            query: The user's query
+            top_k: Number of relevant documents to retrieve
+            details: Optional dict that receives the fields of a rag_answer
+                result other than the answer, before the first chunk
+            
+        Yields:
+            Text chunks as they arrive
+        """
+        try:
+            # Retrieval counts against the generation deadline
+            deadline = deadline_after(GENERATION_DEADLINE_SECONDS)
+            query_embedding, version, hit, context = self._retrieve(query, top_k)
+            if details is not None:
+                details.update(self._describe(hit, context))
+            if hit is not None:
+                yield hit['answer']
+                return
+            chunks = []
+            for chunk in self.generate_text_stream(context['prompt'], deadline):
+                chunks.append(chunk)
+                yield chunk
+            self._remember(query, query_embedding, "".join(chunks), context, top_k, version)
+        except Exception as e:
+            print(f"Error in rag_generate: {e}")
+            raise
+    
+    def generate_without_rag(self, query):
+        """
+        Generates a response without using RAG (no additional context)
         
-        prompt = f"""Given the following context, please answer the question.
+        Args:
+            query: The user's query
+            
+        Returns:
+            The generated response without context
+        """
+        try:
+            prompt = query
+            return self.generate_text(prompt)
+        except Exception as e:
+            print(f"Error in generate_without_rag: {e}")
+            raise
 
-Context: {context}
 
-Question: {query}
+_default_system = None
+_default_lock = threading.Lock()
 
-Based on the provided context, my answer is:"""
-        
-        # Generate response
-        response = generate_text(prompt)
-        return response
-    except Exception as e:
-        print(f"Error in rag_generate: {e}")
-        raise
+
+def get_system():
+    """Returns the process-wide RAGSystem, creating it on first call"""
+    global _default_system
+    with _default_lock:
+        if _default_system is None:
+            _default_system = RAGSystem()
+        return _default_system
+
+
+def __getattr__(name):
+    # Module-level access to the lazily built resources (rag_system.collection, ...)
+    if name in ('bedrock_runtime', 'response_cache', 'embedding_cache', 'semantic_cache',
+                'chroma_client', 'collection'):
+        return getattr(get_system(), name)
+    if name == 'bedrock_ef':
+        return get_system().embedding_function
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def generate_text(prompt, deadline=None):
+    """Generates text using Claude 3 on Amazon Bedrock (see RAGSystem.generate_text)"""
+    return get_system().generate_text(prompt, deadline)
+
+
+def generate_text_stream(prompt, deadline=None):
+    """Streams text generated by Claude 3 (see RAGSystem.generate_text_stream)"""
+    return get_system().generate_text_stream(prompt, deadline)
+
+
+def add_documents(docs):
+    """Adds documents to the Chroma collection (see RAGSystem.add_documents)"""
+    return get_system().add_documents(docs)
+
+
+def remove_documents(docs=None, ids=None):
+    """Deletes documents from the Chroma collection (see RAGSystem.remove_documents)"""
+    return get_system().remove_documents(docs, ids)
+
+
+def rag_generate(query, top_k=2, timings=None):
+    """Generates a response using RAG (see RAGSystem.rag_generate)"""
+    return get_system().rag_generate(query, top_k, timings)
+
+
+def rag_answer(query, top_k=2, timings=None, deadline=None):
+    """Generates a response using RAG with its context (see RAGSystem.rag_answer)"""
+    return get_system().rag_answer(query, top_k, timings, deadline)
+
+
+def rag_generate_batch(queries, top_k=2, max_concurrency=GENERATION_MAX_CONCURRENCY):
+    """Generates RAG responses for many queries at once (see RAGSystem.rag_generate_batch)"""
+    return get_system().rag_generate_batch(queries, top_k, max_concurrency)
+
+
+def compare_batch(queries, top_k=2, max_concurrency=GENERATION_MAX_CONCURRENCY):
+    """Runs RAG and no-RAG generation concurrently (see RAGSystem.compare_batch)"""
+    return get_system().compare_batch(queries, top_k, max_concurrency)
+
+
+def rag_generate_stream(query, top_k=2, details=None):
+    """Streams a response generated using RAG (see RAGSystem.rag_generate_stream)"""
+    return get_system().rag_generate_stream(query, top_k, details)
 
 
 def generate_without_rag(query):
+    """Generates a response without using RAG (see RAGSystem.generate_without_rag)"""
+    return get_system().generate_without_rag(query)
+
+
+def measure_startup():
     """
-    Generates a response without using RAG (no additional context)
+    Measures how long a fresh interpreter takes to import this module
     
-    Args:
-        query: The user's query
-        
     Returns:
-        The generated response without context
+        Import time in seconds
     """
-    try:
-        prompt = query
-        return generate_text(prompt)
-    except Exception as e:
-        print(f"Error in generate_without_rag: {e}")
-        raise
+    result = subprocess.run(
+        [sys.executable, "-c",
+         "import time; started = time.perf_counter(); import rag_system; "
+         "print(time.perf_counter() - started)"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    return float(result.stdout.strip().splitlines()[-1])
 
 
 def main():
     """Main function to test the RAG system"""
+    configure_from_env()
     print("\n" + "="*80)
     print("RAG SYSTEM WITH AMAZON BEDROCK")
     print("="*80 + "\n")
@@ -225,23 +777,71 @@ def main():
         "How does Amazon Bedrock support foundation models?"
     ]
     
-    for query in test_queries:
+    # Run both arms for every query concurrently: the RAG arm retrieves in
+    # one batch while the no-RAG arm is already generating
+    comparison = compare_batch(test_queries)
+    
+    for query, rag_response, no_rag_response in zip(test_queries, comparison['rag'], comparison['no_rag']):
         print(f"\n{'='*80}")
         print(f"Query: {query}")
         print(f"{'='*80}\n")
         
         print("[RAG] Response with RAG:")
         print("-" * 80)
-        rag_response = rag_generate(query)
         print(rag_response)
         
         print("\n\n[WITHOUT RAG] Response without RAG:")
         print("-" * 80)
-        no_rag_response = generate_without_rag(query)
         print(no_rag_response)
         
         print("\n" + "="*80)
+    
+    print(f"\n[TIMING] RAG arm {comparison['rag_seconds']:.2f}s, "
+          f"without RAG arm {comparison['no_rag_seconds']:.2f}s, "
+          f"wall clock {comparison['wall_seconds']:.2f}s "
+          f"({comparison['speedup']:.2f}x speedup over sequential)")
+    
+    cache_stats = get_system().response_cache.stats()
+    print(f"\n[CACHE] Responses: {cache_stats['memory_hits'] + cache_stats['disk_hits']} hits, "
+          f"{cache_stats['misses']} misses, {cache_stats['bypasses']} bypassed, "
+          f"{cache_stats['latency_saved_seconds']:.2f}s saved")
+    semantic_cache = get_system().semantic_cache
+    if semantic_cache is not None:
+        semantic_stats = semantic_cache.stats()
+        print(f"[CACHE] Semantic answers: {semantic_stats['hits']} hits, "
+              f"{semantic_stats['misses']} misses ({semantic_stats['hit_rate']:.0%} hit rate), "
+              f"{semantic_stats['evictions']} evicted, {semantic_stats['invalidations']} invalidations")
+    context_stats = get_system().context_assembler.stats()
+    print(f"[CONTEXT] {context_stats['prompt_tokens']} prompt tokens for {context_stats['queries']} queries, "
+          f"{context_stats['prompt_tokens_saved']} saved ({context_stats['tokens_saved_per_query']:.1f} per query; "
+          f"{context_stats['duplicates_dropped']} duplicate and {context_stats['over_budget_dropped']} "
+          f"over-budget chunks dropped)")
+    invoker_stats = get_invoker().stats()
+    print(f"[DEADLINES] {invoker_stats['calls']} calls, {invoker_stats['hedges']} hedged "
+          f"({invoker_stats['hedge_wins']} won), {invoker_stats['fallbacks']} fell back "
+          f"({invoker_stats['fallback_wins']} won), {invoker_stats['deadlines_exceeded']} past the deadline")
+    for model_id, limits in limiter_stats().items():
+        print(f"[LIMITS] {model_id}: {limits['requests']} requests, {limits['throttles']} throttled, "
+              f"{limits['queued_seconds']:.2f}s queued, concurrency limit {limits['concurrency_limit']}")
+    collection = get_system().collection
+    if hasattr(collection, 'shards'):
+        shard_stats = collection.stats()
+        latencies = ", ".join(
+            f"{shard['p95_seconds'] * 1000:.1f}ms" if shard['p95_seconds'] is not None else "-"
+            for shard in shard_stats['per_shard']
+        )
+        print(f"[SHARDS] {shard_stats['queries']} fan-out queries over {shard_stats['shards']} shards, "
+              f"p95 search per shard: {latencies}")
+    stats = client_stats()
+    print(f"[CLIENTS] {stats['clients_created']} clients created, "
+          f"{stats['connection_reuses']} requests on reused connections")
 
 
 if __name__ == "__main__":
+    if "--startup-check" in sys.argv:
+        elapsed = measure_startup()
+        within = elapsed <= STARTUP_BUDGET_SECONDS
+        print(f"[{'OK' if within else 'SLOW'}] import rag_system took {elapsed:.3f}s "
+              f"(budget {STARTUP_BUDGET_SECONDS:.3f}s)")
+        sys.exit(0 if within else 1)
     main()
@@ -0,0 +1,340 @@
+"""
+Adaptive client-side rate limiting for Bedrock
+One limiter per model combines token buckets for requests per minute and
+tokens per minute with an AIMD concurrency limit: every success raises the
+limit a little, a ThrottlingException cuts it in half. Throttled calls are
+queued and retried with jittered backoff instead of failing the caller.
+
+botocore's own retries run first (see bedrock_clients); a throttle reaches
+the limiter once they are exhausted.
+"""
+
+import os
+import random
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+from instrumentation import get_instrumentation
+
+# Set BEDROCK_RATE_LIMIT=0 to call Bedrock without client-side limits
+RATE_LIMIT_ENABLED = os.environ.get("BEDROCK_RATE_LIMIT", "1") == "1"
+
+# Per-model budgets (0 means unlimited; Bedrock quotas are per minute)
+DEFAULT_REQUESTS_PER_MINUTE = float(os.environ.get("BEDROCK_RPM", "0"))
+DEFAULT_TOKENS_PER_MINUTE = float(os.environ.get("BEDROCK_TPM", "0"))
+# Seconds of budget a bucket can accumulate while idle
+BURST_SECONDS = 10.0
+
+# AIMD concurrency tunables
+DEFAULT_INITIAL_CONCURRENCY = int(os.environ.get("BEDROCK_INITIAL_CONCURRENCY", "8"))
+DEFAULT_MAX_CONCURRENCY = int(os.environ.get("BEDROCK_MAX_CONCURRENCY", "64"))
+MIN_CONCURRENCY = 1
+DECREASE_FACTOR = 0.5
+
+# Throttle retries
+DEFAULT_MAX_THROTTLE_RETRIES = 8
+THROTTLE_BACKOFF = 0.25
+MAX_THROTTLE_BACKOFF = 8.0
+
+# Stream events report throttling with a lower-case code
+THROTTLING_CODES = ('ThrottlingException', 'TooManyRequestsException', 'throttlingException')
+
+
+class RateLimitTimeout(TimeoutError):
+    """Raised when a queued request could not be sent before its deadline"""
+
+
+def estimate_tokens(text):
+    """Rough token count of a text (about four characters per token)"""
+    return max(1, len(text) // 4)
+
+
+def is_throttle(error):
+    """True if an exception is a Bedrock throttling error"""
+    return (isinstance(error, ClientError)
+            and error.response.get('Error', {}).get('Code') in THROTTLING_CODES)
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at a per-minute rate
+
+    Reservations may drive the level negative, so a request larger than the
+    burst still goes through once the debt is paid, and waiting requests
+    are served in the order they reserved.
+    """
+
+    def __init__(self, per_minute, burst_seconds=BURST_SECONDS):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self._level = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount):
+        """
+        Takes `amount` from the bucket
+
+        Returns:
+            Seconds to wait before the reservation may be used
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._level -= amount
+            return 0.0 if self._level >= 0 else -self._level / self.rate
+
+    def refund(self, amount):
+        """Returns `amount` to the bucket (negative amounts take more)"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._level = min(self.capacity, self._level + amount)
+
+
+class AIMDConcurrency:
+    """
+    Concurrency limit with additive increase and multiplicative decrease
+
+    Like TCP congestion control, the limit is cut at most once per window:
+    throttles of requests sent before the last cut are the same signal.
+    """
+
+    def __init__(self, initial=DEFAULT_INITIAL_CONCURRENCY, maximum=DEFAULT_MAX_CONCURRENCY,
+                 minimum=MIN_CONCURRENCY, decrease_factor=DECREASE_FACTOR):
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self, deadline=None):
+        """
+        Waits for a free slot
+
+        Returns:
+            The time the slot was taken (pass it to `release`), or None if
+            the deadline passed first
+        """
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                timeout = None if deadline is None else deadline - time.monotonic()
+                if timeout is not None and timeout <= 0:
+                    return None
+                self._condition.wait(timeout)
+            self.in_flight += 1
+            return time.monotonic()
+
+    def release(self, acquired, throttled=None):
+        """
+        Frees a slot and adapts the limit
+
+        Args:
+            acquired: The value returned by `acquire`
+            throttled: True after a throttle (decrease), False after a
+                success (increase), None to leave the limit unchanged
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if throttled is False:
+                # About +1 per limit's worth of successes (one round trip)
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            elif throttled and acquired >= self._last_decrease:
+                self.limit = max(self.minimum, self.limit * self.decrease_factor)
+                self._last_decrease = time.monotonic()
+            if throttled is not False or self.in_flight < int(self.limit):
+                self._condition.notify_all()
+
+
+class ModelLimiter:
+    """Request, token and concurrency limits of one model"""
+
+    def __init__(self, model_id, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+                 tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE,
+                 initial_concurrency=DEFAULT_INITIAL_CONCURRENCY,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 max_retries=DEFAULT_MAX_THROTTLE_RETRIES, sleep=time.sleep):
+        """
+        Args:
+            model_id: The model the limits apply to
+            requests_per_minute: Request budget (0 for unlimited)
+            tokens_per_minute: Token budget, input plus output (0 for unlimited)
+            initial_concurrency: Requests in flight allowed at start
+            max_concurrency: Upper bound of the adaptive concurrency limit
+            max_retries: Throttled attempts retried before the error is raised
+            sleep: Sleep function (replace in tests)
+        """
+        self.model_id = model_id
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.concurrency = AIMDConcurrency(initial_concurrency, max_concurrency)
+        self.max_retries = max_retries
+        self.sleep = sleep
+        self._random = random.Random()
+        self._lock = threading.Lock()
+        self._stats = {
+            'requests': 0,
+            'throttles': 0,
+            'timeouts': 0,
+            'queued_seconds': 0.0,
+        }
+
+    def _add(self, name, value=1):
+        with self._lock:
+            self._stats[name] += value
+
+    def _wait_for_budget(self, tokens, deadline):
+        waited = 0.0
+        wait = 0.0
+        if self.requests is not None:
+            wait = max(wait, self.requests.reserve(1))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.reserve(tokens))
+        if wait > 0:
+            if deadline is not None and time.monotonic() + wait > deadline:
+                self._refund(tokens)
+                raise RateLimitTimeout(f"{self.model_id}: request budget exhausted until after the deadline")
+            self.sleep(wait)
+            waited += wait
+        started = time.monotonic()
+        acquired = self.concurrency.acquire(deadline)
+        if acquired is None:
+            self._refund(tokens)
+            raise RateLimitTimeout(f"{self.model_id}: no free request slot before the deadline")
+        return acquired, waited + acquired - started
+
+    def _refund(self, tokens):
+        self._add('timeouts')
+        if self.requests is not None:
+            self.requests.refund(1)
+        if self.tokens is not None:
+            self.tokens.refund(tokens)
+
+    def call(self, func, tokens=1, deadline=None):
+        """
+        Runs a Bedrock request within the limits, retrying throttles
+
+        Args:
+            func: Zero-argument callable sending the request
+            tokens: Tokens reserved for the request (see record_usage)
+            deadline: Monotonic deadline for queueing (None waits as long as needed)
+
+        Returns:
+            The result of `func`
+
+        Raises:
+            RateLimitTimeout: If the request could not be sent before the deadline
+            botocore ClientError: If the request still throttles after `max_retries`
+        """
+        instrumentation = get_instrumentation()
+        attempt = 0
+        while True:
+            acquired, queued = self._wait_for_budget(tokens, deadline)
+            if queued:
+                self._add('queued_seconds', queued)
+                instrumentation.increment('bedrock_queued_seconds_total', queued, model=self.model_id)
+            self._add('requests')
+            try:
+                result = func()
+            except Exception as e:
+                if not is_throttle(e):
+                    self.concurrency.release(acquired)
+                    raise
+                self.concurrency.release(acquired, throttled=True)
+                self._add('throttles')
+                instrumentation.increment('bedrock_throttles_total', model=self.model_id)
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                # Full jitter keeps the queued callers from retrying in lockstep
+                delay = self._random.uniform(0, min(MAX_THROTTLE_BACKOFF, THROTTLE_BACKOFF * 2 ** (attempt - 1)))
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    self._add('timeouts')
+                    raise RateLimitTimeout(f"{self.model_id}: still throttled at the deadline") from e
+                self.sleep(delay)
+                continue
+            self.concurrency.release(acquired, throttled=False)
+            return result
+
+    def record_usage(self, reserved, used):
+        """
+        Corrects the token bucket once the real usage is known
+
+        Args:
+            reserved: Tokens passed to `call`
+            used: Input plus output tokens reported by Bedrock (None if unknown)
+        """
+        if self.tokens is not None and used is not None:
+            self.tokens.refund(reserved - used)
+
+    def stats(self):
+        """
+        Returns the limiter counters
+
+        Returns:
+            Dict with requests, throttles, timeouts, queued_seconds, the
+            current concurrency limit and the requests in flight
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats['concurrency_limit'] = int(self.concurrency.limit)
+        stats['in_flight'] = self.concurrency.in_flight
+        return stats
+
+
+class _Unlimited:
+    """Pass-through limiter used when rate limiting is disabled"""
+
+    def call(self, func, tokens=1, deadline=None):
+        return func()
+
+    def record_usage(self, reserved, used):
+        pass
+
+    def stats(self):
+        return {}
+
+
+_UNLIMITED = _Unlimited()
+_limiters = {}
+_limits = {}
+_lock = threading.Lock()
+
+
+def configure_limiter(model_id, **limits):
+    """
+    Sets the limits of a model (ModelLimiter keyword arguments)
+
+    Replaces the model's limiter; requests already queued keep the old one.
+    """
+    with _lock:
+        _limits[model_id] = limits
+        _limiters.pop(model_id, None)
+
+
+def get_limiter(model_id):
+    """Returns the shared limiter of a model, creating it on first use"""
+    if not RATE_LIMIT_ENABLED:
+        return _UNLIMITED
+    try:
+        return _limiters[model_id]
+    except KeyError:
+        with _lock:
+            limiter = _limiters.get(model_id)
+            if limiter is None:
+                limiter = _limiters[model_id] = ModelLimiter(model_id, **_limits.get(model_id, {}))
+            return limiter
+
+
+def limiter_stats():
+    """Returns the stats of every model limiter, by model id"""
+    with _lock:
+        limiters = dict(_limiters)
+    return {model_id: limiter.stats() for model_id, limiter in limiters.items()}
@@ -0,0 +1,275 @@
+"""
+Response cache for Bedrock text generation
+In-memory LRU with TTL expiry and an optional SQLite tier, keyed on the
+model id and the full request body (which carries the sampling params)
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Default cache configuration
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_TTL_SECONDS = 3600
+
+# Temperature assumed when a request leaves it to the provider default,
+# which is non-zero for every model family used here
+PROVIDER_DEFAULT_TEMPERATURE = 1.0
+
+
+def request_key(model_id, body):
+    """
+    Builds the cache key for a request
+
+    Args:
+        model_id: The Bedrock model id
+        body: The request body (JSON string or dict)
+
+    Returns:
+        SHA-256 hex digest of the model id and the canonical body
+    """
+    if isinstance(body, (str, bytes)):
+        body = json.loads(body)
+    canonical = json.dumps(body, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(f"{model_id}\n{canonical}".encode('utf-8')).hexdigest()
+
+
+def request_temperature(body):
+    """Returns the sampling temperature of a request body"""
+    if isinstance(body, (str, bytes)):
+        body = json.loads(body)
+    if 'temperature' in body:
+        return body['temperature']
+    config = body.get('textGenerationConfig', {})
+    return config.get('temperature', PROVIDER_DEFAULT_TEMPERATURE)
+
+
+class SQLiteResponseStore:
+    """On-disk response tier; any object with the same get/set/delete works"""
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                   key TEXT PRIMARY KEY,
+                   value TEXT NOT NULL,
+                   latency REAL NOT NULL,
+                   expires REAL NOT NULL
+               )"""
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        """Returns (value, latency, expires) or None"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT value, latency, expires FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+
+    def set(self, key, value, latency, expires):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, latency, expires) "
+                "VALUES (?, ?, ?, ?)",
+                (key, value, latency, expires)
+            )
+            self._conn.commit()
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._conn.commit()
+
+
+class ResponseCache:
+    """
+    Two-tier generation cache
+
+    Requests sampled with temperature > 0 bypass the cache unless
+    `cache_sampled` is set, since their answers are not meant to repeat.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 disk_path=None, disk_store=None, cache_sampled=False):
+        """
+        Args:
+            max_entries: Capacity of the in-memory LRU tier
+            ttl_seconds: Lifetime of a cached response
+            disk_path: SQLite file for the on-disk tier (optional)
+            disk_store: Custom on-disk tier (overrides disk_path)
+            cache_sampled: Also cache requests with temperature > 0
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.cache_sampled = cache_sampled
+        if disk_store is None and disk_path:
+            disk_store = SQLiteResponseStore(disk_path)
+        self.disk_store = disk_store
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.latency_saved = 0.0
+
+    def _memory_get(self, key, now):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            if entry[2] <= now:
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            return entry
+
+    def _memory_set(self, key, entry):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def lookup(self, key):
+        """
+        Returns the cached response for a key, or None
+
+        Args:
+            key: A key built with `request_key`
+        """
+        now = time.time()
+        entry = self._memory_get(key, now)
+        if entry is not None:
+            with self._lock:
+                self.memory_hits += 1
+                self.latency_saved += entry[1]
+            return entry[0]
+
+        if self.disk_store is not None:
+            entry = self.disk_store.get(key)
+            if entry is not None:
+                if entry[2] <= now:
+                    self.disk_store.delete(key)
+                else:
+                    self._memory_set(key, tuple(entry))
+                    with self._lock:
+                        self.disk_hits += 1
+                        self.latency_saved += entry[1]
+                    return entry[0]
+        return None
+
+    def store(self, key, value, latency):
+        """
+        Stores a response in every tier
+
+        Args:
+            key: A key built with `request_key`
+            value: The generated text
+            latency: Seconds it took to generate (used for metrics)
+        """
+        expires = time.time() + self.ttl_seconds
+        self._memory_set(key, (value, latency, expires))
+        if self.disk_store is not None:
+            self.disk_store.set(key, value, latency, expires)
+
+    def get_or_generate(self, model_id, body, generate, cacheable=None):
+        """
+        Returns a cached response or calls `generate` and caches its result
+
+        Args:
+            model_id: The Bedrock model id
+            body: The request body sent to the model
+            generate: Zero-argument callable that invokes the model
+            cacheable: Optional zero-argument callable checked once the
+                response is generated; False skips storing it (e.g. when a
+                fallback model answered instead of `model_id`)
+
+        Returns:
+            The generated (or cached) text
+        """
+        if not self.cache_sampled and request_temperature(body) > 0:
+            with self._lock:
+                self.bypasses += 1
+            return generate()
+
+        key = request_key(model_id, body)
+        value = self.lookup(key)
+        if value is not None:
+            return value
+
+        with self._lock:
+            self.misses += 1
+        started = time.perf_counter()
+        value = generate()
+        if value is not None and (cacheable is None or cacheable()):
+            self.store(key, value, time.perf_counter() - started)
+        return value
+
+    def get_or_stream(self, model_id, body, stream, cacheable=None):
+        """
+        Streaming counterpart of `get_or_generate`
+
+        A cached response is yielded as a single chunk; otherwise the chunks
+        from `stream` are passed through and the full text is cached once the
+        stream completes.
+
+        Args:
+            model_id: The Bedrock model id
+            body: The request body sent to the model
+            stream: Zero-argument callable returning an iterator of text chunks
+            cacheable: Optional zero-argument callable checked once the
+                stream completes (see get_or_generate)
+
+        Yields:
+            Text chunks
+        """
+        if not self.cache_sampled and request_temperature(body) > 0:
+            with self._lock:
+                self.bypasses += 1
+            yield from stream()
+            return
+
+        key = request_key(model_id, body)
+        value = self.lookup(key)
+        if value is not None:
+            yield value
+            return
+
+        with self._lock:
+            self.misses += 1
+        started = time.perf_counter()
+        parts = []
+        for chunk in stream():
+            parts.append(chunk)
+            yield chunk
+        if parts and (cacheable is None or cacheable()):
+            self.store(key, ''.join(parts), time.perf_counter() - started)
+
+    def clear(self):
+        """Drops the in-memory tier"""
+        with self._lock:
+            self._memory.clear()
+
+    def stats(self):
+        """Returns hit/miss counters and the generation time saved"""
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'bypasses': self.bypasses,
+                'hit_rate': hits / lookups if lookups else 0.0,
+                'entries': len(self._memory),
+                'latency_saved_seconds': self.latency_saved,
+            }
@@ -0,0 +1,136 @@
+"""
+Semantic answer cache
+Remembers answered RAG queries by their embedding and serves a stored answer
+(with the documents it was generated from) when a new query is similar
+enough, skipping retrieval and generation
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from numpy_index import normalize_rows
+
+DEFAULT_THRESHOLD = 0.95
+DEFAULT_MAX_ENTRIES = 1024
+
+
+class SemanticCache:
+    """
+    Cosine-similarity cache of RAG answers with LRU eviction
+
+    Query embeddings are kept as normalized rows of one float32 matrix, so
+    a lookup is a single matrix-vector product. Call `invalidate()` whenever
+    the document collection changes.
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, max_entries=DEFAULT_MAX_ENTRIES):
+        """
+        Args:
+            threshold: Minimum cosine similarity for a hit
+            max_entries: Maximum number of cached answers
+        """
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._matrix = None
+        self._top_k = None
+        self._entries = OrderedDict()
+        self.version = 0
+        self._free_rows = []
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    def lookup(self, embedding, top_k):
+        """
+        Finds the cached answer of the most similar query
+
+        Args:
+            embedding: Embedding of the incoming query
+            top_k: Number of documents the answer must have been built from
+
+        Returns:
+            Dict with query, answer, documents and similarity, or None
+        """
+        vector = normalize_rows(embedding)[0]
+        with self._lock:
+            if self._entries:
+                similarities = np.where(self._top_k == top_k, self._matrix @ vector, -np.inf)
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self._entries.move_to_end(best)
+                    self._stats['hits'] += 1
+                    entry = self._entries[best]
+                    return {
+                        'query': entry['query'],
+                        'answer': entry['answer'],
+                        'documents': list(entry['documents']),
+                        'similarity': float(similarities[best]),
+                    }
+            self._stats['misses'] += 1
+            return None
+
+    def store(self, query, embedding, answer, documents, top_k, version=None):
+        """
+        Caches an answer
+
+        Answers computed before the last invalidation are dropped: pass the
+        `version` read before retrieval started.
+
+        Args:
+            query: The query that was answered
+            embedding: Its embedding
+            answer: The generated answer
+            documents: The retrieved documents the answer was based on
+            top_k: Number of documents retrieved
+            version: Value of `version` when the answer was started
+        """
+        vector = normalize_rows(embedding)[0]
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+                self._top_k = np.full(self.max_entries, -1)
+                self._free_rows = list(range(self.max_entries - 1, -1, -1))
+            if not self._free_rows:
+                row, _ = self._entries.popitem(last=False)
+                self._top_k[row] = -1
+                self._free_rows.append(row)
+                self._stats['evictions'] += 1
+            row = self._free_rows.pop()
+            self._matrix[row] = vector
+            self._top_k[row] = top_k
+            self._entries[row] = {
+                'query': query,
+                'answer': answer,
+                'documents': list(documents),
+                'top_k': top_k,
+            }
+
+    def invalidate(self):
+        """Drops every cached answer (the collection changed)"""
+        with self._lock:
+            self.version += 1
+            if self._entries:
+                self._stats['invalidations'] += 1
+            self._entries.clear()
+            if self._matrix is not None:
+                self._top_k[:] = -1
+                self._free_rows = list(range(self.max_entries - 1, -1, -1))
+
+    def stats(self):
+        """
+        Returns the cache counters
+
+        Returns:
+            Dict with hits, misses, hit_rate, evictions, invalidations and entries
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,550 @@
+"""
+Asyncio HTTP server for the RAG pipeline
+Serves rag_generate, generate_without_rag and document ingestion as JSON
+endpoints over AsyncRAGPipeline, using only the standard library:
+
+    POST /rag        {"query": "...", "top_k": 2}  -> {"answer": "...", "coalesced": false}
+    POST /generate   {"query": "..."}              -> {"answer": "...", "coalesced": false}
+    POST /documents  {"documents": ["...", ...]}   -> {"added": 2, "skipped": 0}
+    GET  /metrics    Prometheus text format
+    GET  /health     {"status": "ok", "pending": 0, "in_flight_calls": 0}
+
+Identical concurrent queries are coalesced (single flight): the first one
+calls Bedrock and the others wait for its answer. Requests admitted but not
+finished are bounded by SERVER_MAX_PENDING; beyond it the server answers
+429 with Retry-After instead of queueing without limit.
+
+Usage:
+    python server.py --port 8080
+    python server.py --load-test --requests 2000 --concurrency 200 --distinct 50
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from instrumentation import (
+    MetricsInstrumentation, PrometheusExporter, configure_from_env, get_instrumentation,
+    set_instrumentation
+)
+from rag_async import AsyncRAGPipeline
+
+DEFAULT_HOST = os.environ.get("SERVER_HOST", "127.0.0.1")
+DEFAULT_PORT = int(os.environ.get("SERVER_PORT", "8080"))
+# Requests admitted (running or waiting for the pipeline) before 429s
+DEFAULT_MAX_PENDING = int(os.environ.get("SERVER_MAX_PENDING", "512"))
+# Set SERVER_COALESCE=0 to send every request to Bedrock
+COALESCE_ENABLED = os.environ.get("SERVER_COALESCE", "1") == "1"
+
+MAX_BODY_BYTES = 10 * 1024 * 1024
+MAX_HEADERS = 100
+MAX_TOP_K = 100
+RETRY_AFTER_SECONDS = 1
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    429: "Too Many Requests",
+    500: "Internal Server Error",
+    504: "Gateway Timeout",
+}
+
+
+class HTTPError(Exception):
+    """Error answered to the client with an HTTP status"""
+
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class SingleFlight:
+    """
+    Shares one in-flight call among identical concurrent requests
+
+    The call runs as its own task, so a client that disconnects stops
+    waiting without cancelling the answer the other clients are waiting for.
+    """
+
+    def __init__(self):
+        self._calls = {}
+
+    def __contains__(self, key):
+        return key in self._calls
+
+    def __len__(self):
+        return len(self._calls)
+
+    def start(self, key, coroutine):
+        """Runs `coroutine` as the call of `key` and returns its result (awaitable)"""
+        task = self._calls[key] = asyncio.ensure_future(coroutine)
+        task.add_done_callback(lambda done: self._finish(key, done))
+        return asyncio.shield(task)
+
+    def join(self, key):
+        """Waits for the result of the call already running for `key`"""
+        return asyncio.shield(self._calls[key])
+
+    def _finish(self, key, task):
+        self._calls.pop(key, None)
+        # Every waiter may have gone; mark the error as retrieved
+        if not task.cancelled():
+            task.exception()
+
+
+def _normalize(query):
+    """Key form of a query: surrounding and repeated whitespace do not matter"""
+    return " ".join(query.split())
+
+
+class RAGServer:
+    """JSON HTTP front end of an AsyncRAGPipeline"""
+
+    def __init__(self, pipeline=None, max_pending=DEFAULT_MAX_PENDING, coalesce=COALESCE_ENABLED,
+                 exporter=None):
+        """
+        Args:
+            pipeline: AsyncRAGPipeline answering the requests (a new one if None)
+            max_pending: Requests admitted at once; more are answered with 429
+            coalesce: Share one Bedrock call among identical concurrent queries
+            exporter: PrometheusExporter rendered by /metrics (None serves
+                only the server's own gauges)
+        """
+        self.pipeline = pipeline or AsyncRAGPipeline()
+        self.max_pending = max_pending
+        self.coalesce = coalesce
+        self.exporter = exporter
+        self.flights = SingleFlight()
+        self.pending = 0
+        self.peak_pending = 0
+        self._server = None
+        self._stats = {
+            'requests': 0,
+            'coalesced': 0,
+            'rejected': 0,
+            'errors': 0,
+        }
+        self._routes = {
+            '/rag': ('POST', self._rag),
+            '/generate': ('POST', self._generate),
+            '/documents': ('POST', self._documents),
+            '/metrics': ('GET', self._metrics),
+            '/health': ('GET', self._health),
+        }
+
+    def _count(self, name, **labels):
+        self._stats[name] += 1
+        get_instrumentation().increment(f"server_{name}_total", **labels)
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        """
+        Builds the collection and starts listening
+
+        Returns:
+            The (host, port) the server is bound to
+        """
+        await self.pipeline.start()
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        """Stops listening and shuts the pipeline down"""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        self.pipeline.close()
+
+    def stats(self):
+        """
+        Returns the server counters
+
+        Returns:
+            Dict with requests, coalesced, rejected, errors, the requests
+            pending now and at most
+        """
+        stats = dict(self._stats)
+        stats['pending'] = self.pending
+        stats['peak_pending'] = self.peak_pending
+        return stats
+
+    async def _dispatch(self, key, factory):
+        """
+        Runs `factory()` within the pending bound, once per key at a time
+
+        Args:
+            key: Single-flight key (None never coalesces)
+            factory: Zero-argument callable returning the coroutine to run
+
+        Returns:
+            Tuple (result, True if it was shared with an earlier request)
+        """
+        if key is not None and key in self.flights:
+            self._count('coalesced', route=key[0])
+            return await self.flights.join(key), True
+        if self.pending >= self.max_pending:
+            raise HTTPError(429, "Too many pending requests",
+                            {"Retry-After": str(RETRY_AFTER_SECONDS)})
+        self.pending += 1
+        self.peak_pending = max(self.peak_pending, self.pending)
+        coroutine = self._release_after(factory())
+        if key is None:
+            return await coroutine, False
+        return await self.flights.start(key, coroutine), False
+
+    async def _release_after(self, coroutine):
+        try:
+            return await coroutine
+        finally:
+            self.pending -= 1
+
+    def _key(self, *parts):
+        return parts if self.coalesce else None
+
+    async def _rag(self, payload):
+        query = _query(payload)
+        top_k = payload.get('top_k', 2)
+        if not isinstance(top_k, int) or isinstance(top_k, bool) or not 1 <= top_k <= MAX_TOP_K:
+            raise HTTPError(400, f"top_k must be an integer from 1 to {MAX_TOP_K}")
+        answer, shared = await self._dispatch(
+            self._key('/rag', _normalize(query), top_k),
+            lambda: self.pipeline.rag_generate(query, top_k)
+        )
+        return {'answer': answer, 'coalesced': shared}
+
+    async def _generate(self, payload):
+        query = _query(payload)
+        answer, shared = await self._dispatch(
+            self._key('/generate', _normalize(query)),
+            lambda: self.pipeline.generate_without_rag(query)
+        )
+        return {'answer': answer, 'coalesced': shared}
+
+    async def _documents(self, payload):
+        documents = payload.get('documents')
+        if (not isinstance(documents, list) or not documents
+                or not all(isinstance(document, str) for document in documents)):
+            raise HTTPError(400, "documents must be a non-empty list of strings")
+        (added, skipped), _ = await self._dispatch(None, lambda: self.pipeline.add_documents(documents))
+        return {'added': added, 'skipped': skipped}
+
+    async def _metrics(self, payload):
+        lines = [self.exporter.render()] if self.exporter is not None else []
+        for name, value in (('server_pending_requests', self.pending),
+                            ('server_in_flight_calls', len(self.flights))):
+            lines.append(f"# TYPE {name} gauge\n{name} {value}\n")
+        return "".join(lines)
+
+    async def _health(self, payload):
+        return {'status': 'ok', 'pending': self.pending, 'in_flight_calls': len(self.flights)}
+
+    async def handle(self, method, path, body):
+        """
+        Answers one request
+
+        Args:
+            method: HTTP method
+            path: Request path (the query string is ignored)
+            body: Request body bytes
+
+        Returns:
+            Tuple (status, response payload, extra headers)
+        """
+        route = path.split("?")[0]
+        if route not in self._routes:
+            # Unknown paths share one label so clients cannot grow the metric series
+            self._count('requests', route='unknown')
+            return 404, {'error': f"No route {route}"}, {}
+        self._count('requests', route=route)
+        try:
+            allowed, handler = self._routes[route]
+            if method != allowed:
+                raise HTTPError(405, f"{route} only accepts {allowed}", {"Allow": allowed})
+            payload = {}
+            if allowed == 'POST':
+                try:
+                    payload = json.loads(body or b"{}")
+                except ValueError as e:
+                    raise HTTPError(400, f"Invalid JSON: {e}")
+                if not isinstance(payload, dict):
+                    raise HTTPError(400, "The body must be a JSON object")
+            return 200, await handler(payload), {}
+        except HTTPError as e:
+            if e.status == 429:
+                self._count('rejected', route=route)
+            return e.status, {'error': str(e)}, e.headers
+        except (asyncio.TimeoutError, TimeoutError) as e:
+            # Stage timeouts, DeadlineExceeded and RateLimitTimeout
+            self._count('errors', route=route)
+            return 504, {'error': f"{type(e).__name__}: {e}".rstrip(": ")}, {}
+        except Exception as e:
+            self._count('errors', route=route)
+            print(f"[ERROR] {route}: {type(e).__name__}: {e}")
+            return 500, {'error': f"{type(e).__name__}: {e}"}, {}
+
+    async def _handle_connection(self, reader, writer):
+        # HTTP/1.1 with keep-alive; requests on a connection are answered in order
+        try:
+            while True:
+                try:
+                    request = await _read_request(reader)
+                except HTTPError as e:
+                    await _write_response(writer, e.status, {'error': str(e)}, e.headers, False)
+                    break
+                if request is None:
+                    break
+                method, path, body, keep_alive = request
+                status, payload, headers = await self.handle(method, path, body)
+                await _write_response(writer, status, payload, headers, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+def _query(payload):
+    query = payload.get('query')
+    if not isinstance(query, str) or not query.strip():
+        raise HTTPError(400, "query must be a non-empty string")
+    return query
+
+
+async def _read_request(reader):
+    """
+    Reads one HTTP request
+
+    Returns:
+        Tuple (method, path, body, keep_alive), or None when the client
+        closed the connection
+    """
+    try:
+        line = await reader.readline()
+        if not line:
+            return None
+        parts = line.decode('latin-1').split()
+        if len(parts) != 3 or not parts[2].startswith("HTTP/"):
+            raise HTTPError(400, "Malformed request line")
+        method, path, version = parts
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            if len(headers) >= MAX_HEADERS:
+                raise HTTPError(400, "Too many headers")
+            name, _, value = line.decode('latin-1').partition(":")
+            headers[name.strip().lower()] = value.strip()
+    except ValueError:
+        # StreamReader raises it for lines over its buffer limit
+        raise HTTPError(400, "Request line or header too long")
+
+    try:
+        length = int(headers.get('content-length', "0"))
+    except ValueError:
+        raise HTTPError(400, "Invalid Content-Length")
+    if length < 0:
+        raise HTTPError(400, "Invalid Content-Length")
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(413, f"Body larger than {MAX_BODY_BYTES} bytes")
+    body = await reader.readexactly(length) if length else b""
+
+    connection = headers.get('connection', "").lower()
+    keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+    return method, path, body, keep_alive
+
+
+async def _write_response(writer, status, payload, headers, keep_alive):
+    if isinstance(payload, str):
+        body = payload.encode('utf-8')
+        content_type = "text/plain; version=0.0.4"
+    else:
+        body = json.dumps(payload).encode('utf-8')
+        content_type = "application/json"
+    lines = [
+        f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+        f"Content-Type: {content_type}",
+        f"Content-Length: {len(body)}",
+        f"Connection: {'keep-alive' if keep_alive else 'close'}",
+    ]
+    lines.extend(f"{name}: {value}" for name, value in headers.items())
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1') + body)
+    await writer.drain()
+
+
+def prometheus_exporter():
+    """
+    Returns the PrometheusExporter of the process instrumentation
+
+    Installs exporters from RAG_INSTRUMENTATION and adds a Prometheus
+    exporter if none is configured, keeping the others.
+    """
+    instrumentation = configure_from_env()
+    exporters = list(getattr(instrumentation, 'exporters', []))
+    for exporter in exporters:
+        if isinstance(exporter, PrometheusExporter):
+            return exporter
+    exporter = PrometheusExporter()
+    set_instrumentation(MetricsInstrumentation(exporters + [exporter]))
+    return exporter
+
+
+async def _client_request(reader, writer, path, payload):
+    """Sends one POST on a keep-alive connection; returns (status, response payload)"""
+    body = json.dumps(payload).encode('utf-8')
+    writer.write(
+        f"POST {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n".encode('latin-1') + body
+    )
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode('latin-1').partition(":")
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def load_test(host, port, queries, concurrency, path='/rag'):
+    """
+    Sends `queries` to a running server over `concurrency` connections
+
+    Args:
+        host: Server host
+        port: Server port
+        queries: Queries to send, in order
+        concurrency: Connections sending requests at once
+        path: Endpoint receiving {"query": ...}
+
+    Returns:
+        Dict with the latencies of the answered requests, the counts per
+        status, the coalesced answers and the wall-clock seconds
+    """
+    remaining = iter(queries)
+    latencies = []
+    statuses = {}
+    coalesced = 0
+
+    async def worker():
+        nonlocal coalesced
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            for query in remaining:
+                started = time.perf_counter()
+                status, payload = await _client_request(reader, writer, path, {'query': query})
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == 200:
+                    latencies.append(time.perf_counter() - started)
+                    coalesced += payload.get('coalesced', False)
+        finally:
+            writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return {
+        'latencies': latencies,
+        'statuses': statuses,
+        'coalesced': coalesced,
+        'seconds': time.perf_counter() - started,
+    }
+
+
+async def run_load_test(args):
+    """Starts a server on a fake Bedrock, loads it and prints the results"""
+    from benchmark import make_corpus, make_queries, summarize
+    from bedrock_clients import register_client
+    from fake_bedrock import FakeBedrock, LatencyModel
+    from rag_system import RAGSystem
+
+    fake = FakeBedrock(latency=LatencyModel.parse(args.latency, args.seed), seed=args.seed)
+    register_client('bedrock-runtime', fake)
+    register_client('bedrock', fake)
+    system = RAGSystem(
+        embedding_cache_path=None,
+        load_samples=False,
+        collection_name="server_load_test",
+        semantic_cache=False
+    )
+    server = RAGServer(AsyncRAGPipeline(system), max_pending=args.max_pending,
+                       coalesce=not args.no_coalesce, exporter=prometheus_exporter())
+    host, port = await server.start(args.host, 0)
+    try:
+        await server.pipeline.add_documents(make_corpus(args.corpus_size))
+        distinct = make_queries(args.distinct)
+        queries = [distinct[i % len(distinct)] for i in range(args.requests)]
+        calls_before = fake.stats()['calls']
+        result = await load_test(host, port, queries, args.concurrency)
+    finally:
+        await server.close()
+
+    latency = summarize(result['latencies'])
+    answered = result['statuses'].get(200, 0)
+    print(f"\n[LOAD] {args.requests} requests ({args.distinct} distinct) over "
+          f"{args.concurrency} connections in {result['seconds']:.2f}s: "
+          f"{answered / result['seconds']:.1f} answers/s")
+    if latency['count']:
+        print(f"[LOAD] Latency p50 {latency['p50'] * 1000:.0f}ms, p95 {latency['p95'] * 1000:.0f}ms, "
+              f"p99 {latency['p99'] * 1000:.0f}ms")
+    print(f"[LOAD] Status counts: {dict(sorted(result['statuses'].items()))}")
+    stats = server.stats()
+    print(f"[LOAD] {result['coalesced']} answers coalesced, {stats['rejected']} rejected (429), "
+          f"peak {stats['peak_pending']} pending of {args.max_pending}, "
+          f"{fake.stats()['calls'] - calls_before} Bedrock calls")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the RAG pipeline over HTTP")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--max-pending", type=int, default=DEFAULT_MAX_PENDING,
+                        help="Requests admitted at once before answering 429")
+    parser.add_argument("--no-coalesce", action="store_true",
+                        help="Send every request to Bedrock, even identical concurrent ones")
+    parser.add_argument("--load-test", action="store_true",
+                        help="Load an in-process server backed by the offline Bedrock stand-in")
+    parser.add_argument("--requests", type=int, default=1000, help="Load test requests")
+    parser.add_argument("--concurrency", type=int, default=100, help="Load test connections")
+    parser.add_argument("--distinct", type=int, default=50, help="Distinct load test queries")
+    parser.add_argument("--corpus-size", type=int, default=200, help="Documents ingested for the load test")
+    parser.add_argument("--latency", default="lognormal:0.05,0.3",
+                        help="Fake Bedrock latency model (see fake_bedrock.LatencyModel)")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+async def serve(args):
+    server = RAGServer(max_pending=args.max_pending, coalesce=not args.no_coalesce,
+                       exporter=prometheus_exporter())
+    host, port = await server.start(args.host, args.port)
+    print(f"[OK] Serving on http://{host}:{port} (max {args.max_pending} pending requests)")
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        asyncio.run(run_load_test(args) if args.load_test else serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,275 @@
+"""
+Sharded vector collections
+Partitions documents across N collections by a hash of their id and answers
+queries by searching every shard concurrently and merging the per-shard
+top-k into the global top-k. ShardedClient and ShardedCollection have the
+Chroma client and collection API, so RAGSystem and the ingestion helpers
+use them unchanged (VECTOR_SHARDS=N, see vector_store.create_client).
+
+Every shard of a persistent store lives in its own directory, so separate
+processes can write different shards at the same time (ingest.py --processes).
+Shard names include the shard count: changing it starts new collections
+rather than misrouting the documents already stored.
+"""
+
+import heapq
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from deadlines import LatencyTracker
+from instrumentation import get_instrumentation
+from vector_store import content_hash
+
+# Threads searching and writing shards (shared by every sharded collection)
+SHARD_MAX_WORKERS = int(os.environ.get("VECTOR_SHARD_WORKERS", "32"))
+
+
+def shard_of(doc_id, shards):
+    """Returns the shard (0 to shards - 1) holding a document id"""
+    return int(content_hash(doc_id)[:8], 16) % shards
+
+
+def shard_name(name, shard, shards):
+    """Returns the collection name of one shard"""
+    return f"{name}_shard{shard}of{shards}"
+
+
+def shard_directory(persist_directory, shard, shards):
+    """Returns the store directory of one shard"""
+    return os.path.join(persist_directory, f"shard{shard}of{shards}")
+
+
+def _select(values, positions):
+    return None if values is None else [values[i] for i in positions]
+
+
+class ShardedCollection:
+    """Chroma-style collection spread over one collection per shard"""
+
+    def __init__(self, name, shards, executor, embedding_function=None):
+        """
+        Args:
+            name: Name of the sharded collection
+            shards: The per-shard collections, in shard order
+            executor: Thread pool running the per-shard calls
+            embedding_function: Embeds query texts once for every shard
+        """
+        self.name = name
+        self.shards = list(shards)
+        self.embedding_function = embedding_function
+        self._executor = executor
+        self._trackers = [LatencyTracker() for _ in self.shards]
+        self._lock = threading.Lock()
+        self._queries = 0
+
+    def _fan_out(self, calls):
+        """Runs {shard: zero-argument callable} concurrently; returns {shard: result}"""
+        if len(calls) == 1:
+            (shard, call), = calls.items()
+            return {shard: call()}
+        futures = {shard: self._executor.submit(call) for shard, call in calls.items()}
+        return {shard: future.result() for shard, future in futures.items()}
+
+    def _partition(self, ids):
+        """Groups the positions of `ids` by shard"""
+        positions = {}
+        for i, doc_id in enumerate(ids):
+            positions.setdefault(shard_of(doc_id, len(self.shards)), []).append(i)
+        return positions
+
+    def count(self):
+        return sum(self._fan_out({i: shard.count for i, shard in enumerate(self.shards)}).values())
+
+    def _write(self, method, ids, documents, metadatas, embeddings):
+        def call(shard, positions):
+            kwargs = {'ids': _select(ids, positions)}
+            for field, values in (('documents', documents), ('metadatas', metadatas),
+                                  ('embeddings', embeddings)):
+                if values is not None:
+                    kwargs[field] = _select(values, positions)
+            # Each shard embeds its own documents, so embedding runs per shard in parallel
+            return lambda: getattr(self.shards[shard], method)(**kwargs)
+
+        self._fan_out({shard: call(shard, positions) for shard, positions in self._partition(ids).items()})
+
+    def add(self, ids, documents=None, metadatas=None, embeddings=None):
+        self._write('add', ids, documents, metadatas, embeddings)
+
+    def upsert(self, ids, documents=None, metadatas=None, embeddings=None):
+        self._write('upsert', ids, documents, metadatas, embeddings)
+
+    def get(self, ids=None, include=('documents', 'metadatas'), limit=None):
+        """
+        Returns stored documents
+
+        Args:
+            ids: Ids to fetch (None for every document); unknown ids are ignored
+            include: Fields to return ('documents', 'metadatas', 'embeddings')
+            limit: Maximum number of documents
+
+        Returns:
+            Dict with 'ids' and the included fields, shard by shard
+        """
+        include = list(include)
+        if ids is None:
+            calls = {i: (lambda shard=shard: shard.get(include=include))
+                     for i, shard in enumerate(self.shards)}
+        else:
+            calls = {
+                shard: (lambda shard=shard, positions=positions:
+                        self.shards[shard].get(ids=_select(ids, positions), include=include))
+                for shard, positions in self._partition(list(ids)).items()
+            }
+        result = {'ids': []}
+        for field in include:
+            result[field] = []
+        for shard, part in sorted(self._fan_out(calls).items()):
+            result['ids'].extend(part['ids'])
+            for field in include:
+                values = part.get(field)
+                if values is not None:
+                    result[field].extend(list(values))
+        if limit is not None:
+            result = {field: values[:limit] for field, values in result.items()}
+        return result
+
+    def delete(self, ids):
+        self._fan_out({
+            shard: (lambda shard=shard, positions=positions:
+                    self.shards[shard].delete(ids=_select(ids, positions)))
+            for shard, positions in self._partition(list(ids)).items()
+        })
+
+    def _search(self, shard, query_embeddings, n_results, include, where):
+        kwargs = {'where': where} if where else {}
+        started = time.perf_counter()
+        with get_instrumentation().span('shard_search', shard=shard):
+            result = self.shards[shard].query(
+                query_embeddings=query_embeddings, n_results=n_results, include=include, **kwargs
+            )
+        self._trackers[shard].record(time.perf_counter() - started)
+        return result
+
+    def query(self, query_embeddings=None, query_texts=None, n_results=10,
+              include=('documents', 'metadatas', 'distances'), where=None):
+        """
+        Returns the nearest documents to each query across every shard
+
+        Every shard returns its own top `n_results`; the global top
+        `n_results` is the best of those by distance.
+
+        Args:
+            query_embeddings: List of query embeddings
+            query_texts: List of query texts (embedded once with the embedding function)
+            n_results: Number of results per query
+            include: Fields to return ('documents', 'metadatas', 'distances', 'embeddings')
+            where: Metadata filters, passed to every shard
+
+        Returns:
+            Dict of per-query lists, in the Chroma result format
+        """
+        if query_embeddings is None:
+            if query_texts is None:
+                raise ValueError("query_embeddings or query_texts is required")
+            query_embeddings = self.embedding_function(list(query_texts))
+        query_embeddings = list(query_embeddings)
+        include = list(include)
+        # Distances are needed to merge, even when the caller does not want them
+        shard_include = include if 'distances' in include else include + ['distances']
+
+        results = self._fan_out({
+            shard: (lambda shard=shard: self._search(shard, query_embeddings, n_results, shard_include, where))
+            for shard in range(len(self.shards))
+        })
+        with self._lock:
+            self._queries += 1
+
+        merged = {'ids': []}
+        for field in include:
+            merged[field] = []
+        for q in range(len(query_embeddings)):
+            candidates = (
+                (distance, shard, j)
+                for shard, result in results.items()
+                for j, distance in enumerate(result['distances'][q])
+            )
+            best = heapq.nsmallest(n_results, candidates)
+            merged['ids'].append([results[shard]['ids'][q][j] for _, shard, j in best])
+            for field in include:
+                merged[field].append([results[shard][field][q][j] for _, shard, j in best])
+        return merged
+
+    def flush(self):
+        """Flushes the shards that buffer writes (the numpy backend)"""
+        for shard in self.shards:
+            flush = getattr(shard, 'flush', None)
+            if flush is not None:
+                flush()
+
+    def stats(self):
+        """
+        Returns the fan-out counters
+
+        Returns:
+            Dict with the number of shards, the queries fanned out and the
+            p50/p95/p99 search seconds of every shard
+        """
+        with self._lock:
+            queries = self._queries
+        return {
+            'shards': len(self.shards),
+            'queries': queries,
+            'per_shard': [
+                {'shard': shard, **{f"p{p}_seconds": tracker.percentile(p) for p in (50, 95, 99)}}
+                for shard, tracker in enumerate(self._trackers)
+            ],
+        }
+
+
+class ShardedClient:
+    """Chroma-style client handing out ShardedCollections"""
+
+    def __init__(self, clients, max_workers=SHARD_MAX_WORKERS):
+        """
+        Args:
+            clients: One vector store client per shard, in shard order
+            max_workers: Threads running per-shard calls
+        """
+        self.clients = list(clients)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(len(self.clients), max_workers),
+            thread_name_prefix="vector-shard"
+        )
+
+    def get_or_create_collection(self, name, embedding_function=None):
+        shards = len(self.clients)
+        return ShardedCollection(
+            name,
+            [
+                client.get_or_create_collection(name=shard_name(name, i, shards),
+                                                embedding_function=embedding_function)
+                for i, client in enumerate(self.clients)
+            ],
+            self._executor,
+            embedding_function
+        )
+
+    def delete_collection(self, name):
+        errors = []
+        shards = len(self.clients)
+        for i, client in enumerate(self.clients):
+            try:
+                client.delete_collection(name=shard_name(name, i, shards))
+            except Exception as e:
+                errors.append(e)
+        if len(errors) == shards:
+            raise errors[0]
+
+    def flush(self):
+        """Flushes the shards of clients that buffer writes (the numpy backend)"""
+        for client in self.clients:
+            flush = getattr(client, 'flush', None)
+            if flush is not None:
+                flush()
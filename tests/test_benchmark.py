@@ -0,0 +1,25 @@
+import main
+from bedrock_clients import clear_clients, register_client
+from benchmark import parse_args, run
+from fake_bedrock import FakeBedrock
+
+
+def test_every_timed_request_reaches_bedrock(monkeypatch):
+    monkeypatch.setattr(main, 'response_cache', main.response_cache)
+    fake = FakeBedrock(sleep=lambda seconds: None)
+    register_client('bedrock-runtime', fake)
+    register_client('bedrock', fake)
+    args = parse_args(['--corpus-sizes', '20', '--concurrency', '1,4', '--queries', '6',
+                       '--backends', 'numpy'])
+    try:
+        report = run(args, fake)
+    finally:
+        clear_clients()
+
+    calls = {(result['workload'], result['concurrency']): result['bedrock_calls']
+             for result in report['results'] if 'bedrock_calls' in result}
+    for concurrency in (1, 4):
+        # One query embedding and one generation per RAG request
+        assert calls['rag_generate', concurrency] == 2 * 6
+        assert calls['generate_without_rag', concurrency] == 6
+        assert calls['chat_with_bedrock', concurrency] == 6
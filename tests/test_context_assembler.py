@@ -0,0 +1,60 @@
+from context_assembler import PROMPT_PREFIX, ContextAssembler, build_rag_prompt
+
+
+def words(text):
+    return len(text.split())
+
+
+def chunk(name, size):
+    return " ".join([name] * size)
+
+
+def test_chunks_are_packed_best_first_within_the_budget():
+    base = words(build_rag_prompt("q", []))
+    assembler = ContextAssembler(token_budget=base + 25, estimate=words)
+    documents = [chunk("far", 10), chunk("best", 10), chunk("next", 10), chunk("small", 3)]
+
+    result = assembler.assemble("q", documents, distances=[0.9, 0.1, 0.2, 0.5])
+
+    assert result['documents'] == [chunk("best", 10), chunk("next", 10), chunk("small", 3)]
+    assert result['prompt_tokens'] <= base + 25
+    assert result['over_budget'] == 1
+    assert result['prompt_tokens_saved'] == 10
+
+
+def test_best_chunk_is_truncated_when_nothing_fits():
+    base = words(build_rag_prompt("q", []))
+    assembler = ContextAssembler(token_budget=base + 5, estimate=words)
+
+    result = assembler.assemble("q", ["one two three four five six seven eight nine ten " * 10])
+
+    assert result['documents'] and len(result['documents'][0]) < 100
+    assert result['over_budget'] == 0
+
+
+def test_near_duplicates_of_better_chunks_are_dropped():
+    assembler = ContextAssembler(token_budget=None, duplicate_threshold=0.95)
+    documents = ["original text", "reworded text", "other topic", "original text"]
+    embeddings = [[1.0, 0.0], [0.99, 0.05], [0.0, 1.0], [0.2, 0.98]]
+
+    result = assembler.assemble("q", documents, embeddings=embeddings)
+
+    assert result['documents'] == ["original text", "other topic"]
+    assert result['duplicates'] == 2
+    assert assembler.stats()['duplicates_dropped'] == 2
+
+
+def test_prompt_prefix_is_identical_across_queries():
+    assembler = ContextAssembler(token_budget=50)
+    prompts = [
+        assembler.assemble(query, documents)['prompt']
+        for query, documents in (
+            ("What is RAG?", ["RAG retrieves context first."]),
+            ("Who hosts Claude?", ["Bedrock hosts foundation models. " * 40]),
+            ("Anything?", []),
+        )
+    ]
+
+    for prompt in prompts:
+        assert prompt.encode('utf-8').startswith(PROMPT_PREFIX.encode('utf-8'))
+    assert build_rag_prompt("x", ["y"]).startswith(PROMPT_PREFIX)
@@ -0,0 +1,126 @@
+import json
+import threading
+
+from conversation import SUMMARY_PREFIX, ConversationMemory
+from provider_codecs import SamplingParams
+
+MODEL = "anthropic.claude-3-haiku-20240307-v1:0"
+
+
+def words(text):
+    return len(text.split())
+
+
+class StubSummarizer:
+    """Joins the evicted user messages onto the summary, optionally blocking until released"""
+
+    def __init__(self, block=False):
+        self.calls = []
+        self.release = threading.Event()
+        if not block:
+            self.release.set()
+
+    def __call__(self, summary, turns):
+        self.release.wait(5)
+        self.calls.append(list(turns))
+        return " ".join([summary] + [user for user, _ in turns]).strip()
+
+
+def memory(summarizer=None, window_tokens=10, **kwargs):
+    return ConversationMemory(MODEL, window_tokens=window_tokens, summarizer=summarizer,
+                              estimate=words, **kwargs)
+
+
+def test_window_keeps_the_latest_turns():
+    conversation = memory()
+    for i in range(4):
+        # Four words per turn, so the window holds two
+        conversation.add_turn(f"question {i}", f"answer {i}")
+
+    assert conversation.messages("next") == [
+        {"role": "user", "content": "question 2"},
+        {"role": "assistant", "content": "answer 2"},
+        {"role": "user", "content": "question 3"},
+        {"role": "assistant", "content": "answer 3"},
+        {"role": "user", "content": "next"},
+    ]
+    stats = conversation.stats()
+    assert stats['window_turns'] == 2 and stats['window_tokens'] == 8
+    assert stats['evicted_turns'] == 2
+    assert conversation.system_prompt() == ''
+
+
+def test_evicted_turns_are_folded_into_the_summary():
+    summarizer = StubSummarizer()
+    conversation = memory(summarizer)
+    for i in range(4):
+        conversation.add_turn(f"question{i} text", f"answer {i}")
+    conversation.wait(5)
+
+    assert [turn for call in summarizer.calls for turn in call] == [
+        ("question0 text", "answer 0"), ("question1 text", "answer 1"),
+    ]
+    assert conversation.summary == "question0 text question1 text"
+    assert conversation.system_prompt() == SUMMARY_PREFIX + conversation.summary
+    body = json.loads(conversation.build_body("next", SamplingParams(max_tokens=10)))
+    assert body['system'] == conversation.system_prompt()
+    assert conversation.stats()['summaries'] == len(summarizer.calls)
+    conversation.close()
+
+
+def test_summary_is_cut_to_its_token_limit():
+    conversation = memory(lambda summary, turns: "word " * 100, summary_max_tokens=5)
+    for i in range(3):
+        conversation.add_turn(f"question {i}", f"answer {i}")
+    conversation.wait(5)
+
+    assert len(conversation.summary) <= 20
+    conversation.close()
+
+
+def test_failed_summary_drops_the_turns():
+    def fail(summary, turns):
+        raise RuntimeError("summarizer down")
+
+    conversation = memory(fail)
+    for i in range(3):
+        conversation.add_turn(f"question {i}", f"answer {i}")
+    conversation.wait(5)
+
+    assert isinstance(conversation.last_error, RuntimeError)
+    assert conversation.summary == '' and conversation.stats()['summaries'] == 0
+    conversation.close()
+
+
+def test_close_stops_summarizing():
+    summarizer = StubSummarizer(block=True)
+    conversation = memory(summarizer)
+    for i in range(3):
+        conversation.add_turn(f"question {i}", f"answer {i}")
+
+    conversation.close()
+    conversation.add_turn("question 3", "answer 3")
+    summarizer.release.set()
+    conversation.wait(5)
+
+    assert len(summarizer.calls) == 1
+    assert conversation.stats()['evicted_turns'] == 2
+
+
+def test_stats_read_by_the_chat_loop():
+    conversation = memory()
+    conversation.add_turn("question 0", "answer 0", prompt_tokens=10, input_tokens=12,
+                          output_tokens=3, seconds=0.5)
+    conversation.add_turn("question 1", "answer 1", prompt_tokens=20, seconds=1.5)
+
+    stats = conversation.stats()
+
+    assert stats['turns'] == 2
+    assert stats['mean_prompt_tokens'] == 15
+    assert stats['mean_input_tokens'] == 12
+    assert stats['mean_seconds'] == 1.0
+    assert stats['summary_tokens'] == 0
+    assert conversation.turn_stats[-1] == {
+        'turn': 2, 'prompt_tokens': 20, 'input_tokens': None, 'output_tokens': None,
+        'seconds': 1.5, 'window_turns': 2,
+    }
@@ -0,0 +1,89 @@
+import time
+
+import pytest
+
+from deadlines import DeadlineExceeded, HedgedInvoker, deadline_after
+from response_cache import ResponseCache
+
+
+def sleeper(seconds, result):
+    def call():
+        time.sleep(seconds)
+        return result
+    return call
+
+
+def fail():
+    raise ValueError("primary failed")
+
+
+@pytest.fixture
+def invoker():
+    invoker = HedgedInvoker(max_workers=4, fallback_lead_seconds=0.3)
+    yield invoker
+    invoker.shutdown()
+
+
+def test_losers_are_recorded_when_they_finish(invoker):
+    outcome = {}
+
+    result = invoker.call('primary', sleeper(0.4, 'slow'), deadline=deadline_after(0.35),
+                          fallback=('fallback', sleeper(0.0, 'fast')), outcome=outcome)
+
+    assert result == 'fast'
+    assert outcome == {'role': 'fallback', 'key': 'fallback'}
+    assert len(invoker.tracker('primary')) == 0
+    time.sleep(0.5)
+    assert len(invoker.tracker('primary')) == 1
+    assert invoker.tracker('primary').percentile(95) >= 0.4
+
+
+def test_deadline_records_a_censored_sample_once(invoker):
+    with pytest.raises(DeadlineExceeded):
+        invoker.call('primary', sleeper(0.5, 'late'), deadline=deadline_after(0.1))
+
+    tracker = invoker.tracker('primary')
+    assert len(tracker) == 1
+    assert tracker.percentile(95) >= 0.1
+    time.sleep(0.6)
+    assert len(tracker) == 1
+
+
+def test_fallback_runs_when_the_primary_fails(invoker):
+    outcome = {}
+
+    result = invoker.call('primary', fail, deadline=deadline_after(10),
+                          fallback=('fallback', sleeper(0.0, 'fallback answer')), outcome=outcome)
+
+    assert result == 'fallback answer'
+    assert outcome['role'] == 'fallback'
+    assert invoker.stats()['fallbacks'] == 1
+
+
+def test_first_error_is_raised_when_every_call_fails(invoker):
+    def fallback_fails():
+        raise KeyError("fallback failed")
+
+    with pytest.raises(ValueError):
+        invoker.call('primary', fail, deadline=deadline_after(10), fallback=('fallback', fallback_fails))
+    with pytest.raises(ValueError):
+        invoker.call('primary', fail)
+
+
+def test_fallback_answer_is_not_cached_as_the_primary(invoker):
+    cache = ResponseCache()
+    body = '{"prompt": "hello", "temperature": 0}'
+
+    def generate(primary):
+        outcome = {}
+        return cache.get_or_generate(
+            'primary', body,
+            lambda: invoker.call('primary', primary, deadline=deadline_after(10),
+                                 fallback=('fallback', sleeper(0.0, 'fallback answer')), outcome=outcome),
+            lambda: outcome.get('role') != 'fallback'
+        )
+
+    assert generate(fail) == 'fallback answer'
+    assert cache.stats()['entries'] == 0
+    assert generate(sleeper(0.0, 'primary answer')) == 'primary answer'
+    assert generate(fail) == 'primary answer'
@@ -0,0 +1,38 @@
+import time
+
+from embedding_cache import EmbeddingCache
+
+MODEL = "amazon.titan-embed-text-v1"
+
+
+def stored_bytes(cache):
+    return cache.stats()['bytes']
+
+
+def test_running_total_tracks_inserts_and_replacements():
+    cache = EmbeddingCache(":memory:", max_bytes=10_000)
+    cache.put_many(MODEL, ["a", "b"], [[0.0] * 4, [1.0] * 4])
+    cache.put_many(MODEL, ["a", "c", "c"], [[2.0] * 8, [3.0] * 4, [3.0] * 4])
+
+    assert cache._bytes == stored_bytes(cache) == (8 + 4 + 4) * 4
+    assert cache.get_many(MODEL, ["a"])[0] == [2.0] * 8
+
+
+def test_eviction_drops_least_recently_used_rows():
+    cache = EmbeddingCache(":memory:", max_bytes=3 * 16)
+    for i, text in enumerate(["a", "b", "c"]):
+        cache.put_many(MODEL, [text], [[float(i)] * 4])
+        time.sleep(0.01)
+    cache.get_many(MODEL, ["a"])
+    cache.put_many(MODEL, ["d"], [[9.0] * 4])
+
+    assert cache.evictions == 1
+    assert cache._bytes == stored_bytes(cache) <= cache.max_bytes
+    assert sorted(cache.get_many(MODEL, ["a", "b", "c", "d"])) == [0, 2, 3]
+
+
+def test_total_is_read_when_the_file_is_reopened(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    EmbeddingCache(path).put_many(MODEL, ["a", "b"], [[1.0] * 4, [2.0] * 4])
+
+    assert EmbeddingCache(path)._bytes == 32
@@ -0,0 +1,104 @@
+import io
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import rate_limiter
+from embedding_engine import EmbeddingEngine, EmbeddingError
+
+
+class StubEmbeddingClient:
+    """Embeds "text N" as [N] after `latency(N)` seconds, failing the first `failures[N]` calls"""
+
+    def __init__(self, latency=lambda n: 0.0, failures=None):
+        self.latency = latency
+        self.failures = dict(failures or {})
+        self.calls = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def invoke_model(self, modelId, body, **kwargs):
+        n = int(json.loads(body)['inputText'].split()[1])
+        with self._lock:
+            self.calls[n] = self.calls.get(n, 0) + 1
+            failing = self.failures.get(n, 0) >= self.calls[n]
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.latency(n))
+            if failing:
+                raise ConnectionError(f"text {n} failed")
+            return {'body': io.BytesIO(json.dumps({'embedding': [float(n)]}).encode())}
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+@pytest.fixture(autouse=True)
+def no_rate_limit(monkeypatch):
+    monkeypatch.setattr(rate_limiter, 'RATE_LIMIT_ENABLED', False)
+
+
+def texts(count):
+    return [f"text {n}" for n in range(count)]
+
+
+def test_output_keeps_input_order_under_concurrency():
+    # Earlier texts take longer, so they finish last
+    client = StubEmbeddingClient(latency=lambda n: 0.01 * (20 - n))
+    engine = EmbeddingEngine(client, 'model', max_workers=8, chunk_size=5)
+
+    assert engine.embed(texts(20)) == [[float(n)] for n in range(20)]
+    engine.shutdown()
+
+
+def test_only_failed_items_are_retried():
+    client = StubEmbeddingClient(failures={3: 1, 7: 2})
+    engine = EmbeddingEngine(client, 'model', max_workers=4, retry_backoff=0.0)
+    stats = {}
+
+    assert engine.embed(texts(10), stats=stats) == [[float(n)] for n in range(10)]
+    assert client.calls == {n: {3: 2, 7: 3}.get(n, 1) for n in range(10)}
+    assert stats['retries'] == 3 and stats['failed'] == 0
+    engine.shutdown()
+
+
+def test_items_failing_every_retry_are_reported():
+    client = StubEmbeddingClient(failures={2: 10})
+    engine = EmbeddingEngine(client, 'model', max_workers=4, max_retries=2, retry_backoff=0.0)
+    stats = {}
+
+    with pytest.raises(EmbeddingError) as raised:
+        engine.embed(texts(5), stats=stats)
+    assert list(raised.value.failures) == [2]
+    assert client.calls[2] == 3
+    assert stats['embedded'] == 4 and stats['failed'] == 1
+    engine.shutdown()
+
+
+def test_in_flight_requests_stay_within_max_workers():
+    client = StubEmbeddingClient(latency=lambda n: 0.02)
+    engine = EmbeddingEngine(client, 'model', max_workers=3, chunk_size=64)
+
+    engine.embed(texts(30))
+
+    assert client.max_in_flight == 3
+    engine.shutdown()
+
+
+def test_concurrent_calls_get_their_own_stats():
+    client = StubEmbeddingClient(latency=lambda n: 0.01)
+    engine = EmbeddingEngine(client, 'model', max_workers=4)
+
+    def embed(count):
+        stats = {}
+        engine.embed(texts(count), stats=stats)
+        return stats['texts']
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        assert list(executor.map(embed, [2, 5, 9])) == [2, 5, 9]
+    engine.shutdown()
@@ -0,0 +1,74 @@
+import os
+import random
+
+import pytest
+
+import ingest
+import rag_system
+from bedrock_clients import clear_clients, register_client
+from fake_bedrock import FakeBedrock
+from ingest import chunk_stream
+
+
+def random_text(rng):
+    words = ["".join(rng.choice("abcdefgh") for _ in range(rng.randint(1, 9)))
+             for _ in range(rng.randint(1, 400))]
+    return words, " ".join(words)
+
+
+def random_blocks(rng, text):
+    blocks = []
+    position = 0
+    while position < len(text):
+        step = rng.randint(1, 300)
+        blocks.append(text[position:position + step])
+        position += step
+    return blocks
+
+
+@pytest.mark.parametrize("chunk_size, overlap", [(100, 30), (1000, 200), (100, 0), (50, 49)])
+def test_every_word_lands_in_a_chunk(chunk_size, overlap):
+    rng = random.Random(chunk_size * 1000 + overlap)
+    for _ in range(500):
+        words, text = random_text(rng)
+        chunks = list(chunk_stream(random_blocks(rng, text), chunk_size, overlap))
+
+        assert all(len(chunk) <= chunk_size for chunk in chunks)
+        found = {word for chunk in chunks for word in chunk.split()}
+        assert set(words) <= found
+        # The last word of the input always ends the last chunk
+        assert chunks[-1].split()[-1] == words[-1]
+
+
+def test_tail_that_is_only_overlap_is_not_repeated():
+    chunks = list(chunk_stream(["aaaa bbbb cccc dddd"], chunk_size=10, overlap=4))
+    assert chunks == ["aaaa bbbb", "bbbb cccc", "cccc dddd"]
+
+
+def test_short_text_is_one_chunk():
+    assert list(chunk_stream(["  hello world  "], chunk_size=100, overlap=10)) == ["hello world"]
+    assert list(chunk_stream(["   "], chunk_size=100, overlap=10)) == []
+
+
+def test_overlap_must_be_smaller_than_chunk_size():
+    with pytest.raises(ValueError):
+        list(chunk_stream(["text"], chunk_size=10, overlap=10))
+
+
+def test_shard_writers_get_their_own_embedding_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(rag_system, 'EMBEDDING_CACHE_PATH', str(tmp_path / "cache" / "embeddings.sqlite3"))
+    register_client('bedrock-runtime', FakeBedrock(), region_name='us-east-1')
+    paths = []
+    try:
+        for shard in range(2):
+            ingest._open_shard(str(tmp_path / "store"), "docs", shard, 2, "numpy")
+            ingest._write_shard([f"chunk for shard {shard}"], [{'source': 'test'}])
+            paths.append(ingest._shard_system.embedding_cache_path)
+            assert ingest._shard_system.embedding_cache.stats()['entries'] == 1
+    finally:
+        clear_clients()
+        monkeypatch.setattr(ingest, '_shard_system', None)
+
+    assert [os.path.basename(path) for path in paths] == [
+        "embeddings_shard0of2.sqlite3", "embeddings_shard1of2.sqlite3",
+    ]
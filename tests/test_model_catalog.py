@@ -0,0 +1,36 @@
+from fake_bedrock import FakeBedrock
+from model_catalog import ModelCatalog
+
+
+class CountingClient(FakeBedrock):
+    def __init__(self):
+        super().__init__()
+        self.listings = 0
+
+    def list_foundation_models(self, **kwargs):
+        self.listings += 1
+        return super().list_foundation_models(**kwargs)
+
+
+def test_each_region_has_its_own_cache_file(tmp_path):
+    path = str(tmp_path / "models_{region}.json")
+    client = CountingClient()
+
+    east = ModelCatalog(client, path=path, region_name="us-east-1").load()
+    west = ModelCatalog(client, path=path, region_name="us-west-2").load()
+
+    assert east.path != west.path
+    assert client.listings == 2
+    ModelCatalog(client, path=path, region_name="us-east-1").load()
+    assert client.listings == 2
+
+
+def test_cache_of_another_region_is_not_served(tmp_path):
+    path = str(tmp_path / "models.json")
+    client = CountingClient()
+
+    ModelCatalog(client, path=path, region_name="us-east-1").load()
+    catalog = ModelCatalog(client, path=path, region_name="eu-west-1").load()
+
+    assert client.listings == 2
+    assert catalog.models()
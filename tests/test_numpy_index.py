@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+from numpy_index import NumpyClient, NumpyCollection, matches
+
+
+def make_collection(quantization=None, directory=None):
+    collection = NumpyCollection("test", directory=directory, quantization=quantization)
+    vectors = np.eye(6, dtype=np.float32) + 0.1
+    collection.add(
+        ids=[f"doc{i}" for i in range(6)],
+        documents=[f"text {i}" for i in range(6)],
+        metadatas=[{'source': 'a' if i % 2 else 'b', 'page': i} for i in range(6)],
+        embeddings=vectors
+    )
+    return collection, vectors
+
+
+@pytest.mark.parametrize("where, expected", [
+    ({'source': 'a'}, True),
+    ({'source': {'$ne': 'a'}}, False),
+    ({'page': {'$gte': 3}}, True),
+    ({'page': {'$in': [1, 2]}}, False),
+    ({'$and': [{'source': 'a'}, {'page': {'$lt': 4}}]}, True),
+    ({'$or': [{'source': 'b'}, {'page': 1}]}, False),
+    ({'missing': {'$ne': 1}}, False),
+    ({'page': {'$gt': 'x'}}, False),
+])
+def test_matches(where, expected):
+    assert matches({'source': 'a', 'page': 3}, where) is expected
+
+
+def test_unsupported_operator():
+    with pytest.raises(ValueError):
+        matches({'page': 1}, {'page': {'$regex': '.*'}})
+    with pytest.raises(ValueError):
+        make_collection()[0].query(query_embeddings=[[1, 0, 0, 0, 0, 0]], where={'$not': {}})
+
+
+@pytest.mark.parametrize("quantization", [None, "int8"])
+def test_query_where_searches_matching_rows(quantization):
+    collection, vectors = make_collection(quantization)
+
+    result = collection.query(query_embeddings=vectors[:1], n_results=2, where={'source': 'a'},
+                              include=['metadatas', 'distances', 'embeddings'])
+
+    assert result['ids'][0][0] in {'doc1', 'doc3', 'doc5'}
+    assert all(metadata['source'] == 'a' for metadata in result['metadatas'][0])
+    assert result['distances'][0] == sorted(result['distances'][0])
+    assert len(result['embeddings'][0]) == 2
+    empty = collection.query(query_embeddings=vectors[:1], n_results=2, where={'source': 'c'})
+    assert empty['ids'] == [[]]
+
+
+def test_upsert_copies_rows_that_queries_may_hold():
+    collection, vectors = make_collection()
+    matrix, documents = collection._matrix, collection._documents
+
+    collection.upsert(ids=['doc0'], documents=['replaced'], embeddings=vectors[5:6])
+
+    assert collection._matrix is not matrix and collection._documents is not documents
+    assert documents[0] == 'text 0'
+    assert np.allclose(matrix[0], vectors[0] / np.linalg.norm(vectors[0]))
+    assert collection.get(ids=['doc0'])['documents'] == ['replaced']
+
+
+def test_flush_persists_and_reloads(tmp_path):
+    client = NumpyClient(str(tmp_path))
+    collection = client.get_or_create_collection("test")
+    collection.add(ids=['a', 'b'], documents=['x', 'y'], metadatas=[{'n': 1}, {'n': 2}],
+                   embeddings=[[1.0, 0.0], [0.0, 1.0]])
+    client.flush()
+
+    reloaded = NumpyClient(str(tmp_path)).get_or_create_collection("test")
+    assert reloaded.count() == 2
+    assert reloaded.query(query_embeddings=[[0.0, 1.0]], n_results=1, where={'n': 2})['ids'] == [['b']]
+
+
+@pytest.mark.parametrize("quantization", [None, "int8"])
+def test_appends_after_flush_do_not_copy_the_matrix(tmp_path, quantization):
+    collection = NumpyCollection("test", directory=str(tmp_path), quantization=quantization)
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(30, 8)).astype(np.float32)
+    collection.add(ids=[f"doc{i}" for i in range(10)], embeddings=vectors[:10])
+    collection.flush()
+    matrix = collection._matrix
+
+    for start in (10, 20):
+        collection.add(ids=[f"doc{i}" for i in range(start, start + 10)],
+                       embeddings=vectors[start:start + 10])
+        collection.flush()
+        assert collection._matrix is matrix
+
+    reloaded = NumpyCollection("test", directory=str(tmp_path), quantization=quantization)
+    assert reloaded.count() == 30
+    assert reloaded.query(query_embeddings=vectors[25:26], n_results=1)['ids'] == [['doc25']]
+    assert collection.query(query_embeddings=vectors[25:26], n_results=1)['ids'] == [['doc25']]
+    if quantization:
+        # Only the int8 codes are resident
+        assert collection.memory_usage()['bytes_per_vector'] == 8
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from numpy_index import NumpyCollection, normalize_rows
+from quantization import Int8Quantizer, evaluate, recall_at_k
+
+# Recall@10 floors of int8 search on clustered, embedding-like data
+RECALL_FLOOR = 0.90
+RERANKED_RECALL_FLOOR = 0.99
+
+
+@pytest.fixture(scope="module")
+def data():
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(40, 256))
+    vectors = centers[rng.integers(0, 40, 5000)] + 0.5 * rng.normal(size=(5000, 256))
+    queries = centers[rng.integers(0, 40, 100)] + 0.5 * rng.normal(size=(100, 256))
+    return normalize_rows(vectors), normalize_rows(queries)
+
+
+def test_round_trip_error_is_within_half_a_step(data):
+    vectors, _ = data
+    quantizer = Int8Quantizer().fit(vectors)
+    codes = quantizer.encode(vectors)
+
+    assert codes.dtype == np.int8
+    assert np.all(np.abs(quantizer.decode(codes) - vectors) <= quantizer.scale / 2 + 1e-6)
+
+
+def test_recall_floor(data):
+    vectors, queries = data
+    quality = evaluate(vectors, queries, k=10, rerank_factor=4)
+
+    assert quality['int8_bytes_per_vector'] * 4 == quality['float32_bytes_per_vector']
+    assert quality['recall_at_k'] >= RECALL_FLOOR
+    assert quality['recall_at_k_reranked'] >= RERANKED_RECALL_FLOOR
+
+
+def test_quantized_collection_recall_floor(data, tmp_path):
+    vectors, queries = data
+    ids = [str(i) for i in range(len(vectors))]
+    exact = NumpyCollection("exact")
+    # Persisted, so the float32 rows are memory-mapped and only the codes stay resident
+    quantized = NumpyCollection("int8", directory=str(tmp_path), quantization="int8")
+    for collection in (exact, quantized):
+        collection.add(ids=ids, embeddings=vectors)
+    quantized.flush()
+
+    expected = exact.query(query_embeddings=queries, n_results=10, include=[])['ids']
+    found = quantized.query(query_embeddings=queries, n_results=10, include=[])['ids']
+
+    to_indices = lambda rows: [np.array([int(i) for i in row]) for row in rows]
+    assert recall_at_k(to_indices(expected), to_indices(found)) >= RERANKED_RECALL_FLOOR
+    assert quantized.memory_usage()['bytes_per_vector'] * 4 == exact.memory_usage()['bytes_per_vector']
@@ -0,0 +1,36 @@
+import pytest
+
+from fake_bedrock import FakeBedrock
+from rag_system import RAGSystem
+
+
+@pytest.fixture
+def system():
+    system = RAGSystem(bedrock_client=FakeBedrock(), embedding_cache_path=None, load_samples=False,
+                       collection_name="test_rag_system", vector_backend="numpy")
+    system.add_documents(["Bedrock hosts foundation models.", "RAG retrieves context first."])
+    return system
+
+
+def test_streamed_answer_is_reused_by_the_semantic_cache(system):
+    details = {}
+    streamed = "".join(system.rag_generate_stream("What is RAG?", details=details))
+
+    assert streamed and details['cached'] is False and len(details['documents']) == 2
+    answer = system.rag_answer("What is RAG?")
+    assert answer['cached'] is True and answer['answer'] == streamed
+    assert answer['cached_query'] == "What is RAG?"
+
+
+def test_empty_streamed_answer_is_not_cached(system, monkeypatch):
+    monkeypatch.setattr(system, 'generate_text_stream', lambda prompt, deadline=None: iter(()))
+
+    assert list(system.rag_generate_stream("What is RAG?")) == []
+    assert system.semantic_cache.stats()['entries'] == 0
+
+
+def test_remove_documents_by_id(system):
+    ids = system.collection.get()['ids']
+
+    assert system.remove_documents(ids=ids[:1]) == 1
+    assert system.collection.count() == 1
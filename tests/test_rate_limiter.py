@@ -0,0 +1,114 @@
+import json
+import time
+
+import pytest
+from botocore.exceptions import ClientError
+
+import rate_limiter
+from bedrock_streaming import stream_text
+from rate_limiter import AIMDConcurrency, ModelLimiter, RateLimitTimeout, TokenBucket
+
+
+def throttle(code='ThrottlingException'):
+    return ClientError({'Error': {'Code': code, 'Message': 'Rate exceeded'}}, 'InvokeModel')
+
+
+def test_token_bucket_waits_for_debt():
+    bucket = TokenBucket(per_minute=60, burst_seconds=2)
+    assert bucket.capacity == 2
+    assert bucket.reserve(2) == 0.0
+    assert bucket.reserve(1) == pytest.approx(1.0, abs=0.05)
+    bucket.refund(3)
+    assert bucket.reserve(1) == 0.0
+
+
+def test_aimd_increases_additively_and_decreases_once_per_window():
+    concurrency = AIMDConcurrency(initial=4, maximum=8)
+    concurrency.release(concurrency.acquire(), throttled=False)
+    assert concurrency.limit == pytest.approx(4.25)
+
+    first, second = concurrency.acquire(), concurrency.acquire()
+    concurrency.release(first, throttled=True)
+    assert concurrency.limit == pytest.approx(2.125)
+    # Sent before the cut: the same congestion signal
+    concurrency.release(second, throttled=True)
+    assert concurrency.limit == pytest.approx(2.125)
+
+    concurrency.release(concurrency.acquire(), throttled=True)
+    assert concurrency.limit == pytest.approx(1.0625)
+    concurrency.release(concurrency.acquire(), throttled=True)
+    assert concurrency.limit == 1
+    assert concurrency.in_flight == 0
+
+
+def test_aimd_acquire_times_out():
+    concurrency = AIMDConcurrency(initial=1)
+    concurrency.acquire()
+    assert concurrency.acquire(deadline=time.monotonic() + 0.01) is None
+
+
+def test_limiter_retries_throttles_and_cuts_concurrency():
+    limiter = ModelLimiter('model', initial_concurrency=8, sleep=lambda seconds: None)
+    failures = [throttle(), throttle('TooManyRequestsException')]
+
+    def send():
+        if failures:
+            raise failures.pop(0)
+        return 'ok'
+
+    assert limiter.call(send) == 'ok'
+    assert limiter.stats()['throttles'] == 2
+    assert limiter.concurrency.limit < 8
+
+
+def test_limiter_gives_up_at_the_deadline():
+    limiter = ModelLimiter('model', requests_per_minute=60, sleep=lambda seconds: None)
+    for _ in range(int(limiter.requests.capacity)):
+        limiter.requests.reserve(1)
+    with pytest.raises(RateLimitTimeout):
+        limiter.call(lambda: 'ok', deadline=time.monotonic() + 0.1)
+
+
+class ThrottledStreamClient:
+    """Streams whose first event throttles until `throttles` runs out"""
+
+    def __init__(self, throttles):
+        self.throttles = throttles
+        self.calls = 0
+
+    def invoke_model_with_response_stream(self, **kwargs):
+        self.calls += 1
+        throttled = self.calls <= self.throttles
+
+        def events():
+            if throttled:
+                raise throttle('throttlingException')
+            yield {'chunk': {'bytes': json.dumps({'outputText': 'hello'}).encode()}}
+
+        return {'body': events()}
+
+
+def test_stream_open_goes_through_the_limiter(monkeypatch):
+    limiter = ModelLimiter('amazon.titan-text-express-v1', initial_concurrency=4,
+                           sleep=lambda seconds: None)
+    monkeypatch.setattr(rate_limiter, 'RATE_LIMIT_ENABLED', True)
+    monkeypatch.setitem(rate_limiter._limiters, limiter.model_id, limiter)
+    client = ThrottledStreamClient(throttles=1)
+
+    chunks = list(stream_text(client, limiter.model_id, json.dumps({'inputText': 'hi'})))
+
+    assert chunks == ['hello']
+    assert client.calls == 2
+    assert limiter.stats()['throttles'] == 1
+    assert limiter.concurrency.limit == pytest.approx(2.5)
+    assert limiter.concurrency.in_flight == 0
+
+
+def test_fake_reports_the_tokens_the_limiter_reserves():
+    from fake_bedrock import FakeBedrock
+
+    text = "hello"
+    response = FakeBedrock().invoke_model(modelId='amazon.titan-embed-text-v1',
+                                          body=json.dumps({'inputText': text}))
+
+    assert json.loads(response['body'].read())['inputTextTokenCount'] == rate_limiter.estimate_tokens(text)
@@ -0,0 +1,63 @@
+import json
+
+import rag_system
+from main import build_request_body
+from provider_codecs import SamplingParams
+from rag_system import TEXT_GENERATION_MODEL, build_generation_body
+from response_cache import ResponseCache
+
+
+def generator(answers):
+    calls = []
+
+    def generate():
+        calls.append(1)
+        return answers[len(calls) - 1]
+
+    return generate, calls
+
+
+def test_rag_generation_is_sampled_by_default():
+    cache = ResponseCache()
+    body = build_generation_body("Context: ...\n\nQuestion: What is RAG?")
+    generate, calls = generator(["first", "second"])
+
+    cache.get_or_generate(TEXT_GENERATION_MODEL, body, generate)
+    assert cache.get_or_generate(TEXT_GENERATION_MODEL, body, generate) == "second"
+    assert cache.stats()['bypasses'] == 2
+
+
+def test_greedy_rag_generation_is_cached(monkeypatch):
+    monkeypatch.setattr(rag_system, 'GENERATION_SAMPLING',
+                        SamplingParams(max_tokens=500, temperature=0.0, top_p=0.9))
+    cache = ResponseCache()
+    body = build_generation_body("Context: ...\n\nQuestion: What is RAG?")
+    generate, calls = generator(["first", "second"])
+
+    assert cache.get_or_generate(TEXT_GENERATION_MODEL, body, generate) == "first"
+    assert cache.get_or_generate(TEXT_GENERATION_MODEL, body, generate) == "first"
+    assert len(calls) == 1
+    assert cache.stats()['bypasses'] == 0
+
+
+def test_sampled_chat_bypasses_the_cache_unless_enabled():
+    body = build_request_body(TEXT_GENERATION_MODEL, "Hello")
+    generate, calls = generator(["first", "second", "third"])
+
+    cache = ResponseCache()
+    cache.get_or_generate(TEXT_GENERATION_MODEL, body, generate)
+    assert cache.get_or_generate(TEXT_GENERATION_MODEL, body, generate) == "second"
+
+    cache = ResponseCache(cache_sampled=True)
+    cache.get_or_generate(TEXT_GENERATION_MODEL, body, generate)
+    assert cache.get_or_generate(TEXT_GENERATION_MODEL, body, generate) == "third"
+    assert len(calls) == 3
+
+
+def test_claude_chat_body_sends_no_sampling_fields():
+    body = json.loads(build_request_body(TEXT_GENERATION_MODEL, "Hello"))
+
+    assert body['max_tokens'] == 1000
+    assert 'temperature' not in body and 'top_p' not in body
+    titan = json.loads(build_request_body('amazon.titan-text-express-v1', "Hello"))
+    assert titan['textGenerationConfig']['temperature'] == 0.7
@@ -0,0 +1,83 @@
+import math
+
+import pytest
+
+from fake_bedrock import FakeBedrock
+from rag_system import RAGSystem
+from semantic_cache import SemanticCache
+
+
+def at_angle(cosine):
+    """Unit vector whose cosine similarity with [1, 0] is `cosine`"""
+    return [cosine, math.sqrt(1 - cosine ** 2)]
+
+
+def test_hit_and_miss_at_the_threshold():
+    cache = SemanticCache(threshold=0.9)
+    cache.store("what is rag", [1.0, 0.0], "answer", ["doc"], top_k=2)
+
+    hit = cache.lookup(at_angle(0.91), top_k=2)
+    assert hit['answer'] == "answer" and hit['query'] == "what is rag"
+    assert hit['similarity'] == pytest.approx(0.91, abs=1e-6)
+    assert cache.lookup(at_angle(0.89), top_k=2) is None
+    # Answers built from a different number of documents never match
+    assert cache.lookup([1.0, 0.0], top_k=3) is None
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 2
+
+
+def test_answers_started_before_an_invalidation_are_dropped():
+    cache = SemanticCache()
+    version = cache.version
+    cache.invalidate()
+
+    cache.store("q", [1.0, 0.0], "stale", [], top_k=2, version=version)
+
+    assert cache.stats()['entries'] == 0
+    assert cache.lookup([1.0, 0.0], top_k=2) is None
+
+
+def test_least_recently_used_answer_is_evicted():
+    cache = SemanticCache(max_entries=2)
+    cache.store("a", [1.0, 0.0, 0.0], "A", [], top_k=2)
+    cache.store("b", [0.0, 1.0, 0.0], "B", [], top_k=2)
+    assert cache.lookup([1.0, 0.0, 0.0], top_k=2)['answer'] == "A"
+
+    cache.store("c", [0.0, 0.0, 1.0], "C", [], top_k=2)
+
+    assert cache.lookup([0.0, 1.0, 0.0], top_k=2) is None
+    assert cache.lookup([1.0, 0.0, 0.0], top_k=2)['answer'] == "A"
+    assert cache.lookup([0.0, 0.0, 1.0], top_k=2)['answer'] == "C"
+    assert cache.stats()['evictions'] == 1 and cache.stats()['entries'] == 2
+
+
+@pytest.fixture
+def system():
+    system = RAGSystem(bedrock_client=FakeBedrock(), embedding_cache_path=None, load_samples=False,
+                       collection_name="test_semantic_cache", vector_backend="numpy")
+    system.add_documents(["Bedrock hosts foundation models.", "RAG retrieves context first."])
+    return system
+
+
+@pytest.mark.parametrize("change", [
+    lambda system: system.add_documents(["Embeddings are vectors."]),
+    lambda system: system.remove_documents(["Bedrock hosts foundation models."]),
+])
+def test_document_changes_invalidate_the_cache(system, change):
+    assert system.rag_answer("What is RAG?")['cached'] is False
+    assert system.rag_answer("What is RAG?")['cached'] is True
+    version = system.semantic_cache.version
+
+    change(system)
+
+    assert system.semantic_cache.version == version + 1
+    assert system.semantic_cache.stats()['invalidations'] == 1
+    assert system.rag_answer("What is RAG?")['cached'] is False
+
+
+def test_unchanged_documents_keep_the_cache(system):
+    system.rag_answer("What is RAG?")
+
+    system.add_documents(["RAG retrieves context first."])
+    system.remove_documents(["Not stored."])
+
+    assert system.rag_answer("What is RAG?")['cached'] is True
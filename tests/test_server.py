@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+from instrumentation import InMemoryCollector, MetricsInstrumentation, set_instrumentation
+from server import RAGServer, SingleFlight
+
+
+class CountingPipeline:
+    """Answers every query after a short delay, counting the calls"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def rag_generate(self, query, top_k=2):
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        return f"answer to {query}"
+
+
+@pytest.fixture
+def collector():
+    collector = InMemoryCollector()
+    previous = set_instrumentation(MetricsInstrumentation([collector]))
+    yield collector
+    set_instrumentation(previous)
+
+
+def test_single_flight_shares_one_call():
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return 'result'
+
+    async def run():
+        flights = SingleFlight()
+        first = flights.start('key', call())
+        assert 'key' in flights
+        results = await asyncio.gather(first, flights.join('key'), flights.join('key'))
+        return results, len(flights)
+
+    results, in_flight = asyncio.run(run())
+    assert results == ['result'] * 3
+    assert calls == [1]
+    assert in_flight == 0
+
+
+def test_single_flight_error_reaches_every_waiter():
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def run():
+        flights = SingleFlight()
+        return await asyncio.gather(flights.start('key', fail()), flights.join('key'),
+                                    return_exceptions=True)
+
+    assert [type(result) for result in asyncio.run(run())] == [ValueError, ValueError]
+
+
+def test_identical_queries_are_coalesced(collector):
+    pipeline = CountingPipeline()
+    server = RAGServer(pipeline, coalesce=True)
+
+    async def run():
+        return await asyncio.gather(*(
+            server.handle('POST', '/rag', b'{"query": "what  is RAG?"}') for _ in range(5)
+        ))
+
+    responses = asyncio.run(run())
+    assert pipeline.calls == 1
+    assert [status for status, _, _ in responses] == [200] * 5
+    assert sum(payload['coalesced'] for _, payload, _ in responses) == 4
+    assert collector.counter('server_coalesced_total', route='/rag') == 4
+
+
+def test_unknown_routes_share_one_label(collector):
+    server = RAGServer(CountingPipeline())
+
+    for path in ('/a', '/b?x=1', '/health'):
+        asyncio.run(server.handle('GET', path, b''))
+
+    assert collector.counter('server_requests_total', route='unknown') == 2
+    assert collector.counter('server_requests_total', route='/health') == 1
+    assert collector.counter('server_requests_total') == 3
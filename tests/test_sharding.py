@@ -0,0 +1,53 @@
+import numpy as np
+
+from numpy_index import NumpyClient, NumpyCollection
+from sharding import ShardedClient, shard_of
+
+
+def build(shards, vectors, ids):
+    client = ShardedClient([NumpyClient() for _ in range(shards)], max_workers=4)
+    collection = client.get_or_create_collection("docs")
+    collection.add(ids=ids, documents=[f"text of {doc_id}" for doc_id in ids], embeddings=vectors)
+    return collection
+
+
+def test_query_merges_shards_in_global_distance_order():
+    rng = np.random.default_rng(7)
+    vectors = rng.normal(size=(200, 16)).astype(np.float32)
+    queries = rng.normal(size=(5, 16)).astype(np.float32)
+    ids = [f"doc{i}" for i in range(200)]
+    single = NumpyCollection("docs")
+    single.add(ids=ids, embeddings=vectors)
+
+    sharded = build(4, vectors, ids)
+    expected = single.query(query_embeddings=queries, n_results=10, include=['distances'])
+    merged = sharded.query(query_embeddings=queries, n_results=10, include=['documents'])
+    with_distances = sharded.query(query_embeddings=queries, n_results=10)
+
+    assert merged['ids'] == expected['ids']
+    assert 'distances' not in merged
+    assert merged['documents'][0][0] == f"text of {merged['ids'][0][0]}"
+    for row in with_distances['distances']:
+        assert row == sorted(row)
+    assert np.allclose(with_distances['distances'], expected['distances'], atol=1e-6)
+
+
+def test_documents_are_routed_by_id():
+    ids = [f"doc{i}" for i in range(50)]
+    sharded = build(3, np.eye(50, dtype=np.float32), ids)
+
+    assert sharded.count() == 50
+    for shard, collection in enumerate(sharded.shards):
+        assert all(shard_of(doc_id, 3) == shard for doc_id in collection.get()['ids'])
+    assert sharded.get(ids=["doc7", "missing"])['ids'] == ["doc7"]
+    sharded.delete(ids=ids[:10])
+    assert sharded.count() == 40
+    assert sharded.stats()['queries'] == 0
+
+
+def test_fewer_results_than_requested():
+    sharded = build(4, np.eye(3, dtype=np.float32), ["a", "b", "c"])
+
+    result = sharded.query(query_embeddings=[[1.0, 0.0, 0.0]], n_results=10)
+
+    assert result['ids'][0][0] == "a" and sorted(result['ids'][0]) == ["a", "b", "c"]
@@ -0,0 +1,106 @@
+import json
+import time
+
+import pytest
+from botocore.exceptions import ClientError
+
+import bedrock_streaming
+import main
+from bedrock_clients import clear_clients, register_client
+from bedrock_streaming import stream_text
+from deadlines import DeadlineExceeded, HedgedInvoker, deadline_after
+from instrumentation import InMemoryCollector, MetricsInstrumentation, set_instrumentation
+
+PRIMARY = 'amazon.titan-text-express-v1'
+FALLBACK = 'amazon.titan-text-lite-v1'
+
+
+class SlowStreamClient:
+    """Streams `chunks` words, after a per-model delay before the first one"""
+
+    def __init__(self, first_byte, chunks=3, interval=0.0):
+        self.first_byte = first_byte
+        self.chunks = chunks
+        self.interval = interval
+        self.bodies = {}
+
+    def invoke_model_with_response_stream(self, modelId, body, **kwargs):
+        def events():
+            time.sleep(self.first_byte.get(modelId, 0.0))
+            for i in range(self.chunks):
+                if i:
+                    time.sleep(self.interval)
+                yield {'chunk': {'bytes': json.dumps({'outputText': f"{modelId}:{i} "}).encode()}}
+
+        self.bodies[modelId] = events()
+        return {'body': self.bodies[modelId]}
+
+
+@pytest.fixture
+def invoker(monkeypatch):
+    invoker = HedgedInvoker(max_workers=4, fallback_lead_seconds=0.3)
+    monkeypatch.setattr(bedrock_streaming, 'get_invoker', lambda: invoker)
+    yield invoker
+    invoker.shutdown()
+
+
+def test_fallback_wins_when_the_first_token_is_late(monkeypatch, invoker):
+    monkeypatch.setattr(bedrock_streaming, 'FIRST_TOKEN_DEADLINE_SECONDS', 0.5)
+    client = SlowStreamClient({PRIMARY: 1.0})
+
+    text = ''.join(stream_text(client, PRIMARY, '{}', deadline=deadline_after(5),
+                               fallback=(FALLBACK, '{}')))
+
+    assert text == f"{FALLBACK}:0 {FALLBACK}:1 {FALLBACK}:2 "
+    assert invoker.stats()['fallback_wins'] == 1
+    # The primary stream is closed once it opens
+    time.sleep(1.2)
+    assert client.bodies[PRIMARY].gi_frame is None
+
+
+def test_no_first_token_before_the_deadline(monkeypatch, invoker):
+    monkeypatch.setattr(bedrock_streaming, 'FIRST_TOKEN_DEADLINE_SECONDS', 0.2)
+    client = SlowStreamClient({PRIMARY: 1.0})
+
+    with pytest.raises(DeadlineExceeded):
+        list(stream_text(client, PRIMARY, '{}'))
+
+
+def test_stream_is_closed_at_the_deadline(invoker):
+    client = SlowStreamClient({}, chunks=10, interval=0.1)
+    chunks = []
+
+    with pytest.raises(DeadlineExceeded):
+        for chunk in stream_text(client, PRIMARY, '{}', deadline=deadline_after(0.25)):
+            chunks.append(chunk)
+
+    assert 1 <= len(chunks) < 10
+    assert client.bodies[PRIMARY].gi_frame is None
+
+
+def test_expired_deadline_sends_nothing(invoker):
+    client = SlowStreamClient({})
+
+    with pytest.raises(DeadlineExceeded):
+        list(stream_text(client, PRIMARY, '{}', deadline=time.monotonic() - 1))
+    assert client.bodies == {}
+
+
+class FailingStreamClient:
+    def invoke_model_with_response_stream(self, **kwargs):
+        raise ClientError({'Error': {'Code': 'ValidationException', 'Message': 'bad'}},
+                          'InvokeModelWithResponseStream')
+
+
+def test_chat_stream_errors_are_counted_on_the_chat_span(invoker):
+    collector = InMemoryCollector()
+    previous = set_instrumentation(MetricsInstrumentation([collector]))
+    register_client('bedrock-runtime', FailingStreamClient(), region_name='us-east-1')
+    try:
+        assert list(main.chat_with_bedrock_stream(PRIMARY, 'hello')) == []
+    finally:
+        clear_clients()
+        set_instrumentation(previous)
+
+    assert [span['name'] for span in collector.spans] == ['chat']
+    assert collector.counter('errors_total', span='chat', error='ClientError') == 1
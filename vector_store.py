@@ -0,0 +1,186 @@
+"""
+Chroma collection helpers
+Persistent collections with content-addressed document ids, so that
+re-ingesting a corpus only embeds documents that are new or changed
+"""
+
+import hashlib
+import os
+
+# Set CHROMA_PERSIST_DIR to keep the collection on disk between runs
+CHROMA_PERSIST_DIR = os.environ.get("CHROMA_PERSIST_DIR")
+COLLECTION_NAME = "bedrock_docs"
+
+# Retrieval backend: "chroma" or "numpy" (the in-process index in numpy_index)
+VECTOR_BACKEND = os.environ.get("VECTOR_BACKEND", "chroma")
+
+# Storage of the numpy backend: unset for float32, "int8" for quantized codes
+VECTOR_QUANTIZATION = os.environ.get("VECTOR_QUANTIZATION") or None
+
+# Number of collections the documents are partitioned across (see sharding)
+VECTOR_SHARDS = int(os.environ.get("VECTOR_SHARDS", "1"))
+
+
+def content_hash(text):
+    """Returns the SHA-256 hex digest of a document"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def document_id(text):
+    """Returns the content-addressed id of a document"""
+    return f"doc_{content_hash(text)[:32]}"
+
+
+def key_id(key):
+    """Returns the id of a document identified by a stable key"""
+    return f"key_{content_hash(str(key))[:32]}"
+
+
+def create_client(persist_directory=CHROMA_PERSIST_DIR, backend=None, shards=None):
+    """
+    Creates a vector store client
+
+    Args:
+        persist_directory: Directory for a persistent store (None for in-memory)
+        backend: "chroma" or "numpy" (defaults to VECTOR_BACKEND)
+        shards: Number of shards (defaults to VECTOR_SHARDS)
+
+    Returns:
+        A Chroma client, or a NumpyClient or ShardedClient with the same
+        collection API
+    """
+    backend = backend or VECTOR_BACKEND
+    shards = shards or VECTOR_SHARDS
+    if shards > 1:
+        from sharding import ShardedClient, shard_directory
+        return ShardedClient([
+            create_client(shard_directory(persist_directory, i, shards) if persist_directory else None,
+                          backend, shards=1)
+            for i in range(shards)
+        ])
+    if backend == "numpy":
+        from numpy_index import NumpyClient
+        return NumpyClient(persist_directory, quantization=VECTOR_QUANTIZATION)
+    if backend != "chroma":
+        raise ValueError(f"Unknown vector backend: {backend}")
+
+    # Imported here: chromadb is slow to import and most callers only need hashing
+    import chromadb
+
+    if persist_directory:
+        return chromadb.PersistentClient(path=persist_directory)
+    return chromadb.Client()
+
+
+def get_collection(client, embedding_function, name=COLLECTION_NAME, reset=False):
+    """
+    Opens (or creates) a collection
+
+    Args:
+        client: A Chroma client
+        embedding_function: Embedding function for the collection
+        name: Collection name
+        reset: Drop the existing collection first
+
+    Returns:
+        The Chroma collection
+    """
+    if reset:
+        try:
+            client.delete_collection(name=name)
+        except Exception:
+            pass
+    return client.get_or_create_collection(
+        name=name,
+        embedding_function=embedding_function
+    )
+
+
+def upsert_documents(collection, docs, keys=None, embeddings=None, metadatas=None):
+    """
+    Adds new or changed documents, skipping the ones already stored
+
+    Without `keys` every document is identified by its content hash, so an
+    unchanged document is skipped and an edited one is added as new. With
+    `keys` (e.g. file paths) the key identifies the document and its content
+    hash is compared to detect changes, which are upserted in place.
+
+    Args:
+        collection: The Chroma collection
+        docs: List of documents (strings)
+        keys: Optional list of stable document keys
+        embeddings: Optional precomputed embeddings matching `docs`
+        metadatas: Optional extra metadata dicts matching `docs`
+
+    Returns:
+        Tuple (number of documents written, number skipped)
+    """
+    hashes = [content_hash(doc) for doc in docs]
+    if keys is None:
+        ids = [f"doc_{digest[:32]}" for digest in hashes]
+    else:
+        ids = [key_id(key) for key in keys]
+
+    # Last occurrence of an id in the batch wins
+    batch = {}
+    for i, doc_id in enumerate(ids):
+        batch[doc_id] = i
+    if not batch:
+        return 0, 0
+
+    stored = collection.get(ids=list(batch), include=['metadatas'])
+    stored_hashes = {
+        doc_id: (metadata or {}).get('content_hash')
+        for doc_id, metadata in zip(stored['ids'], stored['metadatas'])
+    }
+
+    if keys is None:
+        # A content-addressed id that exists already holds this exact text
+        pending = [i for doc_id, i in batch.items() if doc_id not in stored_hashes]
+    else:
+        pending = [i for doc_id, i in batch.items() if stored_hashes.get(doc_id) != hashes[i]]
+    skipped = len(docs) - len(pending)
+    if not pending:
+        return 0, skipped
+
+    write = collection.upsert if keys is not None else collection.add
+    kwargs = {
+        'ids': [ids[i] for i in pending],
+        'documents': [docs[i] for i in pending],
+        'metadatas': [
+            {
+                **(metadatas[i] if metadatas is not None else {}),
+                'content_hash': hashes[i],
+                **({'key': str(keys[i])} if keys is not None else {}),
+            }
+            for i in pending
+        ],
+    }
+    if embeddings is not None:
+        kwargs['embeddings'] = [embeddings[i] for i in pending]
+    write(**kwargs)
+    return len(pending), skipped
+
+
+def delete_documents(collection, docs=None, ids=None, keys=None):
+    """
+    Deletes documents from the collection
+
+    Args:
+        collection: The Chroma collection
+        docs: Documents to delete, identified by content
+        ids: Document ids to delete
+        keys: Stable document keys (as passed to `upsert_documents`)
+
+    Returns:
+        Number of documents deleted
+    """
+    doomed = list(ids or [])
+    doomed += [document_id(doc) for doc in docs or []]
+    doomed += [key_id(key) for key in keys or []]
+    if not doomed:
+        return 0
+    existing = collection.get(ids=doomed, include=[])['ids']
+    if existing:
+        collection.delete(ids=existing)
+    return len(existing)